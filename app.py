@@ -9,22 +9,110 @@ from datetime import date, datetime
 import streamlit as st
 
 import data_manager
+import metrics
 import tutor
 
+# Due cards rendered per page, and the SM-2 quality each button records.
+FLASHCARDS_PER_PAGE = 12
+QUALITY_KNOWN = 4
+QUALITY_UNKNOWN = 1
+# Most recent chat sessions offered in the sidebar before "Show all".
+SIDEBAR_SESSIONS = 20
+# Chat histories (per session and data_version) kept by cached_session.
+CACHED_SESSIONS = 16
+
+
+# Streamlit reruns this script on every interaction. Storage reads below are
+# cached under data_manager.data_version(), which every write path bumps, so
+# a rerun that changes nothing parses no files.
+@st.cache_resource(show_spinner=False)
+def openai_client():
+    """OpenAI client shared by every session and rerun of this server."""
+    return tutor.get_client()
+
+
+@st.cache_resource(show_spinner=False)
+def tokenizer():
+    """Tokenizer shared by every session and rerun of this server."""
+    return data_manager.get_encoder()
+
+
+@st.cache_resource(show_spinner=False)
+def metrics_endpoint(port):
+    """Serve Prometheus metrics on port once per server process."""
+    return metrics.serve_prometheus(port)
+
+
+def bind_resources():
+    """Point tutor and data_manager at the cached client and tokenizer."""
+    tutor.set_client(openai_client())
+    data_manager.set_encoder(tokenizer())
+
+
+@st.cache_data(show_spinner=False)
+def cached_recent_sessions(version):
+    """recent_sessions() for a given sessions data_version."""
+    return data_manager.recent_sessions()
+
+
+@st.cache_data(show_spinner=False, max_entries=CACHED_SESSIONS)
+def cached_session(session_id, version):
+    """load_session() for a given sessions data_version."""
+    return data_manager.load_session(session_id)
+
+
+@st.cache_data(show_spinner=False)
+def cached_due_count(today, version):
+    """due_count() for a given day and vocab data_version."""
+    return data_manager.due_count()
+
+
+@st.cache_data(show_spinner=False)
+def cached_due_cards(limit, offset, today, version):
+    """due_cards() page for a given day and vocab data_version."""
+    return data_manager.due_cards(limit, offset=offset)
+
+
+def session_label(session_id, meta):
+    """Sidebar label for a session: its id, message count and token count."""
+    if not meta:
+        return session_id
+    tokens = meta.get("tokens")
+    tokens = "?" if tokens is None else f"{tokens:,}"
+    return f"{session_id} · {meta.get('messages', 0)} msgs · {tokens} tokens"
+
 
 def run_chat_tutor():
     """Render and manage the Chat Tutor mode."""
     st.title("Chat Tutor")
-    # Session selection/creation
-    sessions = data_manager.list_sessions()
-    session_option = ["New Session"] + sessions
-    session_key = st.sidebar.selectbox("Select session", session_option)
+    # Session selection/creation, most recently active first; the manifest
+    # holds everything shown here, so no message text is read.
+    sessions = cached_recent_sessions(data_manager.data_version("sessions"))
+    if len(sessions) > SIDEBAR_SESSIONS and not st.sidebar.checkbox(
+        f"Show all {len(sessions)} sessions", key="all_sessions"
+    ):
+        sessions = sessions[:SIDEBAR_SESSIONS]
+    manifest = dict(sessions)
+    session_option = ["New Session"] + list(manifest)
+    session_key = st.sidebar.selectbox(
+        "Select session", session_option,
+        format_func=lambda key: session_label(key, manifest.get(key)),
+    )
     if session_key == "New Session":
-        session_id = datetime.now().isoformat()
+        # One id per new session, kept across reruns, so they keep hitting
+        # the same cache entry.
+        if "new_session_id" not in st.session_state:
+            st.session_state["new_session_id"] = datetime.now().isoformat()
+        session_id = st.session_state["new_session_id"]
     else:
+        # Picking "New Session" again later starts a fresh one.
+        st.session_state.pop("new_session_id", None)
         session_id = session_key
+        meta = manifest.get(session_id) or {}
+        if meta.get("last_ts"):
+            st.sidebar.caption(f"Started {meta.get('first_ts') or '?'}, last message {meta['last_ts']}")
     # Load existing history
-    history = data_manager.load_session(session_id)
+    history = cached_session(session_id, data_manager.data_version("sessions"))
     # Display chat history
     for msg in history:
         if msg.get("role") == "user":
@@ -36,6 +124,17 @@ def run_chat_tutor():
     if st.button("Teach me 20 new words", key="teach"):
         new_entries = tutor.generate_new_batch(20)
         st.write(f"Added {len(new_entries)} new words.")
+        stats = tutor.last_batch_stats
+        if stats:
+            prefetched = f"{stats['prefetched']} prefetched, " if stats.get("prefetched") else ""
+            st.caption(
+                f"{prefetched}{stats['requests']} request(s), duplicate rate "
+                f"{stats['duplicate_rate']:.0%}, ~{stats['wasted_tokens']} wasted output tokens"
+            )
+    else:
+        # Generate the next batch in the background once it is nearly due,
+        # so the button only has to commit the staged words.
+        tutor.start_prefetch(20)
 
     if st.button("Take Quiz", key="quiz"):
         quiz = tutor.prepare_quiz(5)
@@ -56,36 +155,71 @@ def run_chat_tutor():
     # Chat input
     user_input = st.text_input("You:", key="chat_input")
     if st.button("Send", key="send") and user_input:
-        reply = tutor.chat_session_interact(session_id, user_input)
-        st.markdown(f"**Tutor:** {reply}")
+        placeholder = st.empty()
+        reply = ""
+        stream = tutor.chat_session_stream(session_id, user_input)
+        try:
+            for delta in stream:
+                reply += delta
+                placeholder.markdown(f"**Tutor:** {reply}")
+        finally:
+            # Streamlit aborts the script on rerun; closing the generator
+            # still persists the partial reply.
+            stream.close()
+
+
+def turn_flash_page(page):
+    """on_click for Previous/Next; Streamlit runs it before the rerun renders."""
+    data_manager.flush_vocab()
+    st.session_state["flash_page"] = page
+
+
+def grade_card(root, quality):
+    """on_click for Known/Unknown; reviews are batched and written on page change."""
+    data_manager.record_review(root, quality, defer=True)
 
 
 def run_flashcards():
-    """Render and manage the Flashcards mode."""
+    """Render and manage the Flashcards mode, one page of due cards at a time."""
     st.title("Flashcards")
-    vocab = data_manager.load_vocab()
-    if not vocab:
-        st.write("No vocabulary available. Generate new words in Chat Tutor.")
+    today = date.today().isoformat()
+    version = data_manager.data_version("vocab")
+    total = cached_due_count(today, version)
+    pages = max(1, -(-total // FLASHCARDS_PER_PAGE))
+    page = min(st.session_state.get("flash_page", 0), pages - 1)
+    cards = cached_due_cards(FLASHCARDS_PER_PAGE, page * FLASHCARDS_PER_PAGE, today, version)
+    if not cards:
+        data_manager.flush_vocab()
+        st.write("No cards are due. Generate new words in Chat Tutor or come back later.")
         return
 
     cols = st.columns(3)
-    for idx, entry in enumerate(vocab):
+    for idx, entry in enumerate(cards):
         col = cols[idx % 3]
-        col.subheader(f"{entry.get('root')} - {entry.get('english')}")
-        if col.button("Show Examples", key=f"show_{idx}"):
+        root = entry.get("root")
+        col.subheader(f"{root} - {entry.get('english')}")
+        if col.button("Show Examples", key=f"show_{root}"):
             col.write(entry.get("examples", {}))
-        if col.button("Known", key=f"known_{idx}"):
-            entry["known"] = True
-            entry["last_reviewed"] = date.today().isoformat()
-            data_manager.save_vocab(vocab)
-        if col.button("Unknown", key=f"unknown_{idx}"):
-            entry["known"] = False
-            entry["last_reviewed"] = date.today().isoformat()
-            data_manager.save_vocab(vocab)
+        # Grading and paging run as callbacks, ahead of the rerun a click
+        # triggers, so that rerun already shows their effect.
+        col.button("Known", key=f"known_{root}", on_click=grade_card, args=(root, QUALITY_KNOWN))
+        col.button("Unknown", key=f"unknown_{root}", on_click=grade_card, args=(root, QUALITY_UNKNOWN))
+
+    st.caption(f"Page {page + 1} of {pages} ({total} cards due)")
+    prev_col, next_col = st.columns(2)
+    prev_col.button(
+        "Previous", key="flash_prev", disabled=page == 0, on_click=turn_flash_page, args=(page - 1,)
+    )
+    next_col.button(
+        "Next", key="flash_next", disabled=page >= pages - 1, on_click=turn_flash_page, args=(page + 1,)
+    )
 
 
 def main():
     """Streamlit mode selector."""
+    bind_resources()
+    if metrics.ENABLED and metrics.PROMETHEUS_PORT:
+        metrics_endpoint(metrics.PROMETHEUS_PORT)
     st.sidebar.title("Mode")
     mode = st.sidebar.radio("Go to:", ["Chat Tutor", "Flashcards"])
     if mode == "Chat Tutor":
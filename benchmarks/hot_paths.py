@@ -0,0 +1,366 @@
+"""Micro-benchmarks for the data_manager and tutor hot paths.
+
+Every benchmark runs against synthetic data in a temporary directory (the
+real vocab.json etc. are never touched) and tutor talks to a stubbed OpenAI
+client, so results depend only on this code and the machine. Results are
+printed, and written as JSON with --json; --compare takes an earlier JSON
+file and shows the change per benchmark, so regressions between commits are
+visible.
+
+    python benchmarks/hot_paths.py                      # default sizes
+    python benchmarks/hot_paths.py --full --json after.json --compare before.json
+"""
+
+import argparse
+import json
+import platform
+import random
+import statistics
+import subprocess
+import sys
+import tempfile
+import time
+from contextlib import contextmanager
+from datetime import date, timedelta
+from pathlib import Path
+from types import SimpleNamespace
+
+ROOT = Path(__file__).resolve().parent.parent
+sys.path.insert(0, str(ROOT))
+
+import data_manager  # noqa: E402
+import llm_cache  # noqa: E402
+import tutor  # noqa: E402
+
+VOCAB_SIZES = [1_000, 10_000]
+SESSION_SIZES = [10, 1_000]
+MEMORY_YEARS = [1, 5]
+# --full adds the large end of each range.
+FULL_VOCAB_SIZES = [1_000, 10_000, 100_000, 1_000_000]
+FULL_SESSION_SIZES = [10, 1_000, 10_000, 100_000]
+FULL_MEMORY_YEARS = [1, 5, 20]
+
+SYLLABLES = ["ge", "hen", "sprech", "lern", "haus", "baum", "brot", "wass", "er", "ung", "keit", "lich"]
+
+
+def make_root(rng, index):
+    """A German-looking, unique root word."""
+    stem = "".join(rng.choice(SYLLABLES) for _ in range(3))
+    return f"{stem.capitalize()}{index}"
+
+
+def make_entry(rng, index, taught_on):
+    root = make_root(rng, index)
+    return {
+        "root": root,
+        "english": f"meaning of {root.lower()}",
+        "examples": {
+            "present": [f"Ich sehe {root}."],
+            "past": [f"Ich sah {root}."],
+            "future": [f"Ich werde {root} sehen."],
+        },
+        "taught_on": taught_on,
+        "batch_id": index // 20 + 1,
+        "last_reviewed": None,
+        "known": rng.random() < 0.3,
+        "due": taught_on,
+        "interval": 0,
+        "ease": data_manager.DEFAULT_EASE,
+        "reps": 0,
+    }
+
+
+def make_vocab(n, seed=0):
+    """n entries taught in batches of 20 every 3 days, the last a week ago."""
+    rng = random.Random(seed)
+    last = date.today() - timedelta(days=7)
+    batches = -(-n // 20)
+    return [
+        make_entry(rng, i, (last - timedelta(days=3 * (batches - 1 - i // 20))).isoformat())
+        for i in range(n)
+    ]
+
+
+def make_session(n, seed=0):
+    """n alternating user/assistant messages of 5-60 words."""
+    rng = random.Random(seed)
+    words = ["ich", "du", "lerne", "Deutsch", "heute", "gestern", "the", "word", "means", "and"]
+    messages = []
+    for i in range(n):
+        text = " ".join(rng.choice(words) for _ in range(rng.randint(5, 60)))
+        messages.append({"role": "user" if i % 2 == 0 else "assistant", "text": text,
+                         "tokens": len(text.split())})
+    return messages
+
+
+def make_memory(years, seed=0):
+    """One checkpoint per day for the given number of years."""
+    rng = random.Random(seed)
+    start = date.today() - timedelta(days=365 * years)
+    return {
+        (start + timedelta(days=i)).isoformat(): {
+            "summary": f"Practised {rng.randint(5, 40)} words",
+            "score": rng.randint(0, 100),
+        }
+        for i in range(365 * years)
+    }
+
+
+class WhitespaceEncoder:
+    """Offline stand-in for the tiktoken encoder (one token per word)."""
+
+    def encode(self, text):
+        return text.split()
+
+
+class FakeResponses:
+    """responses.create stub returning fresh, schema-valid vocabulary."""
+
+    def __init__(self):
+        self.calls = 0
+
+    def create(self, **kwargs):
+        self.calls += 1
+        prompt = kwargs["input"][-1]["content"]
+        n_words = int(prompt.split()[1])
+        rng = random.Random(self.calls)
+        items = [
+            {"root": f"Neu{self.calls}x{i}", "english": "new", "examples": make_entry(rng, i, None)["examples"]}
+            for i in range(n_words)
+        ]
+        return SimpleNamespace(
+            id=f"resp_{self.calls}",
+            output_text=json.dumps({"german_sentences": items}),
+            usage=SimpleNamespace(input_tokens=500, output_tokens=60 * n_words),
+        )
+
+
+@contextmanager
+def sandbox(real_tokenizer=False):
+    """Point data_manager at a temp dir and tutor at a fake client."""
+    saved = {
+        name: getattr(data_manager, name)
+        for name in ("VOCAB_FILE", "MEMORY_FILE", "CHAT_SESSIONS_FILE", "CHAT_SESSIONS_DIR",
+                     "CHAT_STATE_FILE", "STAGED_BATCH_FILE", "SQLITE_FILE", "VOCAB_BINARY_FILE", "STORAGE_BACKEND",
+                     "_encoder")
+    }
+    saved_client = tutor._client
+    saved_cache_mode = llm_cache.CACHE_MODE
+    with tempfile.TemporaryDirectory() as tmp:
+        tmp = Path(tmp)
+        data_manager.VOCAB_FILE = tmp / "vocab.json"
+        data_manager.MEMORY_FILE = tmp / "memory.json"
+        data_manager.CHAT_SESSIONS_FILE = tmp / "chat_sessions.json"
+        data_manager.CHAT_SESSIONS_DIR = tmp / "chat_sessions"
+        data_manager.CHAT_STATE_FILE = tmp / "chat_state.json"
+        data_manager.STAGED_BATCH_FILE = tmp / "staged_batch.json"
+        data_manager.SQLITE_FILE = tmp / "german_tutor.db"
+        data_manager.VOCAB_BINARY_FILE = tmp / "vocab.bin"
+        data_manager.STORAGE_BACKEND = "json"
+        if not real_tokenizer:
+            data_manager.set_encoder(WhitespaceEncoder())
+        tutor.set_client(SimpleNamespace(responses=FakeResponses()))
+        llm_cache.CACHE_MODE = "off"
+        try:
+            yield tmp
+        finally:
+            data_manager.flush_vocab()
+            for name, value in saved.items():
+                setattr(data_manager, name, value)
+            data_manager._vocab_stores.clear()
+            tutor.set_client(saved_client)
+            llm_cache.CACHE_MODE = saved_cache_mode
+
+
+def timeit(fn, repeat, setup=None):
+    """Run fn repeat times (after setup, untimed) and return the timings."""
+    timings = []
+    for _ in range(repeat):
+        if setup is not None:
+            setup()
+        start = time.perf_counter()
+        fn()
+        timings.append(time.perf_counter() - start)
+    return timings
+
+
+def result(name, size, timings, ops=1):
+    """Summarise timings (seconds per call of fn doing ops operations)."""
+    return {
+        "name": name,
+        "size": size,
+        "repeat": len(timings),
+        "ops": ops,
+        "min_s": min(timings),
+        "median_s": statistics.median(timings),
+        "mean_s": statistics.fmean(timings),
+    }
+
+
+def repeats_for(size, budget=100_000):
+    """Fewer repetitions for bigger inputs, at least 3."""
+    return max(3, min(50, budget // max(size, 1)))
+
+
+def bench_vocab(n):
+    data_manager.save_vocab(make_vocab(n))
+    store = data_manager.vocab_store()
+    repeat = repeats_for(n)
+    probes = [make_root(random.Random(1), i) for i in range(1000)]
+    yield result("load_vocab", n, timeit(data_manager.load_vocab, repeat))
+    yield result("vocab_store_cold", n, timeit(store.entries, repeat, setup=store.invalidate))
+    store.entries()
+    yield result(
+        "is_new_word", n,
+        timeit(lambda: [data_manager.is_new_word(root) for root in probes], repeat),
+        ops=len(probes),
+    )
+    yield result("days_since_last_batch", n, timeit(data_manager.days_since_last_batch, repeat))
+    yield result("quiz_index_build", n, timeit(tutor.quiz_index, 3, setup=_reset_quiz_index))
+    tutor.quiz_index()
+    yield result("prepare_quiz", n, timeit(lambda: tutor.prepare_quiz(50), repeat))
+    yield result("generate_new_batch", n, timeit(lambda: tutor.generate_new_batch(20), 3,
+                                                 setup=lambda: _age_vocab(n)))
+
+
+def bench_vocab_binary(n):
+    """The scalar-only and single-entry paths on the binary vocab format."""
+    data_manager.STORAGE_BACKEND = "binary"
+    data_manager.save_vocab(make_vocab(n))
+    store = data_manager.vocab_store()
+    repeat = repeats_for(n)
+    probes = [make_root(random.Random(1), i) for i in range(1000)]
+    yield result("load_vocab[binary]", n, timeit(data_manager.load_vocab, repeat))
+    yield result("days_since_last_batch[binary]", n, timeit(data_manager.days_since_last_batch, repeat))
+    store.contains(probes[0])
+    yield result(
+        "vocab_get[binary]", n,
+        timeit(lambda: [store.get(root) for root in probes], repeat),
+        ops=len(probes),
+    )
+
+
+def _reset_quiz_index():
+    tutor._quiz_index = None
+
+
+def _age_vocab(n):
+    """Rewrite the vocabulary so that a new batch is due again."""
+    data_manager.save_vocab(make_vocab(n))
+
+
+def bench_sessions(n):
+    messages = make_session(n)
+    budget = sum(m["tokens"] for m in messages) // 2
+    repeat = repeats_for(n, budget=20_000)
+    yield result(
+        "trim_messages", n,
+        timeit(lambda: data_manager.trim_messages(messages, max_tokens=budget), repeat),
+    )
+    for storage in ("json", "jsonl"):
+        saved = data_manager.CHAT_STORAGE
+        data_manager.CHAT_STORAGE = storage
+        try:
+            session_id = f"bench-{storage}-{n}"
+            _seed_session(session_id, messages)
+            yield result(
+                f"append_message[{storage}]", n,
+                timeit(lambda: data_manager.append_message(session_id, "user", "noch eine Frage"), repeat),
+            )
+            # Served from the manifest the appends above keep current.
+            yield result(f"list_sessions[{storage}]", n, timeit(data_manager.list_sessions, repeat))
+        finally:
+            data_manager.CHAT_STORAGE = saved
+
+
+def _seed_session(session_id, messages):
+    """Write a large session directly instead of appending one at a time."""
+    if data_manager.CHAT_STORAGE == "jsonl":
+        data_manager._write_lines(data_manager._segment_path(session_id), messages, "w")
+    else:
+        data_manager._replace_json(data_manager.CHAT_SESSIONS_FILE, {session_id: messages})
+
+
+def bench_memory(years):
+    n = years * 365
+    data_manager.save_memory(make_memory(years))
+    yield result("load_memory", n, timeit(data_manager.load_memory, repeats_for(n)))
+    repeat = repeats_for(n, budget=20_000)
+    today = date.today().isoformat()
+    yield result(
+        "append_memory", n,
+        timeit(lambda: data_manager.append_memory(today, {"summary": "Checkpoint"}), repeat),
+    )
+    yield result("recent_memory[30d]", n, timeit(lambda: data_manager.recent_memory(30), repeat))
+    yield result("latest_memory", n, timeit(data_manager.latest_memory, repeat))
+
+
+def run(vocab_sizes=VOCAB_SIZES, session_sizes=SESSION_SIZES, memory_years=MEMORY_YEARS,
+        real_tokenizer=False, progress=None):
+    """Run every benchmark and return the list of results."""
+    results = []
+    suites = ([(bench_vocab, n) for n in vocab_sizes]
+              + [(bench_vocab_binary, n) for n in vocab_sizes]
+              + [(bench_sessions, n) for n in session_sizes]
+              + [(bench_memory, y) for y in memory_years])
+    for bench, size in suites:
+        with sandbox(real_tokenizer):
+            for row in bench(size):
+                results.append(row)
+                if progress is not None:
+                    progress(row)
+    return results
+
+
+def _git_commit():
+    try:
+        return subprocess.run(["git", "rev-parse", "--short", "HEAD"], cwd=ROOT,
+                              capture_output=True, text=True).stdout.strip() or None
+    except OSError:
+        return None
+
+
+def _format(row, baseline=None):
+    per_op = row["median_s"] / row["ops"]
+    line = f"{row['name']:<30} {row['size']:>9}  {per_op * 1e6:12.1f} us"
+    if baseline is not None:
+        before = baseline["median_s"] / baseline["ops"]
+        line += f"  {(per_op / before - 1) * 100:+7.1f}%" if before else ""
+    return line
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--full", action="store_true", help="include the large sizes (slow)")
+    parser.add_argument("--json", help="write results to this file")
+    parser.add_argument("--compare", help="earlier --json output to compare against")
+    parser.add_argument("--real-tokenizer", action="store_true",
+                        help="count tokens with tiktoken instead of whitespace splitting")
+    args = parser.parse_args(argv)
+
+    baseline = {}
+    if args.compare:
+        previous = json.loads(Path(args.compare).read_text(encoding="utf-8"))
+        baseline = {(r["name"], r["size"]): r for r in previous["results"]}
+    print(f"{'benchmark':<30} {'size':>9}  {'median/op':>15}" + ("   change" if baseline else ""))
+    results = run(
+        FULL_VOCAB_SIZES if args.full else VOCAB_SIZES,
+        FULL_SESSION_SIZES if args.full else SESSION_SIZES,
+        FULL_MEMORY_YEARS if args.full else MEMORY_YEARS,
+        real_tokenizer=args.real_tokenizer,
+        progress=lambda row: print(_format(row, baseline.get((row["name"], row["size"]))), flush=True),
+    )
+    if args.json:
+        report = {
+            "commit": _git_commit(),
+            "python": platform.python_version(),
+            "platform": platform.platform(),
+            "timestamp": time.strftime("%Y-%m-%dT%H:%M:%S"),
+            "results": results,
+        }
+        Path(args.json).write_text(json.dumps(report, indent=2), encoding="utf-8")
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,119 @@
+"""Import-time report and budget check for the German Tutor modules.
+
+Runs ``python -X importtime -c "import <module>"`` in fresh interpreters
+and reports each module's cumulative import time (best of --runs) together
+with the slowest packages it pulls in. Exits non-zero when a module exceeds
+its entry in IMPORT_BUDGET_MS.
+
+    python benchmarks/startup.py [--runs 5] [--top 10] [--json out.json]
+"""
+
+import argparse
+import json
+import os
+import subprocess
+import sys
+from pathlib import Path
+
+ROOT = Path(__file__).resolve().parent.parent
+
+# Cumulative import time allowed per module, in milliseconds. None = report only
+# (app pulls in streamlit, which dominates and is outside our control).
+IMPORT_BUDGET_MS = {
+    "llm_cache": 50,
+    "data_manager": 100,
+    "sqlite_backend": 150,
+    "tutor": 150,
+    "quiz_engine": 300,
+    "app": None,
+}
+
+
+def parse_importtime(stderr, module):
+    """Return {name: cumulative_us} for module and everything it imported.
+
+    -X importtime prints children (indented deeper) before their parent, so
+    the module's subtree is the run of deeper lines right above its own;
+    interpreter startup (site, .pth hooks) is excluded that way.
+    """
+    rows = []
+    for line in stderr.splitlines():
+        if not line.startswith("import time:") or "self [us]" in line:
+            continue
+        _, cumulative_us, name = line[len("import time:"):].split("|")
+        depth = len(name) - len(name.lstrip()) - 1
+        rows.append((depth, name.strip(), int(cumulative_us)))
+    for index in range(len(rows) - 1, -1, -1):
+        depth, name, cumulative_us = rows[index]
+        if name != module:
+            continue
+        times = {name: cumulative_us}
+        for child_depth, child, child_us in reversed(rows[:index]):
+            if child_depth <= depth:
+                break
+            times[child] = child_us
+        return times
+    raise ValueError(f"{module} not found in importtime output")
+
+
+def measure(module):
+    """Import module in a fresh interpreter and return its importtime table."""
+    env = dict(os.environ, PYTHONDONTWRITEBYTECODE="1")
+    env.pop("OPENAI_API_KEY", None)
+    result = subprocess.run(
+        [sys.executable, "-X", "importtime", "-c", f"import {module}"],
+        cwd=ROOT, env=env, capture_output=True, text=True,
+    )
+    if result.returncode:
+        raise RuntimeError(f"importing {module} failed:\n{result.stderr[-2000:]}")
+    return parse_importtime(result.stderr, module)
+
+
+def report(module, runs, top):
+    """Best-of-runs cumulative time for module plus its slowest imports."""
+    best = None
+    for _ in range(runs):
+        times = measure(module)
+        if best is None or times[module] < best[module]:
+            best = times
+    slowest = sorted(
+        ((name, cumulative) for name, cumulative in best.items() if name != module),
+        key=lambda item: item[1],
+        reverse=True,
+    )[:top]
+    return {
+        "module": module,
+        "cumulative_ms": best[module] / 1000,
+        "budget_ms": IMPORT_BUDGET_MS.get(module),
+        "modules_imported": len(best),
+        "slowest": [{"module": name, "cumulative_ms": us / 1000} for name, us in slowest],
+    }
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("modules", nargs="*", default=list(IMPORT_BUDGET_MS))
+    parser.add_argument("--runs", type=int, default=5)
+    parser.add_argument("--top", type=int, default=10)
+    parser.add_argument("--json", help="also write the results to this file")
+    args = parser.parse_args(argv)
+
+    results = [report(module, args.runs, args.top) for module in args.modules]
+    over = []
+    for result in results:
+        budget = result["budget_ms"]
+        status = "" if budget is None else f" (budget {budget} ms)"
+        if budget is not None and result["cumulative_ms"] > budget:
+            status += " OVER BUDGET"
+            over.append(result["module"])
+        print(f"{result['module']}: {result['cumulative_ms']:.1f} ms, "
+              f"{result['modules_imported']} modules{status}")
+        for item in result["slowest"]:
+            print(f"    {item['cumulative_ms']:8.1f} ms  {item['module']}")
+    if args.json:
+        Path(args.json).write_text(json.dumps(results, indent=2), encoding="utf-8")
+    return 1 if over else 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
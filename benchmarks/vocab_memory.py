@@ -0,0 +1,109 @@
+"""Memory per entry and load time of the in-memory vocabulary.
+
+Compares the VocabEntry objects load_vocab returns with the plain dicts it
+used to return (json.loads plus backfill_entry), on synthetic vocabularies
+written to a temporary file. Memory is what stays allocated after loading
+(tracemalloc), divided by the number of entries; load time is the best of
+--runs.
+
+    python benchmarks/vocab_memory.py [--sizes 10000 100000] [--json out.json]
+"""
+
+import argparse
+import gc
+import json
+import sys
+import tempfile
+import time
+import tracemalloc
+from pathlib import Path
+
+ROOT = Path(__file__).resolve().parent.parent
+sys.path.insert(0, str(ROOT))
+sys.path.insert(0, str(ROOT / "benchmarks"))
+
+import data_manager  # noqa: E402
+from hot_paths import make_vocab  # noqa: E402
+
+SIZES = [10_000, 100_000]
+
+
+def load_dicts(path):
+    """The former load_vocab: parsed dicts, backfilled in place."""
+    data = data_manager._read_json(path)
+    for entry in data:
+        data_manager.backfill_entry(entry)
+    return data
+
+
+def load_entries(path):
+    return data_manager._read_vocab_file(path)
+
+
+LOADERS = {"dict": load_dicts, "VocabEntry": load_entries}
+
+
+def retained_bytes(load, path):
+    """Bytes still allocated once load(path) has returned."""
+    gc.collect()
+    tracemalloc.start()
+    try:
+        before = tracemalloc.get_traced_memory()[0]
+        vocab = load(path)
+        gc.collect()
+        after = tracemalloc.get_traced_memory()[0]
+    finally:
+        tracemalloc.stop()
+    del vocab
+    return after - before
+
+
+def load_seconds(load, path, runs):
+    best = None
+    for _ in range(runs):
+        gc.collect()
+        start = time.perf_counter()
+        load(path)
+        elapsed = time.perf_counter() - start
+        best = elapsed if best is None else min(best, elapsed)
+    return best
+
+
+def run(sizes=SIZES, runs=3, progress=None):
+    """Measure every loader at every size; return the list of results."""
+    results = []
+    with tempfile.TemporaryDirectory() as tmp:
+        path = Path(tmp) / "vocab.json"
+        for n in sizes:
+            path.write_text(json.dumps(make_vocab(n), ensure_ascii=False), encoding="utf-8")
+            for name, load in LOADERS.items():
+                row = {
+                    "representation": name,
+                    "size": n,
+                    "bytes_per_entry": retained_bytes(load, path) / n,
+                    "load_s": load_seconds(load, path, runs),
+                }
+                results.append(row)
+                if progress is not None:
+                    progress(row)
+    return results
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--sizes", type=int, nargs="*", default=SIZES)
+    parser.add_argument("--runs", type=int, default=3)
+    parser.add_argument("--json", help="also write the results to this file")
+    args = parser.parse_args(argv)
+
+    print(f"{'representation':<14} {'size':>9} {'bytes/entry':>12} {'load':>10}")
+    results = run(args.sizes, args.runs, progress=lambda row: print(
+        f"{row['representation']:<14} {row['size']:>9} {row['bytes_per_entry']:12.0f}"
+        f" {row['load_s'] * 1000:8.1f} ms", flush=True))
+    if args.json:
+        Path(args.json).write_text(json.dumps(results, indent=2), encoding="utf-8")
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
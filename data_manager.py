@@ -1,16 +1,55 @@
 """Data I/O and scheduling utilities for German Tutor."""
 
+import atexit
+import functools
 import json
 import math
-from datetime import date
+import os
+import queue
+import sys
+import threading
+import time
+from concurrent.futures import Future
+from bisect import bisect_left, bisect_right, insort
+from collections import deque
+from collections.abc import MutableMapping
+from datetime import date, datetime, timedelta
 from pathlib import Path
+from urllib.parse import quote, unquote
 
-import tiktoken
+import metrics
 
 BASE_DIR = Path(__file__).resolve().parent
 VOCAB_FILE = BASE_DIR / "vocab.json"
+# Memory checkpoints live in an append-only log next to MEMORY_FILE
+# (memory.jsonl); an existing memory.json only seeds it (see MemoryLog).
 MEMORY_FILE = BASE_DIR / "memory.json"
 CHAT_SESSIONS_FILE = BASE_DIR / "chat_sessions.json"
+CHAT_SESSIONS_DIR = BASE_DIR / "chat_sessions"
+CHAT_STATE_FILE = BASE_DIR / "chat_state.json"
+# Next vocabulary batch generated ahead of time (see tutor.prefetch_next_batch).
+STAGED_BATCH_FILE = BASE_DIR / "staged_batch.json"
+SQLITE_FILE = BASE_DIR / "german_tutor.db"
+# Vocabulary in the binary column format (see vocab_binary.py).
+VOCAB_BINARY_FILE = BASE_DIR / "vocab.bin"
+
+# "json" uses the files above; "sqlite" keeps everything in SQLITE_FILE
+# (see sqlite_backend.py); "binary" keeps the vocabulary in VOCAB_BINARY_FILE
+# and everything else in the JSON files (see vocab_binary.py).
+STORAGE_BACKEND = os.environ.get("GERMAN_TUTOR_STORAGE", "json")
+
+# "json" keeps every session inside CHAT_SESSIONS_FILE; "jsonl" stores each
+# session as an append-only segment file under CHAT_SESSIONS_DIR.
+CHAT_STORAGE = "json"
+# Number of trimmed messages a segment may carry before it is compacted.
+SEGMENT_COMPACT_MIN = 200
+
+# Route JSON-file writes through the background GroupCommitWriter; False
+# applies each write inline in the calling thread.
+GROUP_COMMIT = True
+# "always" fsyncs each committed file (and its directory); "never" leaves
+# flushing to the OS.
+WRITE_FSYNC = "always"
 
 VOCAB_SCHEMA_FIELDS = [
     "root",
@@ -22,111 +61,1438 @@ VOCAB_SCHEMA_FIELDS = [
     "known",
 ]
 
-def load_vocab():
-    """Load the vocabulary list from vocab.json."""
+# Spaced-repetition fields kept per entry next to VOCAB_SCHEMA_FIELDS; they
+# default lazily (see review_entry) so older vocab files load unchanged.
+SCHEDULE_FIELDS = ["due", "interval", "ease", "reps"]
+DEFAULT_EASE = 2.5
+MIN_EASE = 1.3
+# Deferred flashcard reviews are written once this many are pending or the
+# oldest has waited this long.
+VOCAB_FLUSH_BATCH = 20
+VOCAB_FLUSH_SECONDS = 30
+
+def backfill_entry(entry):
+    """Fill any missing VOCAB_SCHEMA_FIELDS of entry with their defaults."""
+    for field in VOCAB_SCHEMA_FIELDS:
+        if field not in entry:
+            if field == "examples":
+                entry[field] = {}
+            elif field == "last_reviewed":
+                entry[field] = None
+            elif field == "known":
+                entry[field] = False
+            else:
+                entry[field] = None
+    return entry
+
+# Marks a VocabEntry field that is absent (as opposed to None).
+_MISSING = object()
+_ENTRY_FIELDS = VOCAB_SCHEMA_FIELDS + SCHEDULE_FIELDS
+_ENTRY_FIELD_SET = frozenset(_ENTRY_FIELDS)
+# Date-valued fields whose (highly repetitive) strings are interned.
+_DATE_FIELDS = ("taught_on", "last_reviewed", "due")
+# Slot behind each field (examples goes through a lazy-loading property).
+_ENTRY_SLOTS = {f: "_examples" if f == "examples" else f for f in _ENTRY_FIELDS}
+
+def _intern(value):
+    return sys.intern(value) if type(value) is str else value
+
+class VocabEntry(MutableMapping):
+    """Compact, slotted vocabulary entry that behaves like the entry dict.
+
+    Known fields live in slots (date strings interned), anything else in a
+    small extra dict. Schema fields are always present (as backfill_entry
+    would fill them); schedule fields only once set. examples may be given
+    as a zero-argument loader, called on first access. Supports get, [],
+    in, update, ==, iteration and len like a dict; dict(entry) converts.
+    """
+
+    __slots__ = tuple(_ENTRY_SLOTS.values()) + ("_extra",)
+
+    def __init__(self, data=(), **fields):
+        for field in _ENTRY_FIELDS:
+            setattr(self, field, _MISSING)
+        self._extra = None
+        self.update(data, **fields)
+        backfill_entry(self)
+
+    @classmethod
+    def from_dict(cls, data):
+        """Build an entry from a parsed JSON object (the fast loading path)."""
+        entry = cls.__new__(cls)
+        get = data.get
+        entry.root = get("root")
+        entry.english = get("english")
+        entry.taught_on = _intern(get("taught_on"))
+        entry.batch_id = get("batch_id")
+        entry._examples = get("examples", _MISSING)
+        if entry._examples is _MISSING:
+            entry._examples = {}
+        entry.last_reviewed = _intern(get("last_reviewed"))
+        entry.known = get("known", False)
+        entry.due = _intern(get("due", _MISSING))
+        entry.interval = get("interval", _MISSING)
+        entry.ease = get("ease", _MISSING)
+        entry.reps = get("reps", _MISSING)
+        if data.keys() <= _ENTRY_FIELD_SET:
+            entry._extra = None
+        else:
+            entry._extra = {k: v for k, v in data.items() if k not in _ENTRY_FIELD_SET}
+        return entry
+
+    @property
+    def examples(self):
+        value = self._examples
+        if callable(value):
+            value = self._examples = value()
+        return value
+
+    @examples.setter
+    def examples(self, value):
+        self._examples = value
+
+    def __getitem__(self, key):
+        if key in _ENTRY_FIELD_SET:
+            value = getattr(self, key)
+            if value is not _MISSING:
+                return value
+        elif self._extra is not None and key in self._extra:
+            return self._extra[key]
+        raise KeyError(key)
+
+    def get(self, key, default=None):
+        if key in _ENTRY_FIELD_SET:
+            value = getattr(self, key)
+            return default if value is _MISSING else value
+        if self._extra is not None:
+            return self._extra.get(key, default)
+        return default
+
+    def __contains__(self, key):
+        if key in _ENTRY_FIELD_SET:
+            return getattr(self, _ENTRY_SLOTS[key]) is not _MISSING
+        return self._extra is not None and key in self._extra
+
+    def __setitem__(self, key, value):
+        if key in _ENTRY_FIELD_SET:
+            setattr(self, key, _intern(value) if key in _DATE_FIELDS else value)
+        else:
+            if self._extra is None:
+                self._extra = {}
+            self._extra[key] = value
+
+    def __delitem__(self, key):
+        if key not in self:
+            raise KeyError(key)
+        if key in _ENTRY_FIELD_SET:
+            setattr(self, key, _MISSING)
+        else:
+            del self._extra[key]
+
+    def __iter__(self):
+        for field, slot in _ENTRY_SLOTS.items():
+            if getattr(self, slot) is not _MISSING:
+                yield field
+        if self._extra is not None:
+            yield from self._extra
+
+    def __len__(self):
+        return sum(1 for _ in self)
+
+    def to_dict(self):
+        """Return the entry as a plain dict."""
+        return {key: self[key] for key in self}
+
+    def copy(self):
+        return VocabEntry.from_dict(self.to_dict())
+
+    def __reduce__(self):
+        return (VocabEntry.from_dict, (self.to_dict(),))
+
+    def __repr__(self):
+        return f"VocabEntry({self.to_dict()!r})"
+
+def _json_default(value):
+    """json.dumps hook serializing VocabEntry objects."""
+    if isinstance(value, VocabEntry):
+        return value.to_dict()
+    raise TypeError(f"Object of type {type(value).__name__} is not JSON serializable")
+
+def _read_json(path):
+    """Parse the JSON file at path (FileNotFoundError propagates)."""
+    with metrics.span("file.read", path=path.name) as span:
+        raw = path.read_bytes()
+        span.add(bytes_read=len(raw))
+    return json.loads(raw)
+
+def _read_vocab_file(path):
+    """Parse a vocab file into VocabEntry objects (schema fields backfilled)."""
     try:
-        data = json.loads(VOCAB_FILE.read_text(encoding="utf-8"))
+        data = _read_json(path)
     except FileNotFoundError:
         return []
-    for entry in data:
-        for field in VOCAB_SCHEMA_FIELDS:
-            if field not in entry:
-                if field == "examples":
-                    entry[field] = {}
-                elif field == "last_reviewed":
-                    entry[field] = None
-                elif field == "known":
-                    entry[field] = False
-                else:
-                    entry[field] = None
-    return data
+    return [VocabEntry.from_dict(entry) for entry in data]
 
-def save_vocab(vocab_list):
-    """Save the vocabulary list to vocab.json."""
-    VOCAB_FILE.write_text(
-        json.dumps(vocab_list, indent=2, ensure_ascii=False), encoding="utf-8"
+def _atomic_write(path, text):
+    """Replace path with text (or bytes) via a temp file and rename, fsyncing per WRITE_FSYNC."""
+    payload = text.encode("utf-8") if isinstance(text, str) else text
+    with metrics.span("file.write", path=path.name) as span:
+        path.parent.mkdir(parents=True, exist_ok=True)
+        tmp = path.with_name(path.name + ".tmp")
+        with tmp.open("wb") as fh:
+            fh.write(payload)
+            if WRITE_FSYNC == "always":
+                fh.flush()
+                os.fsync(fh.fileno())
+        os.replace(tmp, path)
+        if WRITE_FSYNC == "always" and hasattr(os, "O_DIRECTORY"):
+            fd = os.open(path.parent, os.O_RDONLY | os.O_DIRECTORY)
+            try:
+                os.fsync(fd)
+            finally:
+                os.close(fd)
+        span.add(bytes_written=len(payload))
+
+class GroupCommitWriter:
+    """Single background thread applying queued file mutations in order.
+
+    Mutations queued for the same JSON file while the thread is busy are
+    applied to one loaded copy and committed with a single atomic write,
+    so concurrent callers share the I/O instead of racing on
+    read-modify-write cycles. submit() and call() return Futures.
+    """
+
+    def __init__(self):
+        self._queue = queue.Queue()
+        self._lock = threading.Lock()
+        self._commit_lock = threading.Lock()
+        self._thread = None
+        self._closed = False
+        self.commits = 0
+
+    def submit(self, path, mutate, default=dict):
+        """Queue mutate(doc) -> (new_doc, result) for the JSON file at path.
+
+        default() supplies the document when the file does not exist.
+        """
+        return self._enqueue(("doc", path, mutate, default))
+
+    def call(self, path, fn):
+        """Run fn() on the writer thread, ordered with other writes to path."""
+        return self._enqueue(("call", path, fn, None))
+
+    def _enqueue(self, job):
+        future = Future()
+        job = job + (future,)
+        with self._lock:
+            inline = self._closed or not GROUP_COMMIT
+            if not inline and self._thread is None:
+                self._thread = threading.Thread(
+                    target=self._run, name="data-manager-writer", daemon=True
+                )
+                self._thread.start()
+            if not inline:
+                self._queue.put(job)
+                return future
+        self._commit([job])
+        return future
+
+    def _run(self):
+        while True:
+            batch = [self._queue.get()]
+            while True:
+                try:
+                    batch.append(self._queue.get_nowait())
+                except queue.Empty:
+                    break
+            stop = None in batch
+            self._commit([job for job in batch if job is not None])
+            if stop:
+                return
+
+    def _commit(self, batch):
+        """Apply a batch, one load and one write per file where possible."""
+        groups = {}
+        for job in batch:
+            groups.setdefault(job[1], []).append(job)
+        with self._commit_lock:
+            for path, jobs in groups.items():
+                pending = []
+                for job in jobs:
+                    if job[0] == "doc":
+                        pending.append(job)
+                        continue
+                    self._commit_docs(path, pending)
+                    pending = []
+                    _run_job(job[4], job[2])
+                self._commit_docs(path, pending)
+
+    def _commit_docs(self, path, jobs):
+        if not jobs:
+            return
+        try:
+            try:
+                doc = _read_json(path)
+            except FileNotFoundError:
+                doc = jobs[0][3]()
+        except Exception as exc:
+            for job in jobs:
+                job[4].set_exception(exc)
+            return
+        done = []
+        for _, _, mutate, _, future in jobs:
+            try:
+                doc, result = mutate(doc)
+            except Exception as exc:
+                future.set_exception(exc)
+            else:
+                done.append((future, result))
+        if not done:
+            return
+        try:
+            _atomic_write(path, json.dumps(doc, indent=2, ensure_ascii=False, default=_json_default))
+        except Exception as exc:
+            for future, _ in done:
+                future.set_exception(exc)
+            return
+        self.commits += 1
+        for future, result in done:
+            future.set_result(result)
+
+    def close(self):
+        """Drain queued writes and switch to inline writes."""
+        with self._lock:
+            self._closed = True
+            thread = self._thread
+        if thread is not None:
+            self._queue.put(None)
+            thread.join()
+
+def _run_job(future, fn):
+    try:
+        future.set_result(fn())
+    except Exception as exc:
+        future.set_exception(exc)
+
+_writer = GroupCommitWriter()
+
+def writer():
+    """Return the process-wide GroupCommitWriter."""
+    return _writer
+
+def _update_json(path, mutate, default=dict):
+    """Apply mutate through the writer and wait until it is committed."""
+    return _writer.submit(path, mutate, default).result()
+
+def _replace_json(path, value):
+    """Replace the JSON document at path with value and wait for the commit."""
+    _update_json(path, lambda doc: (value, None))
+
+def _write_vocab_file(path, vocab_list):
+    """Serialize vocab_list to path."""
+    _replace_json(path, vocab_list)
+    bump_version("vocab")
+
+# kind -> in-process write counter, bumped by every write path so callers
+# can key caches on data_version() instead of re-reading files.
+_versions = {"vocab": 0, "sessions": 0, "memory": 0}
+
+def bump_version(kind):
+    """Mark data of kind ("vocab", "sessions" or "memory") as changed."""
+    _versions[kind] += 1
+
+def data_version(kind):
+    """Return a hashable token that changes whenever data of kind is written.
+
+    Combines the in-process write counter with the backing file's
+    mtime/size (for segments, the signature of all segment files), so
+    writes from other processes are noticed too.
+    """
+    if STORAGE_BACKEND == "sqlite":
+        path = SQLITE_FILE.with_name(SQLITE_FILE.name + "-wal")
+    elif kind == "vocab" and STORAGE_BACKEND == "binary":
+        path = VOCAB_BINARY_FILE
+    elif kind == "vocab":
+        path = VOCAB_FILE
+    elif kind == "memory":
+        path = _memory_log_path()
+    elif CHAT_STORAGE == "jsonl":
+        # The directory's mtime misses appends to existing segments.
+        source = _manifest_source()
+        return (STORAGE_BACKEND, _versions[kind], None if source is None else tuple(source))
+    else:
+        path = CHAT_SESSIONS_FILE
+    return (STORAGE_BACKEND, _versions[kind], _file_signature(path))
+
+def normalize_root(root):
+    """Return the case-insensitive lookup key for a vocabulary root."""
+    return (root or "").strip().lower()
+
+def _due_key(entry):
+    """Return the ISO date an entry is next due (empty string: due now)."""
+    return entry.get("due") or entry.get("taught_on") or ""
+
+def review_entry(entry, quality, today=None):
+    """Apply an SM-2 review with quality 0-5 to entry in place.
+
+    Qualities below 3 reset the repetition count; the ease factor is
+    adjusted as in SM-2 and never drops below MIN_EASE.
+    """
+    today = today or date.today()
+    ease = entry.get("ease") or DEFAULT_EASE
+    reps = entry.get("reps") or 0
+    interval = entry.get("interval") or 0
+    if quality < 3:
+        reps = 0
+        interval = 1
+    else:
+        reps += 1
+        if reps == 1:
+            interval = 1
+        elif reps == 2:
+            interval = 6
+        else:
+            interval = round(interval * ease)
+    ease += 0.1 - (5 - quality) * (0.08 + (5 - quality) * 0.02)
+    entry.update(
+        ease=round(max(MIN_EASE, ease), 2),
+        reps=reps,
+        interval=interval,
+        due=(today + timedelta(days=interval)).isoformat(),
+        last_reviewed=today.isoformat(),
+        known=quality >= 3,
     )
+    return entry
 
-def load_memory():
-    """Load memory checkpoints from memory.json."""
+def _locked(method):
+    """Run a store method while holding the store's lock."""
+    @functools.wraps(method)
+    def wrapper(self, *args, **kwargs):
+        with self._lock:
+            return method(self, *args, **kwargs)
+    return wrapper
+
+class VocabStore:
+    """In-memory vocabulary list with a hash index on the normalized root.
+
+    The file is parsed once and only re-read when its mtime or size changes
+    (or after save_vocab), so repeated lookups cost a stat call. A list of
+    (due date, position) pairs kept sorted alongside serves the review queue.
+    Deferred reviews are kept as dirty entries and written in one batch by
+    flush(), once VOCAB_FLUSH_BATCH accumulate or VOCAB_FLUSH_SECONDS pass.
+    """
+
+    def __init__(self, path):
+        self.path = path
+        self._signature = None
+        self._loaded = False
+        self._entries = []
+        self._index = {}
+        self._due = []
+        self._dirty = {}
+        self._dirty_since = None
+        self._lock = threading.RLock()
+
+    def invalidate(self):
+        """Force the next access to re-read the file."""
+        self._loaded = False
+
+    def _refresh(self):
+        sig = _file_signature(self.path)
+        if self._loaded and sig == self._signature:
+            return
+        self._entries = _read_vocab_file(self.path)
+        self._index = {}
+        for pos, entry in enumerate(self._entries):
+            self._index.setdefault(normalize_root(entry.get("root")), pos)
+        # Unflushed reviews survive a reload triggered by an outside write.
+        for key, changed in self._dirty.items():
+            pos = self._index.get(key)
+            if pos is not None:
+                self._entries[pos].update(changed)
+        self._due = sorted((_due_key(e), pos) for pos, e in enumerate(self._entries))
+        self._signature = sig
+        self._loaded = True
+
+    def _write(self):
+        _write_vocab_file(self.path, self._entries)
+        self._signature = _file_signature(self.path)
+
+    @_locked
+    def entries(self):
+        """Return the cached entry list (do not mutate without saving)."""
+        self._refresh()
+        return self._entries
+
+    @_locked
+    def contains(self, root):
+        """Return True if root is already in the vocabulary (case-insensitive)."""
+        self._refresh()
+        return normalize_root(root) in self._index
+
+    @_locked
+    def get(self, root):
+        """Return the entry for root, or None."""
+        self._refresh()
+        pos = self._index.get(normalize_root(root))
+        return None if pos is None else self._entries[pos]
+
+    @_locked
+    def add_many(self, entries):
+        """Append entries whose roots are new, write once, and return them."""
+        self._refresh()
+        added = []
+        for entry in entries:
+            key = normalize_root(entry.get("root"))
+            if not key or key in self._index:
+                continue
+            if not isinstance(entry, VocabEntry):
+                entry = VocabEntry(entry)
+            pos = len(self._entries)
+            self._index[key] = pos
+            self._entries.append(entry)
+            insort(self._due, (_due_key(entry), pos))
+            added.append(entry)
+        if added:
+            self._write()
+        return added
+
+    @_locked
+    def due_count(self, today=None):
+        """Return how many entries are due on or before today."""
+        self._refresh()
+        today = (today or date.today()).isoformat()
+        return bisect_right(self._due, (today, math.inf))
+
+    @_locked
+    def due_cards(self, n, today=None, offset=0):
+        """Return up to n due entries, most overdue first, skipping offset."""
+        self._refresh()
+        end = min(offset + n, self.due_count(today))
+        return [self._entries[pos] for _, pos in self._due[offset:end]]
+
+    @_locked
+    def review(self, root, quality, today=None, defer=False):
+        """Record a review of root and reschedule it; return the entry.
+
+        With defer=True the change is only marked dirty and written by a
+        later (possibly automatic) flush().
+        """
+        self._refresh()
+        key = normalize_root(root)
+        pos = self._index.get(key)
+        if pos is None:
+            raise KeyError(root)
+        entry = self._entries[pos]
+        old = (_due_key(entry), pos)
+        del self._due[bisect_left(self._due, old)]
+        review_entry(entry, quality, today)
+        insort(self._due, (_due_key(entry), pos))
+        bump_version("vocab")
+        self._dirty[key] = dict(entry)
+        if self._dirty_since is None:
+            self._dirty_since = time.monotonic()
+        if not defer or self._flush_due():
+            self.flush()
+        return entry
+
+    def _flush_due(self):
+        return (
+            len(self._dirty) >= VOCAB_FLUSH_BATCH
+            or time.monotonic() - self._dirty_since >= VOCAB_FLUSH_SECONDS
+        )
+
+    @_locked
+    def pending(self):
+        """Return the number of reviewed entries not yet written."""
+        return len(self._dirty)
+
+    @_locked
+    def max_batch_id(self):
+        """Return the highest batch_id in the vocabulary (0 if empty)."""
+        self._refresh()
+        return max((e.get("batch_id") or 0 for e in self._entries), default=0)
+
+    @_locked
+    def recent_roots(self, n):
+        """Return the roots of the n most recently added entries, newest first."""
+        self._refresh()
+        return [e.get("root") for e in reversed(self._entries[-n:]) if e.get("root")]
+
+    @_locked
+    def flush(self):
+        """Write all dirty entries in a single file write."""
+        if not self._dirty:
+            return 0
+        self._refresh()
+        count = len(self._dirty)
+        self._write()
+        self._dirty = {}
+        self._dirty_since = None
+        return count
+
+
+class MemoryLog:
+    """Append-only log of memory checkpoints with a sorted date index.
+
+    Every checkpoint is one JSON line ({"date", "at", "entry"}) appended to
+    the file, so writing one costs the same after years of use and earlier
+    checkpoints of the same day are kept. The index holds (date, sequence,
+    byte offset) per line, sorted by date; it is built by one scan and then
+    extended by reading only the bytes appended since, by this process or
+    another, once the last line it scanned is found unchanged (a file
+    rewritten to a larger size is scanned again from the start). Range
+    queries bisect it and read just the matching lines.
+    """
+
+    def __init__(self, path, legacy_path=None):
+        self.path = path
+        self.legacy_path = legacy_path
+        self._signature = None
+        self._scanned = 0
+        self._tail = b""
+        self._index = []
+        self._lock = threading.RLock()
+
+    def _refresh(self):
+        sig = _file_signature(self.path)
+        if sig is None and self.legacy_path is not None and self.legacy_path.exists():
+            # Seed the log from a {date: entry} memory.json.
+            self._rewrite(_read_json(self.legacy_path))
+            sig = _file_signature(self.path)
+        if sig == self._signature:
+            return
+        if sig is None or sig[1] <= self._scanned or not self._tail_unchanged():
+            # Missing, or rewritten rather than appended to: start over.
+            self._scanned = 0
+            self._tail = b""
+            self._index = []
+        if sig is not None:
+            self._scan()
+        self._signature = sig
+
+    def _tail_unchanged(self):
+        """Whether the last scanned line is still where the index says it is."""
+        if not self._tail:
+            return True
+        with self.path.open("rb") as fh:
+            fh.seek(self._scanned - len(self._tail))
+            return fh.read(len(self._tail)) == self._tail
+
+    def _scan(self):
+        """Index the complete lines after the scanned prefix."""
+        offset = self._scanned
+        with metrics.span("file.read", path=self.path.name) as span, self.path.open("rb") as fh:
+            fh.seek(offset)
+            for line in fh:
+                if not line.endswith(b"\n"):
+                    break  # A torn (or still being written) final line.
+                try:
+                    date_str = json.loads(line).get("date")
+                except (ValueError, AttributeError):
+                    date_str = None
+                if isinstance(date_str, str):
+                    insort(self._index, (date_str, len(self._index), offset))
+                offset += len(line)
+                self._tail = line
+            span.add(bytes_read=offset - self._scanned)
+        self._scanned = offset
+
+    def _read(self, items):
+        """Parse the lines at the offsets of the given index items.
+
+        The bytes spanning all of them are read at once: checkpoints are
+        mostly appended in date order, so a date range is one stretch of
+        the file.
+        """
+        if not items:
+            return []
+        offsets = [offset for _, _, offset in items]
+        first = min(offsets)
+        with metrics.span("file.read", path=self.path.name) as span, self.path.open("rb") as fh:
+            fh.seek(first)
+            chunk = fh.read(max(offsets) - first) + fh.readline()
+            span.add(bytes_read=len(chunk))
+        lines = []
+        for offset in offsets:
+            start = offset - first
+            lines.append(chunk[start:chunk.index(b"\n", start)])
+        # One parse for the lot instead of a json.loads call per line.
+        return json.loads(b"[" + b",".join(lines) + b"]")
+
+    def _rewrite(self, memory_dict):
+        lines = [
+            json.dumps({"date": key, "at": None, "entry": memory_dict[key]}, ensure_ascii=False) + "\n"
+            for key in sorted(memory_dict)
+        ]
+        _atomic_write(self.path, "".join(lines))
+
+    @_locked
+    def append(self, date_str, entry):
+        """Append a checkpoint for date_str and return its record."""
+        self._refresh()
+        record = {"date": date_str, "at": _timestamp(), "entry": entry}
+        line = json.dumps(record, ensure_ascii=False) + "\n"
+        if self._signature is not None and self._scanned < self._signature[1]:
+            line = "\n" + line  # Terminate a torn final line first.
+        payload = line.encode("utf-8")
+        self.path.parent.mkdir(parents=True, exist_ok=True)
+        with metrics.span("file.append", path=self.path.name) as span, self.path.open("ab") as fh:
+            fh.write(payload)
+            if WRITE_FSYNC == "always":
+                fh.flush()
+                os.fsync(fh.fileno())
+            span.add(bytes_written=len(payload))
+        self._refresh()
+        return record
+
+    @_locked
+    def replace(self, memory_dict):
+        """Replace the whole log with one checkpoint per date of memory_dict."""
+        self._rewrite(memory_dict)
+        self._signature = None
+        self._scanned = 0
+        self._tail = b""
+        self._index = []
+
+    @_locked
+    def checkpoints(self, start=None, end=None):
+        """Return the checkpoints dated start..end (ISO strings, inclusive), oldest first.
+
+        Checkpoints of the same date come in the order they were written.
+        """
+        self._refresh()
+        lo = 0 if start is None else bisect_left(self._index, (start,))
+        hi = len(self._index) if end is None else bisect_right(self._index, (end, math.inf))
+        return self._read(self._index[lo:hi])
+
+    @_locked
+    def latest(self):
+        """Return the most recent checkpoint (by date, then write order), or None."""
+        self._refresh()
+        records = self._read(self._index[-1:])
+        return records[0] if records else None
+
+    @_locked
+    def load(self):
+        """Return {date: entry} with the last checkpoint written for each date."""
+        return {record["date"]: record["entry"] for record in self.checkpoints()}
+
+    @_locked
+    def __len__(self):
+        self._refresh()
+        return len(self._index)
+
+
+def _memory_log_path():
+    """Return the checkpoint log that belongs to MEMORY_FILE."""
+    return MEMORY_FILE.with_suffix(".jsonl")
+
+def _segment_path(session_id):
+    """Return the segment file path for session_id (filesystem-safe)."""
+    return CHAT_SESSIONS_DIR / (quote(session_id, safe="") + ".jsonl")
+
+def _file_signature(path):
+    """Return (mtime_ns, size) for path, or None if it does not exist."""
     try:
-        return json.loads(MEMORY_FILE.read_text(encoding="utf-8"))
+        st = path.stat()
     except FileNotFoundError:
-        return {}
+        return None
+    return (st.st_mtime_ns, st.st_size)
 
-def save_memory(memory_dict):
-    """Save memory checkpoints to memory.json."""
-    MEMORY_FILE.write_text(
-        json.dumps(memory_dict, indent=2, ensure_ascii=False), encoding="utf-8"
+# path -> segment state dict (signature, live deque, trimmed count, running
+# token total, offset of the latest message line once known); avoids
+# re-reading a segment only this process has written.
+_segment_cache = {}
+
+def _read_segment(path):
+    """Replay a segment file into (live messages, trimmed count)."""
+    messages = []
+    trimmed = 0
+    try:
+        with metrics.span("file.read", path="segment") as span, path.open("rb") as fh:
+            for line in fh:
+                if not line.strip():
+                    continue
+                try:
+                    record = json.loads(line)
+                except ValueError:
+                    # A torn line from an interrupted write; later appends
+                    # start on a fresh line, so keep reading past it.
+                    continue
+                if "trimmed" in record:
+                    trimmed = record["trimmed"]
+                else:
+                    messages.append(record)
+            span.add(bytes_read=fh.tell())
+    except FileNotFoundError:
+        return [], 0
+    return messages[trimmed:], trimmed
+
+def _load_segment(path):
+    """Return the cached state dict for a segment, re-reading it if changed."""
+    sig = _file_signature(path)
+    state = _segment_cache.get(path)
+    if state is not None and state["signature"] == sig:
+        return state
+    live, trimmed = _read_segment(path)
+    state = {
+        "signature": sig,
+        "live": deque(live),
+        "trimmed": trimmed,
+        "total": sum(message_tokens(m) for m in live),
+        "offset": None,
+        "torn": _has_torn_tail(path),
+    }
+    _segment_cache[path] = state
+    return state
+
+def _has_torn_tail(path):
+    """Return True if path's last line is missing its newline (an interrupted write)."""
+    try:
+        with path.open("rb") as fh:
+            if fh.seek(0, os.SEEK_END) == 0:
+                return False
+            fh.seek(-1, os.SEEK_END)
+            return fh.read(1) != b"\n"
+    except FileNotFoundError:
+        return False
+
+def _write_lines(path, records, mode):
+    """Write JSON records one per line to path using the given file mode.
+
+    Returns the byte offset each record's line starts at.
+    """
+    path.parent.mkdir(parents=True, exist_ok=True)
+    lines = [(json.dumps(r, ensure_ascii=False) + "\n").encode("utf-8") for r in records]
+    payload = b"".join(lines)
+    op = "file.append" if mode == "a" else "file.write"
+    with metrics.span(op, path="segment") as span, path.open(mode + "b") as fh:
+        start = fh.tell()
+        fh.write(payload)
+        span.add(bytes_written=len(payload))
+    offsets = []
+    for line in lines:
+        offsets.append(start)
+        start += len(line)
+    return offsets
+
+def compact_session(session_id):
+    """Rewrite a session segment so it only contains live messages."""
+    path = _segment_path(session_id)
+    _writer.call(path, lambda: _compact_segment(path)).result()
+
+def _compact_segment(path):
+    """compact_session on the writer thread, which owns the segment cache."""
+    state = _load_segment(path)
+    tmp = path.with_name(path.name + ".tmp")
+    offsets = _write_lines(tmp, state["live"], "w")
+    os.replace(tmp, path)
+    state["trimmed"] = 0
+    state["signature"] = _file_signature(path)
+    state["offset"] = offsets[-1] if offsets else None
+
+def _append_segment_message(session_id, message, max_tokens):
+    """Append one message to a session segment, recording any trimmed prefix.
+
+    Returns (live messages, manifest fields for the segment).
+    """
+    path = _segment_path(session_id)
+    state = _load_segment(path)
+    created = state["signature"] is None
+    live = state["live"]
+    live.append(message)
+    dropped, state["total"] = _drop_oldest(
+        live, state["total"] + message["tokens"], max_tokens
     )
+    records = [message]
+    if dropped:
+        state["trimmed"] += dropped
+        records.append({"trimmed": state["trimmed"]})
+    if state["torn"]:
+        # Close the torn line so the new records are not glued onto it.
+        with path.open("ab") as fh:
+            fh.write(b"\n")
+        state["torn"] = False
+    state["offset"] = _write_lines(path, records, "a")[0]
+    state["signature"] = _file_signature(path)
+    if state["trimmed"] >= SEGMENT_COMPACT_MIN and state["trimmed"] >= len(live):
+        _compact_segment(path)
+    fields = {
+        "tokens": state["total"],
+        "offset": state["offset"],
+        "size": state["signature"][1],
+        "mtime_ns": state["signature"][0],
+        "created": created,
+    }
+    return list(live), fields
+
+def migrate_sessions_to_segments():
+    """Split CHAT_SESSIONS_FILE into one segment file per session."""
+    try:
+        data = _read_json(CHAT_SESSIONS_FILE)
+    except FileNotFoundError:
+        return []
+    # Like every segment mutation, on the writer thread that owns the cache.
+    futures = []
+    for session_id, messages in data.items():
+        path = _segment_path(session_id)
+        futures.append(_writer.call(path, functools.partial(_replace_segment, path, messages)))
+    for future in futures:
+        future.result()
+    return list(data.keys())
+
+def _replace_segment(path, messages):
+    """Overwrite the segment at path with messages, dropping its cached state."""
+    _write_lines(path, messages, "w")
+    _segment_cache.pop(path, None)
+
+def _manifest_path():
+    """Return the session manifest sidecar of the current CHAT_STORAGE."""
+    if CHAT_STORAGE == "jsonl":
+        return CHAT_SESSIONS_DIR.with_name(CHAT_SESSIONS_DIR.name + ".segments.manifest.json")
+    return CHAT_SESSIONS_FILE.with_name(CHAT_SESSIONS_FILE.stem + ".manifest.json")
+
+def _manifest_source():
+    """Return a JSON-able signature of the chat storage.
+
+    For CHAT_SESSIONS_FILE its (mtime_ns, size). For segments, the count,
+    total size and newest mtime of the segment files: another process
+    appending to a segment changes those but not the directory's mtime.
+    """
+    if CHAT_STORAGE != "jsonl":
+        sig = _file_signature(CHAT_SESSIONS_FILE)
+        return None if sig is None else list(sig)
+    try:
+        with os.scandir(CHAT_SESSIONS_DIR) as it:
+            stats = [e.stat() for e in it if e.name.endswith(".jsonl")]
+    except FileNotFoundError:
+        return None
+    return [
+        len(stats),
+        sum(st.st_size for st in stats),
+        max((st.st_mtime_ns for st in stats), default=0),
+    ]
+
+def _timestamp(seconds=None):
+    """Return an ISO timestamp (to the second) for seconds since the epoch, or now."""
+    moment = datetime.now() if seconds is None else datetime.fromtimestamp(seconds)
+    return moment.isoformat(timespec="seconds")
+
+def _session_meta(messages, **fields):
+    """Manifest entry rebuilt from a session's stored messages.
+
+    Append times were never stored, so first_ts stays None; tokens is None
+    if some message predates stored token counts.
+    """
+    counts = [m.get("tokens") for m in messages]
+    meta = {
+        "messages": len(messages),
+        "tokens": None if None in counts else sum(counts),
+        "first_ts": None,
+        "last_ts": None,
+    }
+    meta.update(fields)
+    return meta
+
+def _scan_sessions():
+    """Build the session manifest by reading every stored session."""
+    sessions = {}
+    if CHAT_STORAGE == "jsonl":
+        paths = CHAT_SESSIONS_DIR.glob("*.jsonl") if CHAT_SESSIONS_DIR.is_dir() else []
+        for path in paths:
+            live, _ = _read_segment(path)
+            st = path.stat()
+            sessions[unquote(path.stem)] = _session_meta(
+                live, last_ts=_timestamp(st.st_mtime), offset=None, size=st.st_size
+            )
+    else:
+        try:
+            data = _read_json(CHAT_SESSIONS_FILE)
+        except FileNotFoundError:
+            data = {}
+        for session_id, messages in data.items():
+            sessions[session_id] = _session_meta(messages)
+    return {"source": _manifest_source(), "sessions": sessions}
+
+def rebuild_session_manifest():
+    """Rebuild the session manifest from the session files; return its sessions.
+
+    Fields the files cannot tell (first_ts, and last_ts or the latest
+    message offset where unknown) are kept from the previous manifest.
+    """
+    def mutate(doc):
+        previous = doc.get("sessions", {})
+        doc = _scan_sessions()
+        for session_id, meta in doc["sessions"].items():
+            prev = previous.get(session_id)
+            if not prev:
+                continue
+            meta["first_ts"] = prev.get("first_ts")
+            meta["last_ts"] = max(filter(None, (meta["last_ts"], prev.get("last_ts"))), default=None)
+            if "offset" in meta and meta.get("size") == prev.get("size"):
+                meta["offset"] = prev.get("offset")
+        return doc, doc["sessions"]
+    return _update_json(_manifest_path(), mutate)
+
+def _read_session_manifest():
+    """Return the manifest's sessions, rebuilding it if missing or stale.
+
+    The manifest records the chat storage's signature at its last update, so
+    session files changed behind data_manager's back (or written before the
+    manifest existed) trigger one full rebuild.
+    """
+    try:
+        doc = _read_json(_manifest_path())
+    except FileNotFoundError:
+        doc = None
+    if doc is None or doc.get("source") != _manifest_source():
+        return rebuild_session_manifest()
+    return doc["sessions"]
+
+def _advance_source(source, meta, size, mtime_ns):
+    """The segment signature after one segment changed from meta's size to size.
+
+    Adjusts the stored signature instead of scanning every segment, so a
+    change by another process since it was stored still shows as stale.
+    """
+    count, total, newest = source or (0, 0, 0)
+    if meta is None:
+        count += 1
+    return [count, total + size - ((meta or {}).get("size") or 0), max(newest, mtime_ns)]
+
+def _record_session(session_id, messages, tokens, created=False, mtime_ns=None, **fields):
+    """Update session_id's manifest entry after an append; return it.
+
+    created marks the append that started the session, which sets first_ts.
+    Segment appends pass the segment's new size and mtime_ns.
+    """
+    now = _timestamp()
+
+    def mutate(doc):
+        # A manifest rebuilt just now (default=_scan_sessions) already lists
+        # this session, without the fields only the append knows.
+        previous = doc["sessions"].get(session_id)
+        meta = dict(previous or {"first_ts": None})
+        if created:
+            meta["first_ts"] = now
+        meta.update(messages=len(messages), tokens=tokens, last_ts=now, **fields)
+        doc["sessions"][session_id] = meta
+        if mtime_ns is None:
+            doc["source"] = _manifest_source()
+        else:
+            doc["source"] = _advance_source(doc.get("source"), previous, fields["size"], mtime_ns)
+        return doc, meta
+    return _update_json(_manifest_path(), mutate, default=_scan_sessions)
+
+# tiktoken is imported on first use so importing data_manager stays cheap.
+_encoder = None
+
+def get_encoder():
+    """Return the shared tiktoken encoder, building it on first use."""
+    global _encoder
+    if _encoder is None:
+        import tiktoken
+
+        _encoder = tiktoken.encoding_for_model("gpt-4")
+    return _encoder
+
+def set_encoder(encoder):
+    """Use encoder (e.g. one cached by the UI) instead of building one."""
+    global _encoder
+    _encoder = encoder
+
+def count_tokens(text):
+    """Return the token count of text."""
+    return len(get_encoder().encode(text or ""))
+
+def message_tokens(message):
+    """Return a message's stored token count, encoding only if it is missing."""
+    tokens = message.get("tokens")
+    if tokens is None:
+        tokens = count_tokens(message.get("text", ""))
+    return tokens
+
+def _drop_oldest(window, total, max_tokens):
+    """Pop messages off the front of a deque until total fits max_tokens.
+
+    Returns (number dropped, new total); costs O(dropped).
+    """
+    dropped = 0
+    while window and total > max_tokens:
+        total -= message_tokens(window.popleft())
+        dropped += 1
+    return dropped, total
+
+def trim_messages(messages, max_tokens=600000):
+    """Trim oldest messages so total token count does not exceed max_tokens."""
+    window = deque(messages)
+    total = sum(message_tokens(m) for m in window)
+    _drop_oldest(window, total, max_tokens)
+    return list(window)
+
+class StorageBackend:
+    """Interface behind the public data_manager functions.
+
+    Messages passed to append_message already carry their token count.
+    vocab_store() returns an object with the VocabStore methods.
+    """
+
+    def load_vocab(self):
+        raise NotImplementedError
+
+    def save_vocab(self, vocab_list):
+        raise NotImplementedError
+
+    def vocab_store(self):
+        raise NotImplementedError
+
+    def latest_taught_on(self):
+        """Return the most recent valid 'taught_on' date, or None."""
+        raise NotImplementedError
+
+    def load_memory(self):
+        raise NotImplementedError
+
+    def save_memory(self, memory_dict):
+        raise NotImplementedError
+
+    def append_memory(self, date_str, entry_dict):
+        raise NotImplementedError
+
+    def memory_checkpoints(self, start=None, end=None):
+        """Return checkpoint records dated start..end, oldest first."""
+        raise NotImplementedError
+
+    def latest_memory(self):
+        """Return the most recent checkpoint record, or None."""
+        raise NotImplementedError
+
+    def list_sessions(self):
+        raise NotImplementedError
+
+    def session_manifest(self):
+        """Return {session_id: metadata} without reading message text."""
+        raise NotImplementedError
+
+    def load_session(self, session_id):
+        raise NotImplementedError
+
+    def append_message(self, session_id, message, max_tokens):
+        raise NotImplementedError
+
+    def get_response_id(self, session_id):
+        raise NotImplementedError
+
+    def set_response_id(self, session_id, response_id):
+        raise NotImplementedError
+
+    def get_summary(self, session_id):
+        raise NotImplementedError
+
+    def set_summary(self, session_id, summary):
+        raise NotImplementedError
+
+# path -> VocabStore, so a monkeypatched VOCAB_FILE gets its own store.
+_vocab_stores = {}
+# checkpoint log path -> MemoryLog, likewise for MEMORY_FILE.
+_memory_logs = {}
+
+class JsonBackend(StorageBackend):
+    """The JSON files (and optional JSONL chat segments) under BASE_DIR."""
+
+    def load_vocab(self):
+        return _read_vocab_file(VOCAB_FILE)
+
+    def save_vocab(self, vocab_list):
+        _write_vocab_file(VOCAB_FILE, vocab_list)
+        store = _vocab_stores.get(VOCAB_FILE)
+        if store is not None:
+            store.invalidate()
+
+    def vocab_store(self):
+        store = _vocab_stores.get(VOCAB_FILE)
+        if store is None:
+            store = _vocab_stores[VOCAB_FILE] = VocabStore(VOCAB_FILE)
+        return store
+
+    def latest_taught_on(self):
+        dates = []
+        for entry in load_vocab():
+            taught = entry.get("taught_on")
+            if taught:
+                try:
+                    dates.append(date.fromisoformat(taught))
+                except ValueError:
+                    continue
+        return max(dates) if dates else None
+
+    def memory_log(self):
+        path = _memory_log_path()
+        log = _memory_logs.get(path)
+        if log is None:
+            log = _memory_logs[path] = MemoryLog(path, legacy_path=MEMORY_FILE)
+        return log
+
+    def load_memory(self):
+        return self.memory_log().load()
+
+    def save_memory(self, memory_dict):
+        log = self.memory_log()
+        _writer.call(log.path, lambda: log.replace(memory_dict)).result()
+
+    def append_memory(self, date_str, entry_dict):
+        log = self.memory_log()
+        _writer.call(log.path, lambda: log.append(date_str, entry_dict)).result()
+
+    def memory_checkpoints(self, start=None, end=None):
+        return self.memory_log().checkpoints(start, end)
+
+    def latest_memory(self):
+        return self.memory_log().latest()
+
+    def list_sessions(self):
+        sessions = self.session_manifest()
+        if CHAT_STORAGE == "jsonl":
+            return sorted(sessions)
+        return list(sessions)
+
+    def session_manifest(self):
+        return _read_session_manifest()
+
+    def load_session(self, session_id):
+        if CHAT_STORAGE == "jsonl":
+            # The cached deque is appended to and trimmed on the writer
+            # thread, so it is copied there too.
+            path = _segment_path(session_id)
+            return _writer.call(path, lambda: list(_load_segment(path)["live"])).result()
+        try:
+            data = _read_json(CHAT_SESSIONS_FILE)
+        except FileNotFoundError:
+            return []
+        return data.get(session_id, [])
+
+    def append_message(self, session_id, message, max_tokens):
+        if CHAT_STORAGE == "jsonl":
+            # Serialized on the writer thread so the cached segment state
+            # is never updated by two threads at once.
+            live, fields = _writer.call(
+                _segment_path(session_id),
+                lambda: _append_segment_message(session_id, message, max_tokens),
+            ).result()
+            _record_session(session_id, live, **fields)
+            return live
+
+        def mutate(data):
+            created = session_id not in data
+            session = data.get(session_id, [])
+            for old in session:
+                # Backfill counts for history written before they were stored.
+                if "tokens" not in old:
+                    old["tokens"] = message_tokens(old)
+            session.append(message)
+            session = trim_messages(session, max_tokens=max_tokens)
+            data[session_id] = session
+            return data, (session, created)
+        session, created = _update_json(CHAT_SESSIONS_FILE, mutate)
+        _record_session(session_id, session, sum(m["tokens"] for m in session), created=created)
+        return session
+
+    def _load_chat_state(self):
+        try:
+            return _read_json(CHAT_STATE_FILE)
+        except FileNotFoundError:
+            return {}
+
+    def get_response_id(self, session_id):
+        return self._load_chat_state().get(session_id, {}).get("response_id")
+
+    def set_response_id(self, session_id, response_id):
+        if response_id is None and session_id not in self._load_chat_state():
+            return
+
+        def mutate(state):
+            state.setdefault(session_id, {})["response_id"] = response_id
+            return state, None
+        _update_json(CHAT_STATE_FILE, mutate)
+
+    def get_summary(self, session_id):
+        return self._load_chat_state().get(session_id, {}).get("summary")
+
+    def set_summary(self, session_id, summary):
+        def mutate(state):
+            state.setdefault(session_id, {})["summary"] = summary
+            return state, None
+        _update_json(CHAT_STATE_FILE, mutate)
+
+_json_backend = JsonBackend()
+# SQLITE_FILE -> SqliteBackend
+_sqlite_backends = {}
+# VOCAB_BINARY_FILE -> vocab_binary.BinaryBackend
+_binary_backends = {}
+
+def get_backend():
+    """Return the backend selected by STORAGE_BACKEND."""
+    if STORAGE_BACKEND == "sqlite":
+        backend = _sqlite_backends.get(SQLITE_FILE)
+        if backend is None:
+            import sqlite_backend
+
+            backend = _sqlite_backends[SQLITE_FILE] = sqlite_backend.SqliteBackend(SQLITE_FILE)
+        return backend
+    if STORAGE_BACKEND == "binary":
+        backend = _binary_backends.get(VOCAB_BINARY_FILE)
+        if backend is None:
+            import vocab_binary
+
+            backend = _binary_backends[VOCAB_BINARY_FILE] = vocab_binary.BinaryBackend(VOCAB_BINARY_FILE)
+        return backend
+    if STORAGE_BACKEND != "json":
+        raise ValueError(f"Unknown storage backend: {STORAGE_BACKEND!r}")
+    return _json_backend
+
+def load_vocab():
+    """Load the vocabulary list."""
+    return get_backend().load_vocab()
+
+def save_vocab(vocab_list):
+    """Replace the stored vocabulary with vocab_list."""
+    get_backend().save_vocab(vocab_list)
+
+def vocab_store():
+    """Return the shared vocabulary store (see VocabStore) of the backend."""
+    return get_backend().vocab_store()
+
+def due_cards(n, offset=0):
+    """Return up to n vocabulary entries due for review today."""
+    return vocab_store().due_cards(n, offset=offset)
+
+def due_count():
+    """Return the number of vocabulary entries due for review today."""
+    return vocab_store().due_count()
+
+def record_review(root, quality, defer=False):
+    """Record a flashcard review (SM-2 quality 0-5) for root.
+
+    defer=True batches the write with other reviews (see flush_vocab).
+    """
+    return vocab_store().review(root, quality, defer=defer)
+
+def flush_vocab():
+    """Write any deferred vocabulary changes of every open store."""
+    stores = list(_vocab_stores.values())
+    stores += [backend.vocab_store() for backend in _sqlite_backends.values()]
+    return sum(store.flush() for store in stores)
+
+# atexit runs in reverse order: flush deferred reviews, then drain the writer.
+atexit.register(_writer.close)
+atexit.register(flush_vocab)
 
 def is_new_word(root_word):
     """Return True if root_word not already present in vocab (case-insensitive)."""
-    vocab = load_vocab()
-    lower = root_word.lower()
-    return not any(entry.get("root", "").lower() == lower for entry in vocab)
+    return not vocab_store().contains(root_word)
 
 def days_since_last_batch():
-    """Return number of days since the most recent 'taught_on' date in vocab.json."""
-    vocab = load_vocab()
-    dates = []
-    for entry in vocab:
-        taught = entry.get("taught_on")
-        if taught:
-            try:
-                dates.append(date.fromisoformat(taught))
-            except ValueError:
-                continue
-    if not dates:
+    """Return number of days since the most recent 'taught_on' date in the vocabulary."""
+    last = get_backend().latest_taught_on()
+    if last is None:
         return math.inf
-    last = max(dates)
     return (date.today() - last).days
 
+def load_memory():
+    """Load memory checkpoints as a {date: entry} dict."""
+    return get_backend().load_memory()
+
+def save_memory(memory_dict):
+    """Replace the stored memory checkpoints with memory_dict."""
+    get_backend().save_memory(memory_dict)
+    bump_version("memory")
+
 def append_memory(date_str, entry_dict):
-    """Add an entry to memory.json under the given date key."""
-    memory = load_memory()
-    memory[date_str] = entry_dict
-    save_memory(memory)
+    """Add a memory checkpoint under the given date key.
+
+    Earlier checkpoints, including those of the same date, are kept;
+    load_memory() returns the last one written per date.
+    """
+    get_backend().append_memory(date_str, entry_dict)
+    bump_version("memory")
+
+def memory_checkpoints(start=None, end=None):
+    """Return checkpoints dated start..end (ISO dates, inclusive; None is open), oldest first.
+
+    Each is a {"date", "at", "entry"} record; "at" is the time it was
+    written (None for checkpoints imported from memory.json).
+    """
+    return get_backend().memory_checkpoints(start, end)
+
+def recent_memory(days, today=None):
+    """Return the checkpoints of the last days calendar days (today included), oldest first."""
+    today = today or date.today()
+    return memory_checkpoints(start=(today - timedelta(days=days - 1)).isoformat())
+
+def latest_memory():
+    """Return the most recent checkpoint record, or None."""
+    return get_backend().latest_memory()
 
 def list_sessions():
-    """List all chat session IDs in chat_sessions.json."""
-    try:
-        data = json.loads(CHAT_SESSIONS_FILE.read_text(encoding="utf-8"))
-    except FileNotFoundError:
-        return []
-    return list(data.keys())
+    """List all chat session IDs."""
+    return get_backend().list_sessions()
+
+def session_manifest():
+    """Return {session_id: metadata} for all sessions, without reading messages.
+
+    Metadata holds messages and tokens (the live, trimmed history),
+    first_ts / last_ts (ISO times of the first and latest append) and, for
+    jsonl segments, offset (where the latest message's line starts) and size
+    (the segment's length in bytes).
+    """
+    return get_backend().session_manifest()
+
+def recent_sessions(n=None, offset=0):
+    """Return up to n (session_id, metadata) pairs, latest activity first, skipping offset."""
+    ordered = sorted(
+        session_manifest().items(), key=lambda item: item[1].get("last_ts") or "", reverse=True
+    )
+    return ordered[offset:None if n is None else offset + n]
 
 def load_session(session_id):
     """Load the message list for a given session_id."""
-    try:
-        data = json.loads(CHAT_SESSIONS_FILE.read_text(encoding="utf-8"))
-    except FileNotFoundError:
-        return []
-    return data.get(session_id, [])
-
-def trim_messages(messages, max_tokens=600000):
-    """Trim oldest messages so total token count does not exceed max_tokens."""
-    enc = tiktoken.encoding_for_model("gpt-4")
-    counts = [len(enc.encode(m.get("text", ""))) for m in messages]
-    total = sum(counts)
-    trimmed = messages.copy()
-    trimmed_counts = counts.copy()
-    while trimmed and total > max_tokens:
-        total -= trimmed_counts.pop(0)
-        trimmed.pop(0)
-    return trimmed
+    return get_backend().load_session(session_id)
 
 def append_message(session_id, role, text, max_tokens=600000):
     """Append a message to a chat session, trimming history by token count."""
+    message = {"role": role, "text": text, "tokens": count_tokens(text)}
+    session = get_backend().append_message(session_id, message, max_tokens)
+    bump_version("sessions")
+    return session
+
+def get_response_id(session_id):
+    """Return the stored Responses API id of the session's last reply, or None."""
+    return get_backend().get_response_id(session_id)
+
+def set_response_id(session_id, response_id):
+    """Store (or clear, with None) the session's last Responses API id."""
+    get_backend().set_response_id(session_id, response_id)
+
+def load_staged_batch():
+    """Return the staged (prefetched) vocabulary batch, or None."""
     try:
-        data = json.loads(CHAT_SESSIONS_FILE.read_text(encoding="utf-8"))
+        return _read_json(STAGED_BATCH_FILE)
     except FileNotFoundError:
-        data = {}
-    session = data.get(session_id, [])
-    session.append({"role": role, "text": text})
-    session = trim_messages(session, max_tokens=max_tokens)
-    data[session_id] = session
-    CHAT_SESSIONS_FILE.write_text(
-        json.dumps(data, indent=2, ensure_ascii=False), encoding="utf-8"
-    )
-    return session
+        return None
+
+def save_staged_batch(batch):
+    """Stage batch ({"words": [...], ...}) for the next generate_new_batch."""
+    _replace_json(STAGED_BATCH_FILE, batch)
+
+def clear_staged_batch():
+    """Discard the staged batch."""
+    _writer.call(STAGED_BATCH_FILE, lambda: STAGED_BATCH_FILE.unlink(missing_ok=True)).result()
+
+def get_summary(session_id):
+    """Return the session's rolling summary dict (see tutor), or None."""
+    return get_backend().get_summary(session_id)
+
+def set_summary(session_id, summary):
+    """Store the session's rolling summary dict."""
+    get_backend().set_summary(session_id, summary)
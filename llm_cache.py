@@ -0,0 +1,174 @@
+"""Disk-backed LLM response cache with LRU eviction and an offline replay mode."""
+
+import hashlib
+import json
+import os
+import tempfile
+import threading
+from pathlib import Path
+from types import SimpleNamespace
+
+BASE_DIR = Path(__file__).resolve().parent
+CACHE_DIR = BASE_DIR / ".llm_cache"
+# Total size of cached responses before the least recently used are evicted.
+MAX_CACHE_BYTES = 50 * 1024 * 1024
+
+# "off" always calls the API, "on" serves hits and stores misses, and
+# "replay" serves only from the cache (raising CacheMiss otherwise).
+CACHE_MODE = os.environ.get("GERMAN_TUTOR_LLM_CACHE", "off")
+
+# Request fields that determine the response; everything else (stream,
+# store, tools, ...) is ignored so streamed and plain calls share entries.
+KEY_FIELDS = ("model", "input", "instructions", "text", "reasoning", "previous_response_id")
+
+# Running total of cached bytes per cache directory, so put() only scans
+# the directory once per process and again when it actually evicts.
+_sizes = {}
+_sizes_lock = threading.Lock()
+
+
+class CacheMiss(LookupError):
+    """Raised in replay mode when a request has no cached response."""
+
+
+class CachedEvent:
+    """Minimal stand-in for a Responses API stream event."""
+
+    def __init__(self, type, delta=None, response=None):
+        self.type = type
+        self.delta = delta
+        self.response = response
+
+
+def cache_key(request):
+    """Return the cache key (sha256 hex) for a responses.create kwargs dict."""
+    material = {field: request.get(field) for field in KEY_FIELDS}
+    blob = json.dumps(material, sort_keys=True, ensure_ascii=False, default=str)
+    return hashlib.sha256(blob.encode("utf-8")).hexdigest()
+
+
+def _entry_path(key):
+    return CACHE_DIR / f"{key}.json"
+
+
+def get(key):
+    """Return the cached payload for key, marking it recently used, or None."""
+    path = _entry_path(key)
+    try:
+        payload = json.loads(path.read_text(encoding="utf-8"))
+    except (FileNotFoundError, ValueError):
+        return None
+    # mtime doubles as the LRU clock.
+    os.utime(path)
+    return payload
+
+
+def put(key, payload):
+    """Store payload under key and evict old entries past MAX_CACHE_BYTES."""
+    CACHE_DIR.mkdir(parents=True, exist_ok=True)
+    path = _entry_path(key)
+    data = json.dumps(payload, ensure_ascii=False).encode("utf-8")
+    # A temp file per write: concurrent puts of one key must not share it.
+    with tempfile.NamedTemporaryFile(dir=CACHE_DIR, prefix=path.name, suffix=".tmp", delete=False) as fh:
+        fh.write(data)
+    tmp = fh.name
+    with _sizes_lock:
+        if CACHE_DIR not in _sizes:
+            _sizes[CACHE_DIR] = _scan()[1]
+        try:
+            replaced = path.stat().st_size
+        except FileNotFoundError:
+            replaced = 0
+        os.replace(tmp, path)
+        _sizes[CACHE_DIR] += len(data) - replaced
+        if _sizes[CACHE_DIR] <= MAX_CACHE_BYTES:
+            return
+    evict()
+
+
+def _scan():
+    """Return ([(mtime_ns, size, path)], total bytes) for the cache entries."""
+    entries = []
+    total = 0
+    for path in CACHE_DIR.glob("*.json"):
+        try:
+            st = path.stat()
+        except FileNotFoundError:
+            continue
+        entries.append((st.st_mtime_ns, st.st_size, path))
+        total += st.st_size
+    return entries, total
+
+
+def evict(max_bytes=None):
+    """Delete least recently used entries until the cache fits max_bytes."""
+    max_bytes = MAX_CACHE_BYTES if max_bytes is None else max_bytes
+    with _sizes_lock:
+        entries, total = _scan()
+        entries.sort()
+        for _, size, path in entries:
+            if total <= max_bytes:
+                break
+            path.unlink(missing_ok=True)
+            total -= size
+        _sizes[CACHE_DIR] = total
+
+
+def _payload(response):
+    """Extract what callers use from a Responses API result."""
+    usage = getattr(response, "usage", None)
+    return {
+        "id": getattr(response, "id", None),
+        "output_text": response.output_text,
+        "usage": {
+            "input_tokens": getattr(usage, "input_tokens", 0) or 0,
+            "output_tokens": getattr(usage, "output_tokens", 0) or 0,
+        },
+    }
+
+
+def _response(payload):
+    """Rebuild a response-like object from a cached payload."""
+    return SimpleNamespace(
+        id=payload.get("id"),
+        output_text=payload["output_text"],
+        usage=SimpleNamespace(**payload.get("usage", {})),
+        cached=True,
+    )
+
+
+def _replay_stream(response):
+    """Yield stream events equivalent to a cached response."""
+    yield CachedEvent("response.output_text.delta", delta=response.output_text)
+    yield CachedEvent("response.completed", response=response)
+
+
+def _recording_stream(stream, key):
+    """Pass stream events through and cache the completed response."""
+    try:
+        for event in stream:
+            if event.type == "response.completed":
+                put(key, _payload(event.response))
+            yield event
+    finally:
+        close = getattr(stream, "close", None)
+        if close is not None:
+            close()
+
+
+def cached_create(create, **request):
+    """Call create(**request) through the cache according to CACHE_MODE."""
+    if CACHE_MODE == "off":
+        return create(**request)
+    key = cache_key(request)
+    payload = get(key)
+    if payload is not None:
+        response = _response(payload)
+        return _replay_stream(response) if request.get("stream") else response
+    if CACHE_MODE == "replay":
+        raise CacheMiss(f"No cached response for request {key[:12]}")
+    result = create(**request)
+    if request.get("stream"):
+        return _recording_stream(result, key)
+    put(key, _payload(result))
+    return result
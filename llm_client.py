@@ -0,0 +1,236 @@
+"""Resilient wrapper around the OpenAI client.
+
+build_openai_client() returns an OpenAI client on a shared, tuned HTTP
+connection pool. ResilientClient wraps any client so responses.create gets
+a per-call deadline and jittered exponential retries on retryable errors
+(timeouts, connection errors, 408/409/429/5xx). hedged() runs an idempotent
+call and, if it has not finished after the observed p95 latency, fires a
+second identical call and returns whichever result arrives first.
+
+The openai package is imported lazily, like in tutor.
+"""
+
+import random
+import threading
+import time
+from collections import deque
+from concurrent.futures import FIRST_COMPLETED, ThreadPoolExecutor, wait
+
+# Connection pool shared by every request of the process.
+POOL_MAX_CONNECTIONS = 20
+POOL_MAX_KEEPALIVE = 10
+POOL_KEEPALIVE_EXPIRY = 30.0
+CONNECT_TIMEOUT = 5.0
+# Longest single attempt, and the default deadline across all attempts.
+ATTEMPT_TIMEOUT = 120.0
+CALL_DEADLINE = 300.0
+MAX_RETRIES = 4
+BACKOFF_BASE = 0.5
+BACKOFF_MAX = 8.0
+RETRY_STATUSES = frozenset({408, 409, 429, 500, 502, 503, 504})
+# Hedge after the observed p95 latency of the call kind (clamped to these
+# bounds), or after HEDGE_DELAY_DEFAULT until HEDGE_MIN_SAMPLES are seen.
+HEDGE_DELAY_DEFAULT = 30.0
+HEDGE_DELAY_MIN = 1.0
+HEDGE_DELAY_MAX = 120.0
+HEDGE_MIN_SAMPLES = 10
+LATENCY_WINDOW = 200
+
+# Number of second requests hedged() has started.
+hedges_started = 0
+
+
+def _http_client():
+    """A pooled HTTP client of the flavour the installed openai SDK uses."""
+    import openai
+
+    if hasattr(openai, "DefaultHttpx2Client"):
+        # SDK releases built on httpx2 instead of httpx.
+        import httpx2 as httpx
+
+        factory = openai.DefaultHttpx2Client
+    else:
+        import httpx
+
+        factory = openai.DefaultHttpxClient
+    return factory(
+        limits=httpx.Limits(
+            max_connections=POOL_MAX_CONNECTIONS,
+            max_keepalive_connections=POOL_MAX_KEEPALIVE,
+            keepalive_expiry=POOL_KEEPALIVE_EXPIRY,
+        ),
+        timeout=httpx.Timeout(ATTEMPT_TIMEOUT, connect=CONNECT_TIMEOUT),
+    )
+
+
+def build_openai_client(**kwargs):
+    """Return an OpenAI client on the tuned pool; retries are left to ResilientClient."""
+    from openai import OpenAI
+
+    kwargs.setdefault("http_client", _http_client())
+    kwargs.setdefault("max_retries", 0)
+    return OpenAI(**kwargs)
+
+
+def is_retryable(exc):
+    """True for timeouts, connection failures and retryable HTTP statuses."""
+    if getattr(exc, "status_code", None) in RETRY_STATUSES:
+        return True
+    if isinstance(exc, (TimeoutError, ConnectionError)):
+        return True
+    try:
+        import openai
+    except ImportError:
+        return False
+    # APITimeoutError is a subclass of APIConnectionError.
+    return isinstance(exc, openai.APIConnectionError)
+
+
+def backoff_delay(attempt, exc=None):
+    """Full-jitter exponential backoff, honouring a Retry-After header."""
+    response = getattr(exc, "response", None)
+    headers = getattr(response, "headers", None) or {}
+    try:
+        retry_after = float(headers.get("retry-after"))
+    except (TypeError, ValueError):
+        retry_after = None
+    if retry_after is not None and 0 <= retry_after <= BACKOFF_MAX:
+        return retry_after
+    return random.uniform(0, min(BACKOFF_MAX, BACKOFF_BASE * 2 ** attempt))
+
+
+def call_with_retries(call, deadline=None, max_retries=None):
+    """Run call(timeout) until it succeeds, retrying retryable errors.
+
+    Each attempt gets the time left before the deadline (capped at
+    ATTEMPT_TIMEOUT); the last error is raised once retries or time run out.
+    """
+    deadline = CALL_DEADLINE if deadline is None else deadline
+    max_retries = MAX_RETRIES if max_retries is None else max_retries
+    end = time.monotonic() + deadline
+    attempt = 0
+    while True:
+        remaining = end - time.monotonic()
+        try:
+            return call(min(ATTEMPT_TIMEOUT, max(remaining, 0.001)))
+        except Exception as exc:
+            if attempt >= max_retries or not is_retryable(exc):
+                raise
+            pause = backoff_delay(attempt, exc)
+            if time.monotonic() + pause >= end:
+                raise
+            time.sleep(pause)
+            attempt += 1
+
+
+class _Responses:
+    def __init__(self, responses, deadline):
+        self._responses = responses
+        self._deadline = deadline
+
+    def create(self, deadline=None, **kwargs):
+        """responses.create with a per-call deadline and retries."""
+        return call_with_retries(
+            lambda timeout: self._responses.create(timeout=timeout, **kwargs),
+            deadline=self._deadline if deadline is None else deadline,
+        )
+
+
+class ResilientClient:
+    """Client wrapper whose responses.create retries within a deadline.
+
+    Everything else is delegated to the wrapped client.
+    """
+
+    def __init__(self, client, deadline=None):
+        self._client = client
+        self.responses = _Responses(client.responses, deadline)
+
+    def __getattr__(self, name):
+        return getattr(self._client, name)
+
+
+class LatencyWindow:
+    """The most recent LATENCY_WINDOW latencies of one kind of call."""
+
+    def __init__(self, size=None):
+        self._samples = deque(maxlen=size or LATENCY_WINDOW)
+        self._lock = threading.Lock()
+
+    def add(self, seconds):
+        with self._lock:
+            self._samples.append(seconds)
+
+    def __len__(self):
+        return len(self._samples)
+
+    def quantile(self, q):
+        with self._lock:
+            ordered = sorted(self._samples)
+        if not ordered:
+            return None
+        return ordered[min(len(ordered) - 1, int(q * len(ordered)))]
+
+
+_latencies = {}
+_pool = None
+_pool_lock = threading.Lock()
+
+
+def latency_window(kind):
+    """Return the LatencyWindow recording hedged calls of kind."""
+    with _pool_lock:
+        window = _latencies.get(kind)
+        if window is None:
+            window = _latencies[kind] = LatencyWindow()
+        return window
+
+
+def hedge_delay(kind):
+    """Seconds to wait before hedging a call of kind."""
+    window = latency_window(kind)
+    if len(window) < HEDGE_MIN_SAMPLES:
+        return HEDGE_DELAY_DEFAULT
+    return min(HEDGE_DELAY_MAX, max(HEDGE_DELAY_MIN, window.quantile(0.95)))
+
+
+def _executor():
+    global _pool
+    with _pool_lock:
+        if _pool is None:
+            _pool = ThreadPoolExecutor(max_workers=POOL_MAX_CONNECTIONS, thread_name_prefix="llm-hedge")
+        return _pool
+
+
+def _timed(call, window):
+    start = time.monotonic()
+    result = call()
+    window.add(time.monotonic() - start)
+    return result
+
+
+def hedged(call, kind, delay=None):
+    """Run the idempotent call(), hedging with a second call after delay.
+
+    delay defaults to hedge_delay(kind). The first successful result wins
+    (the slower call is left to finish in the background); if both fail,
+    the first error is raised.
+    """
+    global hedges_started
+    window = latency_window(kind)
+    delay = hedge_delay(kind) if delay is None else delay
+    pool = _executor()
+    first = pool.submit(_timed, call, window)
+    done, _ = wait([first], timeout=delay)
+    if done:
+        return first.result()
+    hedges_started += 1
+    pending = {first, pool.submit(_timed, call, window)}
+    error = None
+    while pending:
+        done, pending = wait(pending, return_when=FIRST_COMPLETED)
+        for future in done:
+            if future.exception() is None:
+                return future.result()
+            error = error or future.exception()
+    raise error
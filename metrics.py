@@ -0,0 +1,304 @@
+"""Lightweight tracing and metrics for LLM calls and file I/O.
+
+Instrumented code opens a span per operation::
+
+    with metrics.span("file.read", path=path.name) as span:
+        data = path.read_bytes()
+        span.add(bytes_read=len(data))
+
+Each finished span adds its latency to the operation's histogram and its
+values (bytes_read, bytes_written, input_tokens, output_tokens,
+reasoning_tokens, cache_hits, cache_misses, ...) to the operation's totals.
+summary() reports count, errors, p50/p95/p99 latency and totals per
+operation; spans can also be streamed to a JSONL file and the summary is
+available in Prometheus text format (prometheus_text / serve_prometheus).
+
+When disabled (the default) span() returns a shared no-op object, so
+instrumented code pays one function call and no timing or locking.
+"""
+
+import json
+import os
+import random
+import threading
+import time
+
+# GERMAN_TUTOR_METRICS=1 enables collection; GERMAN_TUTOR_METRICS_FILE also
+# enables it and appends one JSON line per span to that file.
+METRICS_FILE = os.environ.get("GERMAN_TUTOR_METRICS_FILE") or None
+ENABLED = os.environ.get("GERMAN_TUTOR_METRICS", "") not in ("", "0", "off") or METRICS_FILE is not None
+# Port for app.py to serve Prometheus metrics on (None = no endpoint).
+PROMETHEUS_PORT = int(os.environ["GERMAN_TUTOR_METRICS_PORT"]) if os.environ.get("GERMAN_TUTOR_METRICS_PORT") else None
+# Latency samples kept per operation (reservoir sampled beyond this).
+MAX_SAMPLES = 10_000
+QUANTILES = (0.5, 0.95, 0.99)
+
+_lock = threading.Lock()
+_ops = {}
+_jsonl = None
+
+
+class _OpStats:
+    __slots__ = ("count", "errors", "latency_sum", "samples", "totals")
+
+    def __init__(self):
+        self.count = 0
+        self.errors = 0
+        self.latency_sum = 0.0
+        self.samples = []
+        self.totals = {}
+
+
+class Span:
+    """One timed operation; use as a context manager or call finish()."""
+
+    __slots__ = ("op", "labels", "values", "start", "done")
+
+    def __init__(self, op, labels):
+        self.op = op
+        self.labels = labels
+        self.values = {}
+        self.done = False
+        self.start = time.perf_counter()
+
+    def add(self, **values):
+        """Add numeric values (bytes, tokens, hits, ...) to this span."""
+        for key, value in values.items():
+            self.values[key] = self.values.get(key, 0) + value
+
+    def finish(self, error=None):
+        """Record the span once; error is an exception class or name."""
+        if self.done:
+            return
+        self.done = True
+        if isinstance(error, type):
+            error = error.__name__
+        _record(self, time.perf_counter() - self.start, error)
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc, tb):
+        self.finish(exc_type)
+        return False
+
+    def __bool__(self):
+        return True
+
+
+class _NullSpan:
+    """Shared do-nothing span handed out while metrics are disabled."""
+
+    __slots__ = ()
+
+    def add(self, **values):
+        pass
+
+    def finish(self, error=None):
+        pass
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc, tb):
+        return False
+
+    def __bool__(self):
+        return False
+
+
+NULL_SPAN = _NullSpan()
+
+
+def span(op, **labels):
+    """Start a span for op, or return NULL_SPAN when metrics are disabled."""
+    if not ENABLED:
+        return NULL_SPAN
+    return Span(op, labels)
+
+
+def enable(jsonl_path=None):
+    """Turn collection on, optionally streaming spans to jsonl_path."""
+    global ENABLED, METRICS_FILE, _jsonl
+    with _lock:
+        if _jsonl is not None:
+            _jsonl.close()
+            _jsonl = None
+        METRICS_FILE = str(jsonl_path) if jsonl_path is not None else None
+        ENABLED = True
+
+
+def disable():
+    """Turn collection off and close the JSONL file."""
+    global ENABLED, _jsonl
+    with _lock:
+        ENABLED = False
+        if _jsonl is not None:
+            _jsonl.close()
+            _jsonl = None
+
+
+def reset():
+    """Forget everything recorded so far."""
+    with _lock:
+        _ops.clear()
+
+
+def _record(span, latency, error):
+    global _jsonl
+    with _lock:
+        stats = _ops.get(span.op)
+        if stats is None:
+            stats = _ops[span.op] = _OpStats()
+        stats.count += 1
+        stats.latency_sum += latency
+        if error is not None:
+            stats.errors += 1
+        if len(stats.samples) < MAX_SAMPLES:
+            stats.samples.append(latency)
+        else:
+            slot = random.randrange(stats.count)
+            if slot < MAX_SAMPLES:
+                stats.samples[slot] = latency
+        for key, value in span.values.items():
+            stats.totals[key] = stats.totals.get(key, 0) + value
+        if METRICS_FILE is not None:
+            if _jsonl is None:
+                _jsonl = open(METRICS_FILE, "a", encoding="utf-8", buffering=1)
+            event = {"ts": time.time(), "op": span.op, "latency_ms": latency * 1000}
+            event.update(span.labels)
+            event.update(span.values)
+            if error is not None:
+                event["error"] = error
+            _jsonl.write(json.dumps(event, ensure_ascii=False, default=str) + "\n")
+
+
+def _quantile(ordered, q):
+    """Nearest-rank quantile of an already sorted list."""
+    if not ordered:
+        return 0.0
+    index = min(len(ordered) - 1, max(0, int(round(q * len(ordered))) - 1))
+    return ordered[index]
+
+
+def summary():
+    """Return {op: {count, errors, mean_ms, p50_ms, p95_ms, p99_ms, <totals>}}."""
+    with _lock:
+        ops = {op: (s.count, s.errors, s.latency_sum, sorted(s.samples), dict(s.totals))
+               for op, s in _ops.items()}
+    result = {}
+    for op, (count, errors, latency_sum, ordered, totals) in sorted(ops.items()):
+        row = {"count": count, "errors": errors, "mean_ms": latency_sum / count * 1000}
+        for q in QUANTILES:
+            row[f"p{int(q * 100)}_ms"] = _quantile(ordered, q) * 1000
+        row.update(totals)
+        result[op] = row
+    return result
+
+
+def _metric_name(key):
+    return "german_tutor_" + "".join(c if c.isalnum() else "_" for c in key) + "_total"
+
+
+def prometheus_text():
+    """Render the current metrics in the Prometheus text exposition format."""
+    with _lock:
+        ops = {op: (s.count, s.errors, s.latency_sum, sorted(s.samples), dict(s.totals))
+               for op, s in _ops.items()}
+    lines = [
+        "# HELP german_tutor_op_latency_seconds Latency of instrumented operations.",
+        "# TYPE german_tutor_op_latency_seconds summary",
+    ]
+    counters = {}
+    for op, (count, errors, latency_sum, ordered, totals) in sorted(ops.items()):
+        label = json.dumps(op)
+        for q in QUANTILES:
+            lines.append(f'german_tutor_op_latency_seconds{{op={label},quantile="{q}"}} {_quantile(ordered, q)}')
+        lines.append(f"german_tutor_op_latency_seconds_sum{{op={label}}} {latency_sum}")
+        lines.append(f"german_tutor_op_latency_seconds_count{{op={label}}} {count}")
+        counters.setdefault("errors", []).append((label, errors))
+        for key, value in totals.items():
+            counters.setdefault(key, []).append((label, value))
+    for key, rows in sorted(counters.items()):
+        name = _metric_name(key)
+        lines.append(f"# TYPE {name} counter")
+        lines.extend(f"{name}{{op={label}}} {value}" for label, value in rows)
+    return "\n".join(lines) + "\n"
+
+
+def serve_prometheus(port, host="127.0.0.1"):
+    """Serve prometheus_text() at http://host:port/metrics from a daemon thread."""
+    from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+    class Handler(BaseHTTPRequestHandler):
+        def do_GET(self):
+            if self.path.split("?")[0] not in ("/", "/metrics"):
+                self.send_error(404)
+                return
+            body = prometheus_text().encode("utf-8")
+            self.send_response(200)
+            self.send_header("Content-Type", "text/plain; version=0.0.4; charset=utf-8")
+            self.send_header("Content-Length", str(len(body)))
+            self.end_headers()
+            self.wfile.write(body)
+
+        def log_message(self, format, *args):
+            pass
+
+    server = ThreadingHTTPServer((host, port), Handler)
+    threading.Thread(target=server.serve_forever, name="metrics-http", daemon=True).start()
+    return server
+
+
+def add_usage(span, response):
+    """Add a Responses API result's token usage and cache status to span."""
+    usage = getattr(response, "usage", None)
+    details = getattr(usage, "output_tokens_details", None)
+    span.add(
+        input_tokens=getattr(usage, "input_tokens", 0) or 0,
+        output_tokens=getattr(usage, "output_tokens", 0) or 0,
+        reasoning_tokens=getattr(details, "reasoning_tokens", 0) or 0,
+    )
+    if getattr(response, "cached", False):
+        span.add(cache_hits=1)
+    else:
+        span.add(cache_misses=1)
+
+
+def _traced_stream(span, stream):
+    """Pass stream events through, finishing span when the stream ends."""
+    error = None
+    try:
+        for event in stream:
+            if event.type == "response.completed":
+                add_usage(span, event.response)
+            yield event
+    except BaseException as exc:
+        error = type(exc)
+        raise
+    finally:
+        close = getattr(stream, "close", None)
+        if close is not None:
+            close()
+        span.finish(error)
+
+
+def trace_llm(call, stream=False, op="llm.responses.create", **labels):
+    """Run call() (a responses.create request) under a span.
+
+    Streams are traced until they finish, with usage taken from the
+    response.completed event.
+    """
+    current = span(op, **labels)
+    if not current:
+        return call()
+    try:
+        result = call()
+    except BaseException as exc:
+        current.finish(type(exc))
+        raise
+    if stream:
+        return _traced_stream(current, result)
+    add_usage(current, result)
+    current.finish()
+    return result
@@ -0,0 +1,191 @@
+"""Model providers behind tutor's LLM calls.
+
+A provider offers structured JSON generation (generate_json) and chat
+replies (respond, optionally streamed). Replies use the Responses API shape
+tutor already consumes: an object with output_text, id and usage, or for
+streams an iterator of events whose type is "response.output_text.delta"
+(with delta) or "response.completed" (with response).
+
+OpenAIProvider goes through tutor's cached, traced, resilient client;
+OllamaProvider talks to a local Ollama server; FakeProvider answers
+deterministically in-process for tests and load tests.
+"""
+
+import hashlib
+import json
+import os
+import random
+import re
+import time
+from types import SimpleNamespace
+
+import metrics
+from llm_cache import CachedEvent as Event
+
+OLLAMA_HOST = os.environ.get("OLLAMA_HOST", "http://127.0.0.1:11434")
+
+
+def _response(text, id=None, input_tokens=0, output_tokens=0):
+    return SimpleNamespace(
+        id=id,
+        output_text=text,
+        usage=SimpleNamespace(input_tokens=input_tokens, output_tokens=output_tokens),
+    )
+
+
+class Provider:
+    """Interface implemented by every model provider."""
+
+    # Whether respond() can continue from previous_response_id.
+    supports_chaining = False
+
+    def generate_json(self, model, messages, schema, name, **options):
+        """Return (parsed JSON object matching schema, output tokens)."""
+        raise NotImplementedError
+
+    def respond(self, model, messages, previous_response_id=None, stream=False, **options):
+        """Return a reply to messages, or an event iterator with stream=True."""
+        raise NotImplementedError
+
+
+class OpenAIProvider(Provider):
+    """The OpenAI Responses API, called through create (tutor._create_response)."""
+
+    supports_chaining = True
+
+    def __init__(self, create):
+        self._create = create
+
+    def generate_json(self, model, messages, schema, name, hedge=None, reasoning=None, **options):
+        if reasoning is not None:
+            options["reasoning"] = reasoning
+        response = self._create(
+            hedge=hedge,
+            model=model,
+            input=messages,
+            text={"format": {"type": "json_schema", "name": name, "strict": True, "schema": schema}},
+            tools=[],
+            store=True,
+            **options,
+        )
+        usage = getattr(response, "usage", None)
+        return json.loads(response.output_text), getattr(usage, "output_tokens", 0) or 0
+
+    def respond(self, model, messages, previous_response_id=None, stream=False, **options):
+        if previous_response_id:
+            options.update(previous_response_id=previous_response_id, truncation="auto")
+        if stream:
+            options["stream"] = True
+        return self._create(model=model, input=messages, **options)
+
+
+class OllamaProvider(Provider):
+    """A local Ollama server (structured output via its JSON-schema format)."""
+
+    def __init__(self, host=None):
+        import ollama
+
+        self._client = ollama.Client(host=host or OLLAMA_HOST)
+
+    def generate_json(self, model, messages, schema, name, **options):
+        with metrics.span("llm.ollama.chat", model=model) as span:
+            response = self._client.chat(model=model, messages=messages, format=schema)
+            span.add(
+                input_tokens=response.prompt_eval_count or 0,
+                output_tokens=response.eval_count or 0,
+            )
+        return json.loads(response.message.content), response.eval_count or 0
+
+    def respond(self, model, messages, previous_response_id=None, stream=False, **options):
+        if stream:
+            return self._stream(model, messages)
+        with metrics.span("llm.ollama.chat", model=model) as span:
+            response = self._client.chat(model=model, messages=messages)
+            span.add(
+                input_tokens=response.prompt_eval_count or 0,
+                output_tokens=response.eval_count or 0,
+            )
+        return _response(
+            response.message.content,
+            input_tokens=response.prompt_eval_count or 0,
+            output_tokens=response.eval_count or 0,
+        )
+
+    def _stream(self, model, messages):
+        parts = []
+        chunks = self._client.chat(model=model, messages=messages, stream=True)
+        with metrics.span("llm.ollama.chat", model=model, stream=True) as span:
+            for chunk in chunks:
+                text = chunk.message.content
+                if text:
+                    parts.append(text)
+                    yield Event("response.output_text.delta", delta=text)
+                if chunk.done:
+                    span.add(
+                        input_tokens=chunk.prompt_eval_count or 0,
+                        output_tokens=chunk.eval_count or 0,
+                    )
+        yield Event("response.completed", response=_response("".join(parts)))
+
+
+class FakeProvider(Provider):
+    """Deterministic in-process provider: the same request gets the same reply.
+
+    latency (seconds) is slept per call to imitate a remote model.
+    """
+
+    def __init__(self, latency=0.0):
+        self.latency = latency
+        self.calls = 0
+
+    def _rng(self, model, messages):
+        self.calls += 1
+        if self.latency:
+            time.sleep(self.latency)
+        blob = json.dumps([model, messages], sort_keys=True, ensure_ascii=False)
+        digest = hashlib.sha256(blob.encode("utf-8")).hexdigest()
+        return random.Random(digest), digest[:12]
+
+    def generate_json(self, model, messages, schema, name, **options):
+        rng, digest = self._rng(model, messages)
+        if name != "german_sentences":
+            raise ValueError(f"FakeProvider cannot generate {name!r}")
+        match = re.search(r"Generate (\d+)", messages[-1]["content"])
+        count = int(match.group(1)) if match else 1
+        words = []
+        for i in range(count):
+            root = f"Fakewort{digest[:6]}{i}"
+            words.append({
+                "root": root,
+                "english": f"fake word {rng.randint(0, 9999)}",
+                "examples": {
+                    "present": [f"Ich sehe {root}."],
+                    "past": [f"Ich sah {root}."],
+                    "future": [f"Ich werde {root} sehen."],
+                },
+            })
+        return {"german_sentences": words}, 20 * count
+
+    def respond(self, model, messages, previous_response_id=None, stream=False, **options):
+        _, digest = self._rng(model, messages)
+        last = next((m["content"] for m in reversed(messages) if m["role"] == "user"), "")
+        reply = f"Gut! Du hast gesagt: {last}"
+        response = _response(reply, id=f"fake_{digest}", output_tokens=len(reply.split()))
+        if not stream:
+            return response
+        deltas = [word + " " for word in reply.split(" ")]
+        deltas[-1] = deltas[-1].rstrip()
+        events = [Event("response.output_text.delta", delta=d) for d in deltas]
+        events.append(Event("response.completed", response=response))
+        return iter(events)
+
+
+def create_provider(name, openai_create=None):
+    """Build the provider called name ("openai", "ollama" or "fake")."""
+    if name == "openai":
+        return OpenAIProvider(openai_create)
+    if name == "ollama":
+        return OllamaProvider()
+    if name == "fake":
+        return FakeProvider()
+    raise ValueError(f"Unknown model provider: {name!r}")
@@ -0,0 +1,201 @@
+"""Vectorized quiz generation over a columnar view of the vocabulary.
+
+QuizIndex turns the vocabulary into NumPy columns once (gloss ids, due
+dates, ease, known flag and similarity groups); tutor keeps one per
+vocabulary version. Building it is a single pass over the entries; a quiz
+then costs O(questions * log(vocab)):
+
+* questions are sampled without replacement, weighted by review state
+  (due and hard cards more often, known cards rarely), by binary search in
+  a cumulative weight array cached per day;
+* distractors are distinct English glosses other than the answer's, drawn
+  by index, so two entries sharing a gloss never show it twice;
+* "hard" distractors come from the answer's similarity group: same part of
+  speech and word ending, else the same batch, else the same part of speech.
+
+numpy is imported with this module, which tutor only loads on first quiz.
+"""
+
+from datetime import date
+
+import numpy as np
+
+import data_manager
+
+DISTRACTORS = 3
+# How many of the distractors are drawn from the answer's similarity groups.
+HARD_DISTRACTORS = 1
+# Similarity groups tried in order for hard distractors.
+HARD_TIERS = ("similar", "batch", "pos")
+# Sampling weight by review state, divided by ease / DEFAULT_EASE (cards the
+# student struggles with have a lower ease and come up more often).
+WEIGHT_DUE = 4.0
+WEIGHT_LEARNING = 1.0
+WEIGHT_KNOWN = 0.25
+# Letters of the German root compared for the "similar" group.
+ENDING_LENGTH = 3
+VERB_ENDINGS = ("en", "ern", "eln")
+
+
+def part_of_speech(root, english):
+    """Rough part of speech: German nouns are capitalized, verbs end in -en."""
+    root = root or ""
+    if (english or "").lower().startswith("to "):
+        return "verb"
+    if root[:1].isupper():
+        return "noun"
+    if root.lower().endswith(VERB_ENDINGS):
+        return "verb"
+    return "other"
+
+
+class _Groups:
+    """Members of each group id, stored CSR-style: order[starts[g]:starts[g + 1]]."""
+
+    def __init__(self, ids):
+        self.ids = ids
+        self.order = np.argsort(ids, kind="stable").astype(np.int32)
+        counts = np.bincount(ids) if len(ids) else np.zeros(0, dtype=np.int64)
+        self.starts = np.concatenate(([0], np.cumsum(counts)))
+
+    def members(self, pos):
+        group = self.ids[pos]
+        return self.order[self.starts[group]:self.starts[group + 1]]
+
+
+def _intern(table, key):
+    value = table.get(key)
+    if value is None:
+        value = table[key] = len(table)
+    return value
+
+
+class QuizIndex:
+    """Columnar, read-only view of a vocabulary list for quiz generation."""
+
+    def __init__(self, entries):
+        n = len(entries)
+        glosses = {}
+        ordinals = {}
+        groups = {tier: {} for tier in HARD_TIERS}
+        self.roots = [None] * n
+        gloss = np.empty(n, dtype=np.int32)
+        due = np.empty(n, dtype=np.int32)
+        ease = np.empty(n, dtype=np.float32)
+        known = np.empty(n, dtype=bool)
+        group_ids = {tier: np.empty(n, dtype=np.int32) for tier in HARD_TIERS}
+        for pos, entry in enumerate(entries):
+            root = entry.get("root")
+            english = entry.get("english")
+            self.roots[pos] = root
+            gloss[pos] = _intern(glosses, english)
+            key = entry.get("due") or entry.get("taught_on") or ""
+            ordinal = ordinals.get(key)
+            if ordinal is None:
+                try:
+                    ordinal = date.fromisoformat(key).toordinal()
+                except ValueError:
+                    ordinal = 0  # No valid date: due now.
+                ordinals[key] = ordinal
+            due[pos] = ordinal
+            ease[pos] = entry.get("ease") or data_manager.DEFAULT_EASE
+            known[pos] = bool(entry.get("known"))
+            pos_tag = part_of_speech(root, english)
+            ending = (root or "").lower()[-ENDING_LENGTH:]
+            group_ids["similar"][pos] = _intern(groups["similar"], (pos_tag, ending))
+            group_ids["batch"][pos] = _intern(groups["batch"], entry.get("batch_id"))
+            group_ids["pos"][pos] = _intern(groups["pos"], pos_tag)
+        self.glosses = list(glosses)
+        self.gloss = gloss
+        self.due = due
+        self.ease = ease
+        self.known = known
+        self.groups = {tier: _Groups(ids) for tier, ids in group_ids.items()}
+        self._cumulative = None  # (today ordinal, cumulative weights)
+
+    def __len__(self):
+        return len(self.roots)
+
+    def weights(self, today=None):
+        """Sampling weight of every entry on today."""
+        today = (today or date.today()).toordinal()
+        weights = np.where(self.known, WEIGHT_KNOWN, WEIGHT_LEARNING)
+        weights = np.where(~self.known & (self.due <= today), WEIGHT_DUE, weights)
+        return weights * (data_manager.DEFAULT_EASE / self.ease)
+
+    def _cumulative_weights(self, today):
+        ordinal = (today or date.today()).toordinal()
+        if self._cumulative is None or self._cumulative[0] != ordinal:
+            self._cumulative = (ordinal, np.cumsum(self.weights(today)))
+        return self._cumulative[1]
+
+    def sample(self, k, today=None, rng=None):
+        """Positions of k distinct entries drawn by review-state weight."""
+        rng = rng or np.random.default_rng()
+        n = len(self)
+        if k >= n:
+            return rng.permutation(n)
+        cumulative = self._cumulative_weights(today)
+        total = cumulative[-1]
+        chosen = {}
+        for _ in range(16):
+            draws = np.searchsorted(cumulative, rng.random(2 * k) * total, side="right")
+            for pos in draws.tolist():
+                chosen.setdefault(min(pos, n - 1), None)
+            if len(chosen) >= k:
+                return np.fromiter(chosen, dtype=np.int64, count=len(chosen))[:k]
+        # A few entries hold nearly all the weight: sample exactly instead.
+        weights = np.diff(cumulative, prepend=0.0)
+        return rng.choice(n, size=k, replace=False, p=weights / total)
+
+    def _hard(self, pos, answer, count, rng):
+        """Up to count distinct gloss ids from pos's similarity groups."""
+        picked = []
+        for tier in HARD_TIERS:
+            members = self.groups[tier].members(pos)
+            if len(members) <= 1:
+                continue
+            if len(members) > 8 * count:
+                candidates = members[rng.integers(0, len(members), size=8 * count)]
+            else:
+                candidates = rng.permutation(members)
+            for gloss in self.gloss[candidates].tolist():
+                if gloss != answer and gloss not in picked:
+                    picked.append(gloss)
+                    if len(picked) == count:
+                        return picked
+        return picked
+
+    def quiz(self, n_questions, today=None, hard=None, rng=None):
+        """Return n_questions quiz questions as dicts (root, expected_answer, distractors)."""
+        if not len(self) or n_questions <= 0:
+            return []
+        rng = rng or np.random.default_rng()
+        hard = HARD_DISTRACTORS if hard is None else hard
+        positions = self.sample(min(n_questions, len(self)), today, rng)
+        answers = self.gloss[positions]
+        n_glosses = len(self.glosses)
+        count = min(DISTRACTORS, n_glosses - 1)
+        if n_glosses <= 4 * DISTRACTORS:
+            # Few glosses: a full permutation per question.
+            pool = np.argsort(rng.random((len(positions), n_glosses)), axis=1)
+        else:
+            pool = rng.integers(0, n_glosses, size=(len(positions), 3 * DISTRACTORS))
+        pool = np.where(pool == answers[:, None], -1, pool)
+        questions = []
+        for row, (pos, answer) in enumerate(zip(positions.tolist(), answers.tolist())):
+            picked = self._hard(pos, answer, min(hard, count), rng) if hard else []
+            candidates = pool[row].tolist()
+            while len(picked) < count:
+                for gloss in candidates:
+                    if gloss >= 0 and gloss != answer and gloss not in picked:
+                        picked.append(gloss)
+                        if len(picked) == count:
+                            break
+                candidates = rng.integers(0, n_glosses, size=2 * DISTRACTORS).tolist()
+            questions.append({
+                "root": self.roots[pos],
+                "expected_answer": self.glosses[answer],
+                "distractors": [self.glosses[g] for g in picked],
+            })
+        return questions
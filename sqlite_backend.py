@@ -0,0 +1,472 @@
+"""SQLite storage backend for German Tutor.
+
+The database runs in WAL mode with indexes on the vocabulary root, due and
+taught_on dates, the chat session id and the memory date, so point updates,
+appends and range queries touch single rows instead of rewriting files.
+Selected with data_manager.STORAGE_BACKEND = "sqlite".
+"""
+
+import json
+import sqlite3
+import threading
+from collections import OrderedDict, deque
+from datetime import date
+from pathlib import Path
+
+import data_manager
+
+# Sessions whose live history SqliteBackend keeps for append_message.
+CACHED_SESSIONS = 16
+
+SCHEMA = """
+CREATE TABLE IF NOT EXISTS vocab (
+    id INTEGER PRIMARY KEY AUTOINCREMENT,
+    root TEXT,
+    root_key TEXT NOT NULL,
+    taught_on TEXT,
+    due TEXT NOT NULL,
+    batch_id INTEGER,
+    data TEXT NOT NULL
+);
+CREATE INDEX IF NOT EXISTS vocab_root_key ON vocab (root_key);
+CREATE INDEX IF NOT EXISTS vocab_due ON vocab (due, id);
+CREATE INDEX IF NOT EXISTS vocab_taught_on ON vocab (taught_on);
+CREATE TABLE IF NOT EXISTS sessions (
+    session_id TEXT PRIMARY KEY,
+    tokens INTEGER NOT NULL DEFAULT 0,
+    response_id TEXT,
+    summary TEXT,
+    messages INTEGER NOT NULL DEFAULT 0,
+    first_ts TEXT,
+    last_ts TEXT
+);
+CREATE TABLE IF NOT EXISTS messages (
+    id INTEGER PRIMARY KEY AUTOINCREMENT,
+    session_id TEXT NOT NULL,
+    role TEXT NOT NULL,
+    text TEXT NOT NULL,
+    tokens INTEGER NOT NULL
+);
+CREATE INDEX IF NOT EXISTS messages_session ON messages (session_id, id);
+CREATE TABLE IF NOT EXISTS memory_log (
+    id INTEGER PRIMARY KEY AUTOINCREMENT,
+    date TEXT NOT NULL,
+    at TEXT,
+    data TEXT NOT NULL
+);
+CREATE INDEX IF NOT EXISTS memory_log_date ON memory_log (date, id);
+"""
+
+
+def _vocab_row(entry):
+    """Return the indexed column values followed by the JSON document."""
+    return (
+        entry.get("root"),
+        data_manager.normalize_root(entry.get("root")),
+        entry.get("taught_on"),
+        data_manager._due_key(entry),
+        entry.get("batch_id"),
+        json.dumps(dict(entry), ensure_ascii=False),
+    )
+
+
+def _entry(data):
+    return data_manager.VocabEntry.from_dict(json.loads(data))
+
+
+class SqliteVocabStore:
+    """VocabStore counterpart whose lookups and updates are SQL queries.
+
+    Reviews are written immediately as single-row updates, so there is
+    nothing to defer: pending() is always 0 and flush() is a no-op.
+    """
+
+    def __init__(self, backend):
+        self.backend = backend
+
+    def invalidate(self):
+        """Nothing is cached in memory."""
+
+    def entries(self):
+        """Return all entries in insertion order (a fresh list)."""
+        rows = self.backend.connect().execute("SELECT data FROM vocab ORDER BY id")
+        return [_entry(data) for (data,) in rows]
+
+    def contains(self, root):
+        row = self.backend.connect().execute(
+            "SELECT 1 FROM vocab WHERE root_key = ? LIMIT 1",
+            (data_manager.normalize_root(root),),
+        ).fetchone()
+        return row is not None
+
+    def get(self, root):
+        row = self.backend.connect().execute(
+            "SELECT data FROM vocab WHERE root_key = ? ORDER BY id LIMIT 1",
+            (data_manager.normalize_root(root),),
+        ).fetchone()
+        return None if row is None else _entry(row[0])
+
+    def add_many(self, entries):
+        """Insert entries whose roots are new in one transaction; return them."""
+        conn = self.backend.connect()
+        added = []
+        seen = set()
+        with conn:
+            for entry in entries:
+                key = data_manager.normalize_root(entry.get("root"))
+                if not key or key in seen or self.contains(key):
+                    continue
+                seen.add(key)
+                if not isinstance(entry, data_manager.VocabEntry):
+                    entry = data_manager.VocabEntry(entry)
+                conn.execute(
+                    "INSERT INTO vocab (root, root_key, taught_on, due, batch_id, data)"
+                    " VALUES (?, ?, ?, ?, ?, ?)",
+                    _vocab_row(entry),
+                )
+                added.append(entry)
+        if added:
+            data_manager.bump_version("vocab")
+        return added
+
+    def due_count(self, today=None):
+        today = (today or date.today()).isoformat()
+        return self.backend.connect().execute(
+            "SELECT COUNT(*) FROM vocab WHERE due <= ?", (today,)
+        ).fetchone()[0]
+
+    def due_cards(self, n, today=None, offset=0):
+        today = (today or date.today()).isoformat()
+        rows = self.backend.connect().execute(
+            "SELECT data FROM vocab WHERE due <= ? ORDER BY due, id LIMIT ? OFFSET ?",
+            (today, n, offset),
+        )
+        return [_entry(data) for (data,) in rows]
+
+    def review(self, root, quality, today=None, defer=False):
+        """Apply an SM-2 review to root and update its row; return the entry."""
+        conn = self.backend.connect()
+        with conn:
+            row = conn.execute(
+                "SELECT id, data FROM vocab WHERE root_key = ? ORDER BY id LIMIT 1",
+                (data_manager.normalize_root(root),),
+            ).fetchone()
+            if row is None:
+                raise KeyError(root)
+            entry = data_manager.review_entry(_entry(row[1]), quality, today)
+            conn.execute(
+                "UPDATE vocab SET due = ?, data = ? WHERE id = ?",
+                (data_manager._due_key(entry), json.dumps(dict(entry), ensure_ascii=False), row[0]),
+            )
+        data_manager.bump_version("vocab")
+        return entry
+
+    def pending(self):
+        return 0
+
+    def flush(self):
+        return 0
+
+    def max_batch_id(self):
+        row = self.backend.connect().execute("SELECT MAX(batch_id) FROM vocab").fetchone()
+        return row[0] or 0
+
+    def recent_roots(self, n):
+        rows = self.backend.connect().execute(
+            "SELECT root FROM vocab WHERE root IS NOT NULL ORDER BY id DESC LIMIT ?", (n,)
+        )
+        return [root for (root,) in rows]
+
+
+class SqliteBackend(data_manager.StorageBackend):
+    """Storage backend keeping vocabulary, chats and memory in one SQLite file."""
+
+    def __init__(self, path):
+        self.path = Path(path)
+        self._local = threading.local()
+        self._store = SqliteVocabStore(self)
+        # session_id -> (id of its last message row, deque of live messages),
+        # so an append returns the history without re-reading it; least
+        # recently appended first, at most CACHED_SESSIONS of them.
+        self._sessions = OrderedDict()
+        self._append_lock = threading.Lock()
+        with self.connect() as conn:
+            conn.executescript(SCHEMA)
+            columns = {row[1] for row in conn.execute("PRAGMA table_info(sessions)")}
+            if "summary" not in columns:
+                # Databases created before rolling summaries existed.
+                conn.execute("ALTER TABLE sessions ADD COLUMN summary TEXT")
+            if "messages" not in columns:
+                # Databases created before the session manifest columns.
+                conn.execute("ALTER TABLE sessions ADD COLUMN messages INTEGER NOT NULL DEFAULT 0")
+                conn.execute("ALTER TABLE sessions ADD COLUMN first_ts TEXT")
+                conn.execute("ALTER TABLE sessions ADD COLUMN last_ts TEXT")
+                conn.execute(
+                    "UPDATE sessions SET messages ="
+                    " (SELECT count(*) FROM messages m WHERE m.session_id = sessions.session_id)"
+                )
+            tables = {row[0] for row in conn.execute("SELECT name FROM sqlite_master WHERE type = 'table'")}
+            if "memory" in tables:
+                # Databases from before the checkpoint log kept one row per date.
+                conn.execute(
+                    "INSERT INTO memory_log (date, data) SELECT date, data FROM memory ORDER BY date"
+                )
+                conn.execute("DROP TABLE memory")
+
+    def connect(self):
+        """Return this thread's connection, opening it on first use."""
+        conn = getattr(self._local, "conn", None)
+        if conn is None:
+            conn = sqlite3.connect(self.path, timeout=30)
+            conn.execute("PRAGMA journal_mode=WAL")
+            conn.execute("PRAGMA synchronous=NORMAL")
+            self._local.conn = conn
+        return conn
+
+    def load_vocab(self):
+        return self._store.entries()
+
+    def save_vocab(self, vocab_list):
+        conn = self.connect()
+        with conn:
+            conn.execute("DELETE FROM vocab")
+            conn.executemany(
+                "INSERT INTO vocab (root, root_key, taught_on, due, batch_id, data)"
+                " VALUES (?, ?, ?, ?, ?, ?)",
+                [_vocab_row(entry) for entry in vocab_list],
+            )
+        data_manager.bump_version("vocab")
+
+    def vocab_store(self):
+        return self._store
+
+    def latest_taught_on(self):
+        rows = self.connect().execute(
+            "SELECT taught_on FROM vocab WHERE taught_on IS NOT NULL ORDER BY taught_on DESC"
+        )
+        for (taught,) in rows:
+            try:
+                return date.fromisoformat(taught)
+            except ValueError:
+                continue
+        return None
+
+    def load_memory(self):
+        return {r["date"]: r["entry"] for r in self.memory_checkpoints()}
+
+    def save_memory(self, memory_dict):
+        conn = self.connect()
+        with conn:
+            conn.execute("DELETE FROM memory_log")
+            conn.executemany(
+                "INSERT INTO memory_log (date, data) VALUES (?, ?)",
+                [(key, json.dumps(memory_dict[key], ensure_ascii=False)) for key in sorted(memory_dict)],
+            )
+
+    def append_memory(self, date_str, entry_dict):
+        conn = self.connect()
+        with conn:
+            conn.execute(
+                "INSERT INTO memory_log (date, at, data) VALUES (?, ?, ?)",
+                (date_str, data_manager._timestamp(), json.dumps(entry_dict, ensure_ascii=False)),
+            )
+
+    def memory_checkpoints(self, start=None, end=None):
+        # Only the bounds given, so the query is a range scan of memory_log_date.
+        clauses, params = [], []
+        if start is not None:
+            clauses.append("date >= ?")
+            params.append(start)
+        if end is not None:
+            clauses.append("date <= ?")
+            params.append(end)
+        where = " WHERE " + " AND ".join(clauses) if clauses else ""
+        rows = self.connect().execute(
+            f"SELECT date, at, data FROM memory_log{where} ORDER BY date, id", params
+        )
+        return [{"date": key, "at": at, "entry": json.loads(data)} for key, at, data in rows]
+
+    def latest_memory(self):
+        row = self.connect().execute(
+            "SELECT date, at, data FROM memory_log ORDER BY date DESC, id DESC LIMIT 1"
+        ).fetchone()
+        return None if row is None else {"date": row[0], "at": row[1], "entry": json.loads(row[2])}
+
+    def list_sessions(self):
+        rows = self.connect().execute("SELECT session_id FROM sessions ORDER BY rowid")
+        return [session_id for (session_id,) in rows]
+
+    def session_manifest(self):
+        rows = self.connect().execute(
+            "SELECT session_id, messages, tokens, first_ts, last_ts FROM sessions ORDER BY rowid"
+        )
+        return {
+            session_id: {"messages": messages, "tokens": tokens, "first_ts": first_ts, "last_ts": last_ts}
+            for session_id, messages, tokens, first_ts, last_ts in rows
+        }
+
+    def load_session(self, session_id):
+        rows = self.connect().execute(
+            "SELECT role, text, tokens FROM messages WHERE session_id = ? ORDER BY id",
+            (session_id,),
+        )
+        return [{"role": role, "text": text, "tokens": tokens} for role, text, tokens in rows]
+
+    def _cached_session(self, session_id, last_id):
+        """Return the live messages deque for session_id as of row last_id."""
+        cached = self._sessions.get(session_id)
+        if cached is not None and cached[0] == last_id:
+            return cached[1]
+        return deque(self.load_session(session_id))
+
+    def append_message(self, session_id, message, max_tokens):
+        """Insert one message row, deleting the oldest rows past max_tokens.
+
+        The returned history comes from a per-session cache that is only
+        re-read when another connection wrote the session in between.
+        """
+        conn = self.connect()
+        with self._append_lock:
+            with conn:
+                conn.execute("INSERT OR IGNORE INTO sessions (session_id) VALUES (?)", (session_id,))
+                last_id = conn.execute(
+                    "SELECT max(id) FROM messages WHERE session_id = ?", (session_id,)
+                ).fetchone()[0]
+                live = self._cached_session(session_id, last_id)
+                new_id = conn.execute(
+                    "INSERT INTO messages (session_id, role, text, tokens) VALUES (?, ?, ?, ?)",
+                    (session_id, message["role"], message["text"], message["tokens"]),
+                ).lastrowid
+                now = data_manager._timestamp()
+                total = conn.execute(
+                    "UPDATE sessions SET tokens = tokens + ?, messages = messages + 1,"
+                    " first_ts = coalesce(first_ts, ?), last_ts = ? WHERE session_id = ? RETURNING tokens",
+                    (message["tokens"], now, now, session_id),
+                ).fetchone()[0]
+                dropped = self._trim(conn, session_id, total, max_tokens) if total > max_tokens else 0
+            # Committed: bring the cached history up to date.
+            live.append(dict(message))
+            for _ in range(dropped):
+                live.popleft()
+            self._sessions[session_id] = (new_id, live)
+            self._sessions.move_to_end(session_id)
+            while len(self._sessions) > CACHED_SESSIONS:
+                self._sessions.popitem(last=False)
+            return list(live)
+
+    def _trim(self, conn, session_id, total, max_tokens):
+        """Delete the oldest messages until total fits; return how many.
+
+        Reads only the rows it deletes.
+        """
+        last_id = None
+        dropped = 0
+        rows = conn.execute(
+            "SELECT id, tokens FROM messages WHERE session_id = ? ORDER BY id",
+            (session_id,),
+        )
+        for msg_id, tokens in rows:
+            if total <= max_tokens:
+                break
+            total -= tokens
+            last_id = msg_id
+            dropped += 1
+        rows.close()
+        if last_id is not None:
+            conn.execute(
+                "DELETE FROM messages WHERE session_id = ? AND id <= ?", (session_id, last_id)
+            )
+            conn.execute(
+                "UPDATE sessions SET tokens = ?, messages = messages - ? WHERE session_id = ?",
+                (total, dropped, session_id),
+            )
+        return dropped
+
+    def get_response_id(self, session_id):
+        row = self.connect().execute(
+            "SELECT response_id FROM sessions WHERE session_id = ?", (session_id,)
+        ).fetchone()
+        return None if row is None else row[0]
+
+    def set_response_id(self, session_id, response_id):
+        conn = self.connect()
+        with conn:
+            if response_id is not None:
+                conn.execute("INSERT OR IGNORE INTO sessions (session_id) VALUES (?)", (session_id,))
+            conn.execute(
+                "UPDATE sessions SET response_id = ? WHERE session_id = ?", (response_id, session_id)
+            )
+
+    def get_summary(self, session_id):
+        row = self.connect().execute(
+            "SELECT summary FROM sessions WHERE session_id = ?", (session_id,)
+        ).fetchone()
+        return None if row is None or row[0] is None else json.loads(row[0])
+
+    def set_summary(self, session_id, summary):
+        conn = self.connect()
+        with conn:
+            conn.execute("INSERT OR IGNORE INTO sessions (session_id) VALUES (?)", (session_id,))
+            conn.execute(
+                "UPDATE sessions SET summary = ? WHERE session_id = ?",
+                (json.dumps(summary, ensure_ascii=False), session_id),
+            )
+
+
+def migrate_from_json(backend=None):
+    """Copy the JSON files (per data_manager's paths) into a SQLite backend.
+
+    Existing rows in the target are replaced. Returns per-table counts.
+    """
+    backend = backend or SqliteBackend(data_manager.SQLITE_FILE)
+    source = data_manager.JsonBackend()
+    vocab = source.load_vocab()
+    backend.save_vocab(vocab)
+    memory = source.memory_checkpoints()
+    conn = backend.connect()
+    manifest = source.session_manifest()
+    sessions = list(manifest)
+    message_count = 0
+    with conn:
+        conn.execute("DELETE FROM memory_log")
+        conn.executemany(
+            "INSERT INTO memory_log (date, at, data) VALUES (?, ?, ?)",
+            [(r["date"], r["at"], json.dumps(r["entry"], ensure_ascii=False)) for r in memory],
+        )
+        conn.execute("DELETE FROM messages")
+        conn.execute("DELETE FROM sessions")
+        for session_id in sessions:
+            messages = source.load_session(session_id)
+            rows = [
+                (session_id, m.get("role"), m.get("text", ""), data_manager.message_tokens(m))
+                for m in messages
+            ]
+            conn.executemany(
+                "INSERT INTO messages (session_id, role, text, tokens) VALUES (?, ?, ?, ?)", rows
+            )
+            summary = source.get_summary(session_id)
+            meta = manifest[session_id]
+            conn.execute(
+                "INSERT INTO sessions (session_id, tokens, response_id, summary, messages, first_ts, last_ts)"
+                " VALUES (?, ?, ?, ?, ?, ?, ?)",
+                (
+                    session_id,
+                    sum(r[3] for r in rows),
+                    source.get_response_id(session_id),
+                    None if summary is None else json.dumps(summary, ensure_ascii=False),
+                    len(rows),
+                    meta.get("first_ts"),
+                    meta.get("last_ts"),
+                ),
+            )
+            message_count += len(rows)
+    return {
+        "vocab": len(vocab),
+        "memory": len(memory),
+        "sessions": len(sessions),
+        "messages": message_count,
+    }
+
+
+if __name__ == "__main__":
+    print(json.dumps(migrate_from_json(), indent=2))
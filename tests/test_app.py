@@ -5,7 +5,6 @@ import os
 sys.path.insert(0, os.path.abspath(os.path.join(os.path.dirname(__file__), '..')))
 
 import random
-from datetime import date, datetime
 
 import pytest
 
@@ -14,6 +13,20 @@ import data_manager
 import tutor
 
 
+@pytest.fixture(autouse=True)
+def no_prefetch(monkeypatch):
+    monkeypatch.setattr(tutor, 'start_prefetch', lambda n, shards=None: None)
+
+
+@pytest.fixture(autouse=True)
+def clear_streamlit_caches():
+    app.st.cache_data.clear()
+    app.st.cache_resource.clear()
+    yield
+    app.st.cache_data.clear()
+    app.st.cache_resource.clear()
+
+
 class DummyColumn:
     """Dummy column to capture UI calls in run_flashcards."""
     def __init__(self):
@@ -31,20 +44,36 @@ class DummyColumn:
         return False
 
 
+def clicking(*labels, clicked=None):
+    """Button stub: the given labels are clicked and their on_click callbacks
+    are collected in clicked (or run at once, as if before the rerun)."""
+    def button(self, label, key=None, on_click=None, args=(), **kwargs):
+        if label not in labels:
+            return False
+        if on_click is not None:
+            if clicked is None:
+                on_click(*args)
+            else:
+                clicked.append((on_click, args))
+        return True
+    return button
+
+
 def test_main_mode_selector(monkeypatch):
     calls = []
     monkeypatch.setattr(app.st.sidebar, 'title', lambda t: None)
     monkeypatch.setattr(app.st.sidebar, 'radio', lambda label, options: 'Flashcards')
     monkeypatch.setattr(app, 'run_chat_tutor', lambda: calls.append('chat'))
     monkeypatch.setattr(app, 'run_flashcards', lambda: calls.append('flash'))
+    monkeypatch.setattr(app, 'bind_resources', lambda: calls.append('bind'))
     app.main()
-    assert calls == ['flash']
+    assert calls == ['bind', 'flash']
 
 
 def test_run_chat_tutor_session(monkeypatch):
     selected = []
-    monkeypatch.setattr(data_manager, 'list_sessions', lambda: ['s1'])
-    monkeypatch.setattr(app.st.sidebar, 'selectbox', lambda label, options: 's1')
+    monkeypatch.setattr(data_manager, 'recent_sessions', lambda: [('s1', {'messages': 0, 'tokens': 0})])
+    monkeypatch.setattr(app.st.sidebar, 'selectbox', lambda label, options, format_func=str: 's1')
     monkeypatch.setattr(data_manager, 'load_session', lambda sid: selected.append(sid) or [])
     # stub UI to skip actions
     monkeypatch.setattr(app.st, 'button', lambda *args, key=None, **kwargs: False)
@@ -54,8 +83,8 @@ def test_run_chat_tutor_session(monkeypatch):
 
 
 def test_run_chat_tutor_send(monkeypatch):
-    monkeypatch.setattr(data_manager, 'list_sessions', lambda: ['s1'])
-    monkeypatch.setattr(app.st.sidebar, 'selectbox', lambda label, options: 's1')
+    monkeypatch.setattr(data_manager, 'recent_sessions', lambda: [('s1', {'messages': 0, 'tokens': 0})])
+    monkeypatch.setattr(app.st.sidebar, 'selectbox', lambda label, options, format_func=str: 's1')
     monkeypatch.setattr(data_manager, 'load_session', lambda sid: [])
     # simulate user input and send click
     monkeypatch.setattr(app.st, 'text_input', lambda label, key=None: 'Hello')
@@ -63,17 +92,63 @@ def test_run_chat_tutor_send(monkeypatch):
         return key == 'send'
     monkeypatch.setattr(app.st, 'button', fake_button)
     called = []
-    monkeypatch.setattr(tutor, 'chat_session_interact', lambda sid, msg: called.append((sid, msg)) or 'Reply')
+
+    def fake_stream(sid, msg):
+        called.append((sid, msg))
+        yield 'Re'
+        yield 'ply'
+
+    monkeypatch.setattr(tutor, 'chat_session_stream', fake_stream)
     outputs = []
-    monkeypatch.setattr(app.st, 'markdown', lambda txt: outputs.append(txt))
+
+    class Placeholder:
+        def markdown(self, txt):
+            outputs.append(txt)
+
+    monkeypatch.setattr(app.st, 'empty', lambda: Placeholder())
     app.run_chat_tutor()
     assert called == [('s1', 'Hello')]
-    assert outputs == ['**Tutor:** Reply']
+    assert outputs == ['**Tutor:** Re', '**Tutor:** Reply']
+
+
+def test_reruns_reuse_cached_reads(monkeypatch):
+    loads = []
+    monkeypatch.setattr(data_manager, 'recent_sessions', lambda: loads.append('list') or [('s1', {})])
+    monkeypatch.setattr(data_manager, 'load_session', lambda sid: loads.append(sid) or [])
+    version = ('json', 0, None)
+    monkeypatch.setattr(data_manager, 'data_version', lambda kind: version)
+    monkeypatch.setattr(app.st.sidebar, 'selectbox', lambda label, options, format_func=str: 's1')
+    monkeypatch.setattr(app.st, 'button', lambda label, key=None, **kwargs: False)
+    app.run_chat_tutor()
+    app.run_chat_tutor()
+    assert loads == ['list', 's1']
+    # A write bumps the version, so the next rerun reads again.
+    version = ('json', 1, None)
+    app.run_chat_tutor()
+    assert loads == ['list', 's1', 'list', 's1']
+
+
+def test_new_session_id_is_stable_across_reruns(monkeypatch):
+    state = {}
+    monkeypatch.setattr(app.st, 'session_state', state)
+    monkeypatch.setattr(data_manager, 'recent_sessions', lambda: [])
+    loads = []
+    monkeypatch.setattr(data_manager, 'load_session', lambda sid: loads.append(sid) or [])
+    monkeypatch.setattr(data_manager, 'data_version', lambda kind: ('json', 0, None))
+    selected = 'New Session'
+    monkeypatch.setattr(app.st.sidebar, 'selectbox', lambda label, options, format_func=str: selected)
+    monkeypatch.setattr(app.st, 'button', lambda label, key=None, **kwargs: False)
+    app.run_chat_tutor()
+    app.run_chat_tutor()
+    assert len(loads) == 1 and state['new_session_id'] == loads[0]
+    selected = 's1'
+    app.run_chat_tutor()
+    assert 'new_session_id' not in state
 
 
 def test_run_chat_tutor_teach_and_quiz(monkeypatch):
-    monkeypatch.setattr(data_manager, 'list_sessions', lambda: [])
-    monkeypatch.setattr(app.st.sidebar, 'selectbox', lambda label, options: 'New Session')
+    monkeypatch.setattr(data_manager, 'recent_sessions', lambda: [])
+    monkeypatch.setattr(app.st.sidebar, 'selectbox', lambda label, options, format_func=str: 'New Session')
     monkeypatch.setattr(data_manager, 'load_session', lambda sid: [])
     teach_called = []
     quiz_called = []
@@ -95,7 +170,6 @@ def test_run_chat_tutor_teach_and_quiz(monkeypatch):
 
 
 def test_run_flashcards(monkeypatch):
-    today = date.today().isoformat()
     vocab = [{
         'root': 'Haus',
         'english': 'house',
@@ -103,17 +177,62 @@ def test_run_flashcards(monkeypatch):
         'last_reviewed': None,
         'known': False
     }]
-    monkeypatch.setattr(data_manager, 'load_vocab', lambda: vocab)
-    saved = []
-    monkeypatch.setattr(data_manager, 'save_vocab', lambda v: saved.append(v.copy()))
+    requested = []
+    monkeypatch.setattr(app.st, 'session_state', {})
+    monkeypatch.setattr(data_manager, 'due_count', lambda: 1)
+    monkeypatch.setattr(data_manager, 'due_cards', lambda n, offset=0: requested.append((n, offset)) or vocab)
+    reviews = []
+    monkeypatch.setattr(data_manager, 'record_review', lambda root, quality, defer=False: reviews.append((root, quality, defer)))
+    flushed = []
+    monkeypatch.setattr(data_manager, 'flush_vocab', lambda: flushed.append(True))
     dummy = DummyColumn()
     monkeypatch.setattr(app.st, 'columns', lambda n: [dummy] * n)
+    monkeypatch.setattr(app.st, 'caption', lambda txt: None)
     # simulate show/examples and known clicks
-    monkeypatch.setattr(DummyColumn, 'button', lambda self, label, key=None, **kwargs: label in ("Show Examples", "Known"))
+    monkeypatch.setattr(DummyColumn, 'button', clicking("Show Examples", "Known"))
     app.run_flashcards()
+    assert requested == [(app.FLASHCARDS_PER_PAGE, 0)]
     assert dummy.subheaders == ['Haus - house']
     assert vocab[0]['examples'] in dummy.writes
-    assert saved, "save_vocab should have been called"
-    updated = saved[-1][0]
-    assert updated['known'] is True
-    assert updated['last_reviewed'] == today
\ No newline at end of file
+    assert reviews == [('Haus', app.QUALITY_KNOWN, True)]
+    assert not flushed
+
+
+def test_run_flashcards_pages(monkeypatch):
+    page_size = app.FLASHCARDS_PER_PAGE
+    cards = [{'root': f'w{i}', 'english': str(i)} for i in range(page_size + 2)]
+    state = {}
+    monkeypatch.setattr(app.st, 'session_state', state)
+    monkeypatch.setattr(data_manager, 'due_count', lambda: len(cards))
+    monkeypatch.setattr(data_manager, 'due_cards', lambda n, offset=0: cards[offset:offset + n])
+    flushed = []
+    monkeypatch.setattr(data_manager, 'flush_vocab', lambda: flushed.append(True))
+    dummy = DummyColumn()
+    monkeypatch.setattr(app.st, 'columns', lambda n: [dummy] * n)
+    captions = []
+    monkeypatch.setattr(app.st, 'caption', lambda txt: captions.append(txt))
+    clicked = []
+    monkeypatch.setattr(DummyColumn, 'button', clicking('Next', clicked=clicked))
+    app.run_flashcards()
+    assert len(dummy.subheaders) == page_size
+    assert captions == [f'Page 1 of 2 ({page_size + 2} cards due)']
+    assert not flushed
+    # Clicking Next runs its callback, then the rerun shows page 2 at once.
+    on_click, args = clicked[0]
+    on_click(*args)
+    assert state['flash_page'] == 1 and flushed == [True]
+    dummy.subheaders.clear()
+    app.run_flashcards()
+    assert captions[-1] == f'Page 2 of 2 ({page_size + 2} cards due)'
+    assert dummy.subheaders == [f'w{i} - {i}' for i in range(page_size, page_size + 2)]
+
+
+def test_run_flashcards_nothing_due(monkeypatch):
+    monkeypatch.setattr(app.st, 'session_state', {})
+    monkeypatch.setattr(data_manager, 'due_count', lambda: 0)
+    monkeypatch.setattr(data_manager, 'due_cards', lambda n, offset=0: [])
+    monkeypatch.setattr(data_manager, 'flush_vocab', lambda: 0)
+    writes = []
+    monkeypatch.setattr(app.st, 'write', lambda v: writes.append(v))
+    app.run_flashcards()
+    assert writes and 'No cards are due' in writes[0]
@@ -0,0 +1,38 @@
+import sys
+import os
+
+# Ensure project root and benchmarks/ are on PYTHONPATH
+ROOT = os.path.abspath(os.path.join(os.path.dirname(__file__), '..'))
+sys.path.insert(0, ROOT)
+sys.path.insert(0, os.path.join(ROOT, 'benchmarks'))
+
+import data_manager
+import hot_paths
+import vocab_memory
+
+
+def test_hot_paths_smoke():
+    vocab_file = data_manager.VOCAB_FILE
+    results = hot_paths.run(vocab_sizes=[40], session_sizes=[10], memory_years=[1])
+    names = {r['name'] for r in results}
+    assert {'load_vocab', 'is_new_word', 'days_since_last_batch', 'prepare_quiz',
+            'generate_new_batch', 'trim_messages', 'append_message[json]',
+            'append_message[jsonl]', 'load_memory'} <= names
+    assert all(r['min_s'] >= 0 and r['repeat'] >= 3 for r in results)
+    # The sandbox restores the real paths.
+    assert data_manager.VOCAB_FILE == vocab_file
+
+
+def test_synthetic_data_shapes():
+    vocab = hot_paths.make_vocab(45)
+    assert len({data_manager.normalize_root(e['root']) for e in vocab}) == 45
+    assert max(e['taught_on'] for e in vocab) < data_manager.date.today().isoformat()
+    assert len(hot_paths.make_session(7)) == 7
+    assert len(hot_paths.make_memory(2)) == 730
+
+
+def test_vocab_memory_smoke():
+    results = vocab_memory.run(sizes=[50], runs=1)
+    assert {r['representation'] for r in results} == {'dict', 'VocabEntry'}
+    by_name = {r['representation']: r for r in results}
+    assert by_name['VocabEntry']['bytes_per_entry'] < by_name['dict']['bytes_per_entry']
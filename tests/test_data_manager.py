@@ -2,11 +2,13 @@ import sys
 import os
 import json
 import math
+import time
 from datetime import date, timedelta
 
 sys.path.insert(0, os.path.abspath(os.path.join(os.path.dirname(__file__), '..')))
 
 import pytest
+import tiktoken
 
 import data_manager
 
@@ -27,6 +29,33 @@ def test_load_save_vocab(tmp_path, monkeypatch):
         assert field in loaded[0]
 
 
+def test_vocab_entry_is_dict_compatible(tmp_path, monkeypatch):
+    import pickle
+
+    raw = {'root': 'Haus', 'english': 'house', 'due': '2024-01-02', 'note': 'extra'}
+    entry = data_manager.VocabEntry.from_dict(raw)
+    assert not hasattr(entry, '__dict__')
+    assert entry['root'] == 'Haus' and entry.get('note') == 'extra'
+    assert entry['examples'] == {} and entry['known'] is False
+    assert 'due' in entry and 'reps' not in entry and entry.get('reps') is None
+    with pytest.raises(KeyError):
+        entry['reps']
+    entry.update(reps=2, known=True)
+    del entry['note']
+    assert dict(entry) == {'root': 'Haus', 'english': 'house', 'taught_on': None, 'batch_id': None,
+                           'examples': {}, 'last_reviewed': None, 'known': True, 'due': '2024-01-02', 'reps': 2}
+    assert pickle.loads(pickle.dumps(entry)) == entry
+    lazy = data_manager.VocabEntry({'root': 'Baum'}, examples=lambda: {'present': ['Der Baum']})
+    assert lazy['examples'] == {'present': ['Der Baum']}
+    monkeypatch.setattr(data_manager, 'VOCAB_FILE', tmp_path / 'vocab.json')
+    data_manager.save_vocab([entry, lazy])
+    loaded = data_manager.load_vocab()
+    assert all(isinstance(e, data_manager.VocabEntry) for e in loaded)
+    assert loaded == [entry, lazy]
+    # Repeated date strings share one object.
+    assert loaded[0]['due'] is data_manager.VocabEntry.from_dict({'due': '2024-01-02'})['due']
+
+
 def test_load_save_memory(tmp_path, monkeypatch):
     mem_file = tmp_path / 'memory.json'
     monkeypatch.setattr(data_manager, 'MEMORY_FILE', mem_file)
@@ -36,13 +65,37 @@ def test_load_save_memory(tmp_path, monkeypatch):
     assert data_manager.load_memory() == mem
 
 
-def test_is_new_word(monkeypatch):
-    monkeypatch.setattr(data_manager, 'load_vocab', lambda: [{'root': 'Haus'}, {'root': 'Baum'}])
+def test_is_new_word(tmp_path, monkeypatch):
+    vocab_file = tmp_path / 'vocab.json'
+    vocab_file.write_text(json.dumps([{'root': 'Haus'}, {'root': 'Baum'}]), encoding='utf-8')
+    monkeypatch.setattr(data_manager, 'VOCAB_FILE', vocab_file)
     assert not data_manager.is_new_word('haus')
     assert not data_manager.is_new_word('BAUM')
     assert data_manager.is_new_word('Wasser')
 
 
+def test_vocab_store_index_and_invalidation(tmp_path, monkeypatch):
+    vocab_file = tmp_path / 'vocab.json'
+    monkeypatch.setattr(data_manager, 'VOCAB_FILE', vocab_file)
+    store = data_manager.vocab_store()
+    assert data_manager.vocab_store() is store
+    assert store.entries() == []
+    added = store.add_many([{'root': 'Haus'}, {'root': 'haus'}, {'root': 'Baum'}])
+    assert [e['root'] for e in added] == ['Haus', 'Baum']
+    assert store.contains('HAUS') and store.get('baum')['root'] == 'Baum'
+    assert [e['root'] for e in json.loads(vocab_file.read_text(encoding='utf-8'))] == ['Haus', 'Baum']
+    reads = []
+    real_read = data_manager._read_vocab_file
+    monkeypatch.setattr(data_manager, '_read_vocab_file', lambda p: reads.append(p) or real_read(p))
+    for word in ('Haus', 'Wasser', 'Baum'):
+        store.contains(word)
+    assert reads == []
+    # Writes through save_vocab (or any change on disk) invalidate the index.
+    data_manager.save_vocab([{'root': 'Wasser'}])
+    assert store.contains('wasser') and not store.contains('Haus')
+    assert reads == [vocab_file]
+
+
 def test_days_since_last_batch(monkeypatch):
     monkeypatch.setattr(data_manager, 'load_vocab', lambda: [])
     assert data_manager.days_since_last_batch() == math.inf
@@ -57,8 +110,55 @@ def test_append_memory(tmp_path, monkeypatch):
     mem_file = tmp_path / 'memory.json'
     monkeypatch.setattr(data_manager, 'MEMORY_FILE', mem_file)
     data_manager.append_memory('2023-01-02', {'level': 'A1'})
-    content = json.loads(mem_file.read_text(encoding='utf-8'))
-    assert content.get('2023-01-02') == {'level': 'A1'}
+    lines = (tmp_path / 'memory.jsonl').read_text(encoding='utf-8').splitlines()
+    assert [json.loads(l)['entry'] for l in lines] == [{'level': 'A1'}]
+    assert data_manager.load_memory() == {'2023-01-02': {'level': 'A1'}}
+    # A second checkpoint the same day is appended, not written over.
+    data_manager.append_memory('2023-01-02', {'level': 'A2'})
+    assert [c['entry'] for c in data_manager.memory_checkpoints()] == [{'level': 'A1'}, {'level': 'A2'}]
+    assert data_manager.load_memory() == {'2023-01-02': {'level': 'A2'}}
+
+
+def test_memory_log_range_queries(tmp_path, monkeypatch):
+    mem_file = tmp_path / 'memory.json'
+    monkeypatch.setattr(data_manager, 'MEMORY_FILE', mem_file)
+    # An existing memory.json seeds the log.
+    mem_file.write_text(json.dumps({'2023-01-05': {'n': 5}, '2023-01-01': {'n': 1}}), encoding='utf-8')
+    assert data_manager.load_memory() == {'2023-01-01': {'n': 1}, '2023-01-05': {'n': 5}}
+    data_manager.append_memory('2023-01-03', {'n': 3})
+    data_manager.append_memory('2023-01-09', {'n': 9})
+    assert [c['date'] for c in data_manager.memory_checkpoints('2023-01-02', '2023-01-05')] == [
+        '2023-01-03', '2023-01-05']
+    assert [c['date'] for c in data_manager.memory_checkpoints(end='2023-01-03')] == ['2023-01-01', '2023-01-03']
+    recent = data_manager.recent_memory(7, today=date(2023, 1, 9))
+    assert [c['entry']['n'] for c in recent] == [3, 5, 9]
+    assert [c['entry']['n'] for c in data_manager.recent_memory(6, today=date(2023, 1, 9))] == [5, 9]
+    latest = data_manager.latest_memory()
+    assert latest['entry'] == {'n': 9} and latest['at'] is not None
+
+    # Lines appended by another process are picked up by scanning the tail only.
+    log = data_manager.get_backend().memory_log()
+    scanned = log._scanned
+    with (tmp_path / 'memory.jsonl').open('a', encoding='utf-8') as fh:
+        fh.write(json.dumps({'date': '2023-01-10', 'at': None, 'entry': {'n': 10}}) + '\n')
+        fh.write('{"date": "2023-01-11", "at"')  # torn final line
+    assert data_manager.latest_memory()['entry'] == {'n': 10}
+    assert log._scanned > scanned
+    data_manager.append_memory('2023-01-12', {'n': 12})
+    assert [c['date'] for c in data_manager.memory_checkpoints('2023-01-10')] == ['2023-01-10', '2023-01-12']
+    data_manager._memory_logs.clear()
+    assert len(data_manager.get_backend().memory_log()) == 6
+
+
+def test_memory_log_rescans_a_rewrite_that_grew(tmp_path, monkeypatch):
+    monkeypatch.setattr(data_manager, 'MEMORY_FILE', tmp_path / 'memory.json')
+    data_manager.append_memory('2023-01-02', {'n': 2})
+    assert len(data_manager.get_backend().memory_log()) == 1
+    # Another process rewrites the log with more (and different) lines.
+    lines = [{'date': '2023-01-0%d' % n, 'at': None, 'entry': {'n': n}} for n in (1, 3, 4)]
+    (tmp_path / 'memory.jsonl').write_text(
+        ''.join(json.dumps(line) + '\n' for line in lines), encoding='utf-8')
+    assert [c['entry']['n'] for c in data_manager.memory_checkpoints()] == [1, 3, 4]
 
 
 def test_list_and_load_sessions(tmp_path, monkeypatch):
@@ -73,26 +173,353 @@ def test_list_and_load_sessions(tmp_path, monkeypatch):
     assert data_manager.load_session('nope') == []
 
 
-def test_trim_messages(monkeypatch):
-    class DummyEnc:
-        def encode(self, text):
-            return list(text)
+class DummyEnc:
+    def encode(self, text):
+        return list(text)
+
 
-    monkeypatch.setattr(data_manager.tiktoken, 'encoding_for_model', lambda model: DummyEnc())
+def test_trim_messages(monkeypatch):
+    monkeypatch.setattr(data_manager, '_encoder', DummyEnc())
     msgs = [{'text': 'aaa'}, {'text': 'bb'}, {'text': 'c'}]
     trimmed = data_manager.trim_messages(msgs, max_tokens=4)
     assert trimmed == msgs[1:]
+    # Stored counts are trusted instead of re-encoding the text.
+    msgs = [{'text': 'a', 'tokens': 5}, {'text': 'bb', 'tokens': 2}]
+    assert data_manager.trim_messages(msgs, max_tokens=4) == msgs[1:]
+
+
+def test_encoder_is_built_once(monkeypatch):
+    built = []
+    monkeypatch.setattr(data_manager, '_encoder', None)
+    monkeypatch.setattr(tiktoken, 'encoding_for_model', lambda model: built.append(model) or DummyEnc())
+    assert data_manager.count_tokens('abc') == 3
+    assert data_manager.count_tokens('de') == 2
+    assert built == ['gpt-4']
 
 
 def test_append_message(tmp_path, monkeypatch):
     chat_file = tmp_path / 'chat.json'
     monkeypatch.setattr(data_manager, 'CHAT_SESSIONS_FILE', chat_file)
+    monkeypatch.setattr(data_manager, '_encoder', DummyEnc())
     monkeypatch.setattr(data_manager, 'trim_messages', lambda msgs, max_tokens=600000: msgs)
     res1 = data_manager.append_message('s1', 'user', 'hello')
-    assert res1 == [{'role': 'user', 'text': 'hello'}]
+    assert res1 == [{'role': 'user', 'text': 'hello', 'tokens': 5}]
     saved = json.loads(chat_file.read_text(encoding='utf-8'))
     assert saved['s1'] == res1
     res2 = data_manager.append_message('s1', 'assistant', 'world')
-    assert res2 == [{'role': 'user', 'text': 'hello'}, {'role': 'assistant', 'text': 'world'}]
+    assert res2 == [{'role': 'user', 'text': 'hello', 'tokens': 5},
+                    {'role': 'assistant', 'text': 'world', 'tokens': 5}]
     saved2 = json.loads(chat_file.read_text(encoding='utf-8'))
-    assert saved2['s1'] == res2
\ No newline at end of file
+    assert saved2['s1'] == res2
+
+def test_segment_sessions_append_and_load(tmp_path, monkeypatch):
+    monkeypatch.setattr(data_manager, 'CHAT_STORAGE', 'jsonl')
+    monkeypatch.setattr(data_manager, 'CHAT_SESSIONS_DIR', tmp_path / 'sessions')
+    monkeypatch.setattr(data_manager, '_encoder', DummyEnc())
+    assert data_manager.list_sessions() == []
+    assert data_manager.load_session('2023-09-01T10:00:00') == []
+    data_manager.append_message('2023-09-01T10:00:00', 'user', 'hallo')
+    res = data_manager.append_message('2023-09-01T10:00:00', 'assistant', 'servus')
+    data_manager.append_message('s2', 'user', 'x')
+    assert res == [{'role': 'user', 'text': 'hallo', 'tokens': 5},
+                   {'role': 'assistant', 'text': 'servus', 'tokens': 6}]
+    assert data_manager.list_sessions() == ['2023-09-01T10:00:00', 's2']
+    # Only the segment of the requested session is read, and from disk.
+    data_manager._segment_cache.clear()
+    assert data_manager.load_session('2023-09-01T10:00:00') == res
+    lines = data_manager._segment_path('s2').read_text(encoding='utf-8').splitlines()
+    assert [json.loads(l) for l in lines] == [{'role': 'user', 'text': 'x', 'tokens': 1}]
+
+
+def test_segment_sessions_trim_and_compact(tmp_path, monkeypatch):
+    monkeypatch.setattr(data_manager, 'CHAT_STORAGE', 'jsonl')
+    monkeypatch.setattr(data_manager, 'CHAT_SESSIONS_DIR', tmp_path / 'sessions')
+    monkeypatch.setattr(data_manager, 'SEGMENT_COMPACT_MIN', 3)
+    monkeypatch.setattr(data_manager, '_encoder', DummyEnc())
+    for i in range(4):
+        data_manager.append_message('s1', 'user', str(i), max_tokens=2)
+    path = data_manager._segment_path('s1')
+    data_manager._segment_cache.clear()
+    assert data_manager.load_session('s1') == [{'role': 'user', 'text': '2', 'tokens': 1},
+                                               {'role': 'user', 'text': '3', 'tokens': 1}]
+    # Two trimmed messages so far: below the threshold, so still on disk.
+    assert len(path.read_text(encoding='utf-8').splitlines()) > 4
+    data_manager.append_message('s1', 'user', '4', max_tokens=2)
+    lines = [json.loads(l) for l in path.read_text(encoding='utf-8').splitlines()]
+    assert lines == [{'role': 'user', 'text': '3', 'tokens': 1}, {'role': 'user', 'text': '4', 'tokens': 1}]
+    data_manager._segment_cache.clear()
+    assert data_manager.load_session('s1') == lines
+
+
+def test_segment_load_while_appending(tmp_path, monkeypatch):
+    import threading
+
+    monkeypatch.setattr(data_manager, 'CHAT_STORAGE', 'jsonl')
+    monkeypatch.setattr(data_manager, 'CHAT_SESSIONS_DIR', tmp_path / 'sessions')
+    monkeypatch.setattr(data_manager, '_encoder', DummyEnc())
+    data_manager.append_message('s1', 'user', '0', max_tokens=50)
+
+    def append():
+        for i in range(1, 300):
+            data_manager.append_message('s1', 'user', str(i % 10), max_tokens=50)
+
+    writer = threading.Thread(target=append)
+    writer.start()
+    while writer.is_alive():
+        # Never a half-updated view: always within the token budget.
+        snapshot = data_manager.load_session('s1')
+        assert sum(m['tokens'] for m in snapshot) <= 50
+    writer.join()
+
+
+def test_segment_survives_torn_line(tmp_path, monkeypatch):
+    monkeypatch.setattr(data_manager, 'CHAT_STORAGE', 'jsonl')
+    monkeypatch.setattr(data_manager, 'CHAT_SESSIONS_DIR', tmp_path / 'sessions')
+    monkeypatch.setattr(data_manager, '_encoder', DummyEnc())
+    data_manager.append_message('s1', 'user', 'eins')
+    path = data_manager._segment_path('s1')
+    with path.open('ab') as fh:
+        fh.write(b'{"role": "user", "te')  # interrupted write
+    data_manager._segment_cache.clear()
+    data_manager.append_message('s1', 'user', 'zwei')
+    data_manager.append_message('s1', 'user', 'drei')
+    data_manager._segment_cache.clear()
+    # The torn line now sits in the middle of the file and is skipped.
+    assert [m['text'] for m in data_manager.load_session('s1')] == ['eins', 'zwei', 'drei']
+
+
+def test_migrate_sessions_to_segments(tmp_path, monkeypatch):
+    chat_file = tmp_path / 'chat.json'
+    monkeypatch.setattr(data_manager, 'CHAT_SESSIONS_FILE', chat_file)
+    monkeypatch.setattr(data_manager, 'CHAT_SESSIONS_DIR', tmp_path / 'sessions')
+    monkeypatch.setattr(data_manager, '_encoder', DummyEnc())
+    sample = {'s1': [{'role': 'user', 'text': 'hi'}], 's2': []}
+    chat_file.write_text(json.dumps(sample), encoding='utf-8')
+    assert data_manager.migrate_sessions_to_segments() == ['s1', 's2']
+    monkeypatch.setattr(data_manager, 'CHAT_STORAGE', 'jsonl')
+    assert data_manager.list_sessions() == ['s1', 's2']
+    assert data_manager.load_session('s1') == sample['s1']
+
+
+def test_session_manifest(tmp_path, monkeypatch):
+    chat_file = tmp_path / 'chat.json'
+    monkeypatch.setattr(data_manager, 'CHAT_SESSIONS_FILE', chat_file)
+    monkeypatch.setattr(data_manager, '_encoder', DummyEnc())
+    # Sessions written before the manifest existed are picked up by a rebuild.
+    chat_file.write_text(json.dumps({'old': [{'role': 'user', 'text': 'hi'}]}), encoding='utf-8')
+    assert data_manager.session_manifest() == {
+        'old': {'messages': 1, 'tokens': None, 'first_ts': None, 'last_ts': None}}
+    data_manager.append_message('s1', 'user', 'hallo')
+    data_manager.append_message('s1', 'assistant', 'servus')
+    meta = data_manager.session_manifest()['s1']
+    assert meta['messages'] == 2 and meta['tokens'] == 11
+    assert meta['first_ts'] <= meta['last_ts']
+    assert data_manager.list_sessions() == ['old', 's1']
+    assert [sid for sid, _ in data_manager.recent_sessions(1)] == ['s1']
+    assert [sid for sid, _ in data_manager.recent_sessions(1, offset=1)] == ['old']
+
+    # Listing reads the manifest only, never the sessions file.
+    def no_read(path):
+        raise AssertionError(f'{path.name} was read')
+    real_read = data_manager._read_json
+    monkeypatch.setattr(data_manager, '_read_json', lambda path: no_read(path) if path == chat_file else real_read(path))
+    assert data_manager.list_sessions() == ['old', 's1']
+
+
+def test_segment_session_manifest_offsets(tmp_path, monkeypatch):
+    monkeypatch.setattr(data_manager, 'CHAT_STORAGE', 'jsonl')
+    monkeypatch.setattr(data_manager, 'CHAT_SESSIONS_DIR', tmp_path / 'sessions')
+    monkeypatch.setattr(data_manager, '_encoder', DummyEnc())
+    data_manager.append_message('s1', 'user', 'hallo')
+    data_manager.append_message('s1', 'assistant', 'servus', max_tokens=6)
+    meta = data_manager.session_manifest()['s1']
+    assert meta['messages'] == 1 and meta['tokens'] == 6
+    path = data_manager._segment_path('s1')
+    assert meta['size'] == path.stat().st_size
+    with path.open('rb') as fh:
+        fh.seek(meta['offset'])
+        assert json.loads(fh.readline())['text'] == 'servus'
+    # A segment added behind the manifest's back is noticed.
+    data_manager._write_lines(data_manager._segment_path('s2'), [{'role': 'user', 'text': 'x', 'tokens': 1}], 'w')
+    assert data_manager.list_sessions() == ['s1', 's2']
+    assert data_manager.session_manifest()['s2']['messages'] == 1
+    # So is another process appending to an existing one; the rebuild keeps
+    # the start time only the appends knew.
+    with path.open('a', encoding='utf-8') as fh:
+        fh.write(json.dumps({'role': 'user', 'text': 'noch', 'tokens': 4}) + '\n')
+    rebuilt = data_manager.session_manifest()['s1']
+    assert rebuilt['messages'] == 2 and rebuilt['first_ts'] == meta['first_ts']
+
+
+def test_segment_appends_do_not_scan_every_segment(tmp_path, monkeypatch):
+    monkeypatch.setattr(data_manager, 'CHAT_STORAGE', 'jsonl')
+    monkeypatch.setattr(data_manager, 'CHAT_SESSIONS_DIR', tmp_path / 'sessions')
+    monkeypatch.setattr(data_manager, '_encoder', DummyEnc())
+    data_manager.append_message('s1', 'user', 'hallo')
+    scans = []
+    source = data_manager._manifest_source
+    monkeypatch.setattr(data_manager, '_manifest_source', lambda: scans.append(1) or source())
+    data_manager.append_message('s1', 'assistant', 'servus')
+    data_manager.append_message('s2', 'user', 'neu')
+    assert scans == []
+    # The incrementally kept signature matches a fresh scan: no rebuild.
+    monkeypatch.setattr(data_manager, 'rebuild_session_manifest', lambda: pytest.fail('rebuilt'))
+    assert data_manager.session_manifest()['s2']['messages'] == 1
+
+
+def test_session_manifest_first_ts(tmp_path, monkeypatch):
+    monkeypatch.setattr(data_manager, 'CHAT_SESSIONS_FILE', tmp_path / 'chat.json')
+    monkeypatch.setattr(data_manager, '_encoder', DummyEnc())
+    # The very first append also creates the manifest (from a scan).
+    data_manager.append_message('s1', 'user', 'hallo')
+    first_ts = data_manager.session_manifest()['s1']['first_ts']
+    assert first_ts is not None
+    data_manager.rebuild_session_manifest()
+    assert data_manager.session_manifest()['s1']['first_ts'] == first_ts
+
+
+def test_review_entry_sm2():
+    today = date(2024, 1, 1)
+    entry = {'root': 'Haus'}
+    data_manager.review_entry(entry, 4, today)
+    assert (entry['reps'], entry['interval'], entry['due']) == (1, 1, '2024-01-02')
+    assert entry['known'] is True and entry['last_reviewed'] == '2024-01-01'
+    data_manager.review_entry(entry, 5, today)
+    assert entry['interval'] == 6
+    data_manager.review_entry(entry, 4, today)
+    assert entry['interval'] == 16  # 6 days * ease 2.6
+    data_manager.review_entry(entry, 1, today)
+    assert (entry['reps'], entry['interval'], entry['known']) == (0, 1, False)
+    for _ in range(20):
+        data_manager.review_entry(entry, 0, today)
+    assert entry['ease'] == data_manager.MIN_EASE
+
+
+def test_due_queue(tmp_path, monkeypatch):
+    vocab_file = tmp_path / 'vocab.json'
+    today = date.today()
+    entries = [
+        {'root': 'Haus', 'taught_on': (today - timedelta(days=5)).isoformat()},
+        {'root': 'Baum', 'due': (today + timedelta(days=3)).isoformat()},
+        {'root': 'Wasser', 'due': (today - timedelta(days=1)).isoformat()},
+        {'root': 'Brot'},
+    ]
+    vocab_file.write_text(json.dumps(entries), encoding='utf-8')
+    monkeypatch.setattr(data_manager, 'VOCAB_FILE', vocab_file)
+    assert data_manager.due_count() == 3
+    assert [e['root'] for e in data_manager.due_cards(10)] == ['Brot', 'Haus', 'Wasser']
+    assert [e['root'] for e in data_manager.due_cards(1, offset=1)] == ['Haus']
+    data_manager.record_review('haus', 5)
+    assert [e['root'] for e in data_manager.due_cards(10)] == ['Brot', 'Wasser']
+    saved = {e['root']: e for e in json.loads(vocab_file.read_text(encoding='utf-8'))}
+    assert saved['Haus']['due'] == (today + timedelta(days=1)).isoformat()
+    data_manager.vocab_store().add_many([{'root': 'Tisch', 'due': today.isoformat()}])
+    assert [e['root'] for e in data_manager.due_cards(10)] == ['Brot', 'Wasser', 'Tisch']
+    with pytest.raises(KeyError):
+        data_manager.record_review('Stuhl', 3)
+
+
+def test_deferred_reviews_flush_in_batches(tmp_path, monkeypatch):
+    vocab_file = tmp_path / 'vocab.json'
+    vocab_file.write_text(json.dumps([{'root': r} for r in ('Haus', 'Baum', 'Brot')]), encoding='utf-8')
+    monkeypatch.setattr(data_manager, 'VOCAB_FILE', vocab_file)
+    monkeypatch.setattr(data_manager, 'VOCAB_FLUSH_BATCH', 2)
+    writes = []
+    real_write = data_manager._write_vocab_file
+    monkeypatch.setattr(data_manager, '_write_vocab_file', lambda p, v: writes.append(p) or real_write(p, v))
+    data_manager.record_review('Haus', 4, defer=True)
+    assert writes == [] and data_manager.vocab_store().pending() == 1
+    assert data_manager.vocab_store().get('Haus')['known'] is True
+    data_manager.record_review('Baum', 1, defer=True)
+    assert writes == [vocab_file]
+    assert data_manager.vocab_store().pending() == 0
+    data_manager.record_review('Brot', 4, defer=True)
+    # An outside write reloads the store without losing the pending review.
+    on_disk = json.loads(vocab_file.read_text(encoding='utf-8'))
+    on_disk.append({'root': 'Wasser'})
+    data_manager.save_vocab(on_disk)
+    assert data_manager.vocab_store().get('Brot')['known'] is True
+    assert data_manager.flush_vocab() == 1
+    saved = {e['root']: e for e in json.loads(vocab_file.read_text(encoding='utf-8'))}
+    assert saved['Brot']['known'] is True and saved['Haus']['known'] is True
+    assert 'Wasser' in saved and saved['Baum']['known'] is False
+
+
+def test_group_commit_coalesces_queued_writes(tmp_path, monkeypatch):
+    import threading
+
+    doc_file = tmp_path / 'chat_state.json'
+    monkeypatch.setattr(data_manager, 'CHAT_STATE_FILE', doc_file)
+    writer = data_manager.GroupCommitWriter()
+    monkeypatch.setattr(data_manager, '_writer', writer)
+    gate = threading.Event()
+    # Park the writer thread so the following writes queue up behind it.
+    blocker = writer.call(tmp_path / 'other', gate.wait)
+    results = []
+    threads = [
+        threading.Thread(target=lambda i=i: results.append(data_manager.set_summary(f's{i}', {'n': i})))
+        for i in range(8)
+    ]
+    for t in threads:
+        t.start()
+    while writer._queue.qsize() < 8:
+        time.sleep(0.001)
+    gate.set()
+    for t in threads:
+        t.join()
+    assert blocker.result() is True
+    assert len(results) == 8
+    assert writer.commits == 1
+    content = json.loads(doc_file.read_text(encoding='utf-8'))
+    assert content == {f's{i}': {'summary': {'n': i}} for i in range(8)}
+    assert not (tmp_path / 'chat_state.json.tmp').exists()
+    writer.close()
+
+
+def test_group_commit_errors_and_inline_after_close(tmp_path, monkeypatch):
+    writer = data_manager.GroupCommitWriter()
+    path = tmp_path / 'doc.json'
+
+    def boom(doc):
+        raise ValueError('bad mutation')
+
+    failed = writer.submit(path, boom)
+    ok = writer.submit(path, lambda doc: (dict(doc, a=1), 'done'))
+    with pytest.raises(ValueError):
+        failed.result()
+    assert ok.result() == 'done'
+    writer.close()
+    assert writer.submit(path, lambda doc: (dict(doc, b=2), None)).done()
+    assert json.loads(path.read_text(encoding='utf-8')) == {'a': 1, 'b': 2}
+
+
+def test_data_version_changes_on_writes(tmp_path, monkeypatch):
+    monkeypatch.setattr(data_manager, 'VOCAB_FILE', tmp_path / 'vocab.json')
+    monkeypatch.setattr(data_manager, 'MEMORY_FILE', tmp_path / 'memory.json')
+    monkeypatch.setattr(data_manager, 'CHAT_SESSIONS_FILE', tmp_path / 'chat.json')
+    monkeypatch.setattr(data_manager, '_encoder', DummyEnc())
+    before = {kind: data_manager.data_version(kind) for kind in ('vocab', 'sessions', 'memory')}
+    assert data_manager.data_version('vocab') == before['vocab']
+    data_manager.vocab_store().add_many([{'root': 'Haus'}])
+    vocab_after_add = data_manager.data_version('vocab')
+    assert vocab_after_add != before['vocab']
+    # Deferred reviews change what due_cards() returns before any file write.
+    data_manager.record_review('Haus', 4, defer=True)
+    assert data_manager.data_version('vocab') != vocab_after_add
+    data_manager.flush_vocab()
+    data_manager.append_message('s1', 'user', 'hi')
+    assert data_manager.data_version('sessions') != before['sessions']
+    data_manager.append_memory('2024-01-01', {'summary': 'x'})
+    assert data_manager.data_version('memory') != before['memory']
+
+
+def test_data_version_sees_external_segment_appends(tmp_path, monkeypatch):
+    monkeypatch.setattr(data_manager, 'CHAT_STORAGE', 'jsonl')
+    monkeypatch.setattr(data_manager, 'CHAT_SESSIONS_DIR', tmp_path / 'sessions')
+    monkeypatch.setattr(data_manager, '_encoder', DummyEnc())
+    data_manager.append_message('s1', 'user', 'hi')
+    before = data_manager.data_version('sessions')
+    segment = data_manager._segment_path('s1')
+    with segment.open('a', encoding='utf-8') as fh:
+        fh.write(json.dumps({'role': 'assistant', 'text': 'hallo', 'tokens': 1}) + '\n')
+    assert data_manager.data_version('sessions') != before
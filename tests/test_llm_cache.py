@@ -0,0 +1,120 @@
+import sys
+import os
+
+sys.path.insert(0, os.path.abspath(os.path.join(os.path.dirname(__file__), '..')))
+
+from types import SimpleNamespace
+
+import pytest
+
+import llm_cache
+
+
+@pytest.fixture(autouse=True)
+def cache_dir(tmp_path, monkeypatch):
+    monkeypatch.setattr(llm_cache, 'CACHE_DIR', tmp_path / 'cache')
+    monkeypatch.setattr(llm_cache, 'CACHE_MODE', 'on')
+    return tmp_path / 'cache'
+
+
+def make_create(calls):
+    def create(**kwargs):
+        calls.append(kwargs)
+        return SimpleNamespace(id='resp_%d' % len(calls), output_text='Antwort %d' % len(calls),
+                               usage=SimpleNamespace(input_tokens=3, output_tokens=5))
+    return create
+
+
+def test_cache_key_ignores_transport_fields():
+    base = {'model': 'gpt-4.1', 'input': [{'role': 'user', 'content': 'Hallo'}]}
+    assert llm_cache.cache_key(base) == llm_cache.cache_key(dict(base, stream=True, store=True))
+    assert llm_cache.cache_key(base) != llm_cache.cache_key(dict(base, model='o4-mini'))
+    assert llm_cache.cache_key(base) != llm_cache.cache_key(dict(base, reasoning={'effort': 'low'}))
+
+
+def test_cached_create_hits_after_first_call():
+    calls = []
+    create = make_create(calls)
+    first = llm_cache.cached_create(create, model='gpt-4.1', input='Hallo')
+    second = llm_cache.cached_create(create, model='gpt-4.1', input='Hallo')
+    assert len(calls) == 1
+    assert second.output_text == first.output_text == 'Antwort 1'
+    assert second.id == 'resp_1' and second.usage.output_tokens == 5
+    llm_cache.cached_create(create, model='gpt-4.1', input='Tschüss')
+    assert len(calls) == 2
+
+
+def test_cached_create_off_mode_bypasses_cache(cache_dir, monkeypatch):
+    monkeypatch.setattr(llm_cache, 'CACHE_MODE', 'off')
+    calls = []
+    for _ in range(2):
+        llm_cache.cached_create(make_create(calls), model='gpt-4.1', input='Hallo')
+    assert len(calls) == 2
+    assert not cache_dir.exists()
+
+
+def test_replay_mode_serves_only_from_cache(monkeypatch):
+    calls = []
+    llm_cache.cached_create(make_create(calls), model='gpt-4.1', input='Hallo')
+    monkeypatch.setattr(llm_cache, 'CACHE_MODE', 'replay')
+    assert llm_cache.cached_create(make_create(calls), model='gpt-4.1', input='Hallo').output_text == 'Antwort 1'
+    with pytest.raises(llm_cache.CacheMiss):
+        llm_cache.cached_create(make_create(calls), model='gpt-4.1', input='Neu')
+    assert len(calls) == 1
+
+
+def test_streamed_calls_are_recorded_and_replayed():
+    calls = []
+
+    def create(**kwargs):
+        calls.append(kwargs)
+        done = SimpleNamespace(id='resp_1', output_text='Hallo', usage=None)
+        return iter([
+            llm_cache.CachedEvent('response.output_text.delta', delta='Hal'),
+            llm_cache.CachedEvent('response.output_text.delta', delta='lo'),
+            llm_cache.CachedEvent('response.completed', response=done),
+        ])
+
+    events = list(llm_cache.cached_create(create, model='gpt-4.1', input='Hi', stream=True))
+    assert [e.delta for e in events if e.delta] == ['Hal', 'lo']
+    replayed = list(llm_cache.cached_create(create, model='gpt-4.1', input='Hi', stream=True))
+    assert len(calls) == 1
+    assert replayed[0].delta == 'Hallo'
+    assert replayed[-1].type == 'response.completed' and replayed[-1].response.id == 'resp_1'
+    # A streamed result also serves plain calls.
+    assert llm_cache.cached_create(create, model='gpt-4.1', input='Hi').output_text == 'Hallo'
+
+
+def test_evict_removes_least_recently_used(cache_dir):
+    for i, key in enumerate(['a', 'b', 'c']):
+        llm_cache.put(key, {'output_text': 'x' * 100})
+        os.utime(cache_dir / f'{key}.json', ns=(i * 10**9, i * 10**9))
+    llm_cache.get('a')  # touching 'a' makes 'b' the oldest entry
+    size = (cache_dir / 'a.json').stat().st_size
+    llm_cache.evict(max_bytes=2 * size)
+    assert sorted(p.stem for p in cache_dir.glob('*.json')) == ['a', 'c']
+
+
+def test_put_scans_only_when_over_the_limit(cache_dir, monkeypatch):
+    scans = []
+    scan = llm_cache._scan
+    monkeypatch.setattr(llm_cache, '_scan', lambda: scans.append(1) or scan())
+    llm_cache.put('a', {'output_text': 'x' * 100})
+    size = (cache_dir / 'a.json').stat().st_size
+    monkeypatch.setattr(llm_cache, 'MAX_CACHE_BYTES', 2 * size)
+    llm_cache.put('b', {'output_text': 'y' * 100})
+    llm_cache.put('b', {'output_text': 'z' * 100})
+    assert len(scans) == 1
+    os.utime(cache_dir / 'a.json', ns=(0, 0))
+    llm_cache.put('c', {'output_text': 'w' * 100})
+    assert len(scans) == 2
+    assert sorted(p.stem for p in cache_dir.glob('*.json')) == ['b', 'c']
+    assert llm_cache._sizes[cache_dir] == 2 * size
+
+
+def test_concurrent_puts_of_one_key(cache_dir):
+    from concurrent.futures import ThreadPoolExecutor
+
+    with ThreadPoolExecutor(8) as pool:
+        list(pool.map(lambda i: llm_cache.put('k', {'output_text': str(i)}), range(32)))
+    assert [p.name for p in cache_dir.iterdir()] == ['k.json']
@@ -0,0 +1,128 @@
+import sys
+import os
+import json
+import threading
+import time
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+# Ensure project root on PYTHONPATH
+sys.path.insert(0, os.path.abspath(os.path.join(os.path.dirname(__file__), '..')))
+
+import openai
+import pytest
+
+import llm_client
+
+RESPONSE = {
+    'id': 'resp_1',
+    'object': 'response',
+    'created_at': 0,
+    'model': 'o4-mini',
+    'status': 'completed',
+    'output': [{
+        'type': 'message',
+        'id': 'msg_1',
+        'role': 'assistant',
+        'status': 'completed',
+        'content': [{'type': 'output_text', 'text': 'hallo', 'annotations': []}],
+    }],
+    'parallel_tool_calls': False,
+    'tool_choice': 'auto',
+    'tools': [],
+}
+
+
+@pytest.fixture
+def fake_server():
+    """Local Responses API stand-in replaying a script of (status, delay) replies."""
+    script = []
+    hits = []
+
+    class Handler(BaseHTTPRequestHandler):
+        def do_POST(self):
+            self.rfile.read(int(self.headers.get('Content-Length', 0)))
+            hits.append(self.path)
+            status, delay = script.pop(0) if script else (200, 0)
+            time.sleep(delay)
+            body = json.dumps(RESPONSE if status == 200 else {'error': {'message': 'nope'}}).encode()
+            try:
+                self.send_response(status)
+                self.send_header('Content-Type', 'application/json')
+                self.send_header('Content-Length', str(len(body)))
+                self.end_headers()
+                self.wfile.write(body)
+            except OSError:
+                pass
+
+        def log_message(self, format, *args):
+            pass
+
+    server = ThreadingHTTPServer(('127.0.0.1', 0), Handler)
+    server.daemon_threads = True
+    threading.Thread(target=server.serve_forever, daemon=True).start()
+    client = llm_client.ResilientClient(llm_client.build_openai_client(
+        api_key='test', base_url=f'http://127.0.0.1:{server.server_address[1]}/v1'))
+    yield client, script, hits
+    server.shutdown()
+
+
+@pytest.fixture(autouse=True)
+def fast_backoff(monkeypatch):
+    monkeypatch.setattr(llm_client, 'BACKOFF_BASE', 0.01)
+
+
+def test_retries_retryable_statuses(fake_server):
+    client, script, hits = fake_server
+    script.extend([(503, 0), (429, 0)])
+    response = client.responses.create(model='o4-mini', input='hi')
+    assert response.output_text == 'hallo'
+    assert len(hits) == 3
+
+
+def test_does_not_retry_client_errors(fake_server):
+    client, script, hits = fake_server
+    script.append((400, 0))
+    with pytest.raises(openai.BadRequestError):
+        client.responses.create(model='o4-mini', input='hi')
+    assert len(hits) == 1
+
+
+def test_deadline_bounds_slow_calls(fake_server):
+    client, script, hits = fake_server
+    script.extend([(200, 2)] * 5)
+    start = time.monotonic()
+    with pytest.raises(openai.APITimeoutError):
+        client.responses.create(model='o4-mini', input='hi', deadline=0.5)
+    assert time.monotonic() - start < 1.5
+
+
+def test_backoff_is_jittered_and_capped():
+    delays = {llm_client.backoff_delay(10) for _ in range(20)}
+    assert len(delays) > 1 and max(delays) <= llm_client.BACKOFF_MAX
+
+
+def test_hedged_takes_first_result():
+    calls = []
+
+    def slow_then_fast():
+        calls.append(None)
+        if len(calls) == 1:
+            time.sleep(0.5)
+            return 'slow'
+        return 'fast'
+
+    started = llm_client.hedges_started
+    assert llm_client.hedged(slow_then_fast, 'test', delay=0.05) == 'fast'
+    assert llm_client.hedges_started == started + 1
+    # Quick calls never hedge.
+    assert llm_client.hedged(lambda: 'ok', 'test', delay=0.5) == 'ok'
+    assert llm_client.hedges_started == started + 1
+
+
+def test_hedge_delay_tracks_p95(monkeypatch):
+    monkeypatch.setattr(llm_client, 'HEDGE_DELAY_MIN', 0.0)
+    window = llm_client.latency_window('p95-test')
+    assert llm_client.hedge_delay('p95-test') == llm_client.HEDGE_DELAY_DEFAULT
+    for i in range(1, 101):
+        window.add(i / 100)
+    assert llm_client.hedge_delay('p95-test') == pytest.approx(0.96)
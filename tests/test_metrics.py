@@ -0,0 +1,88 @@
+import sys
+import os
+import json
+import urllib.request
+from types import SimpleNamespace
+
+# Ensure project root on PYTHONPATH
+sys.path.insert(0, os.path.abspath(os.path.join(os.path.dirname(__file__), '..')))
+
+import pytest
+
+import data_manager
+import metrics
+
+
+@pytest.fixture
+def enabled(tmp_path):
+    metrics.reset()
+    metrics.enable(tmp_path / 'spans.jsonl')
+    yield tmp_path / 'spans.jsonl'
+    metrics.disable()
+    metrics.reset()
+
+
+def test_disabled_span_is_shared_noop():
+    assert not metrics.ENABLED
+    span = metrics.span('file.read')
+    assert span is metrics.NULL_SPAN
+    with span as s:
+        s.add(bytes_read=10)
+    assert 'file.read' not in metrics.summary()
+
+
+def test_quantiles_and_errors(enabled):
+    for i in range(1, 101):
+        s = metrics.Span('op', {})
+        s.start -= i / 1000
+        s.add(bytes_read=2)
+        s.finish()
+    with pytest.raises(ValueError):
+        with metrics.span('op'):
+            raise ValueError
+    row = metrics.summary()['op']
+    assert row['count'] == 101 and row['errors'] == 1 and row['bytes_read'] == 200
+    assert 49 <= row['p50_ms'] <= 52
+    assert 94 <= row['p95_ms'] <= 97
+    assert 98 <= row['p99_ms'] <= 101
+    lines = [json.loads(l) for l in enabled.read_text(encoding='utf-8').splitlines()]
+    assert len(lines) == 101 and lines[-1]['error'] == 'ValueError'
+
+
+def test_file_io_is_traced(enabled, tmp_path, monkeypatch):
+    monkeypatch.setattr(data_manager, 'VOCAB_FILE', tmp_path / 'vocab.json')
+    data_manager.save_vocab([{'root': 'Haus'}])
+    data_manager.load_vocab()
+    summary = metrics.summary()
+    size = (tmp_path / 'vocab.json').stat().st_size
+    assert summary['file.write']['bytes_written'] == size
+    assert summary['file.read']['bytes_read'] == size
+
+
+def test_trace_llm_records_usage_and_streams(enabled):
+    usage = SimpleNamespace(input_tokens=10, output_tokens=4,
+                            output_tokens_details=SimpleNamespace(reasoning_tokens=3))
+    response = SimpleNamespace(usage=usage, output_text='x')
+    assert metrics.trace_llm(lambda: response, model='m') is response
+    cached = SimpleNamespace(usage=usage, cached=True)
+    events = [SimpleNamespace(type='response.output_text.delta', delta='x'),
+              SimpleNamespace(type='response.completed', response=cached)]
+    stream = metrics.trace_llm(lambda: iter(events), stream=True)
+    assert list(stream) == events
+    row = metrics.summary()['llm.responses.create']
+    assert row['count'] == 2
+    assert row['input_tokens'] == 20 and row['output_tokens'] == 8 and row['reasoning_tokens'] == 6
+    assert row['cache_hits'] == 1 and row['cache_misses'] == 1
+
+
+def test_prometheus_endpoint(enabled):
+    with metrics.span('file.read') as s:
+        s.add(bytes_read=5)
+    server = metrics.serve_prometheus(0)
+    try:
+        url = f'http://127.0.0.1:{server.server_address[1]}/metrics'
+        body = urllib.request.urlopen(url, timeout=5).read().decode('utf-8')
+    finally:
+        server.shutdown()
+    assert 'german_tutor_op_latency_seconds_count{op="file.read"} 1' in body
+    assert 'german_tutor_bytes_read_total{op="file.read"} 5' in body
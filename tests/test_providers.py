@@ -0,0 +1,105 @@
+import sys
+import os
+
+# Ensure project root is on PYTHONPATH for imports
+sys.path.insert(0, os.path.abspath(os.path.join(os.path.dirname(__file__), '..')))
+
+import json
+from types import SimpleNamespace
+
+import pytest
+
+import data_manager
+import providers
+import tutor
+
+
+class DummyEnc:
+    def encode(self, text):
+        return text.split()
+
+
+@pytest.fixture
+def fake_provider(tmp_path, monkeypatch):
+    monkeypatch.setattr(data_manager, 'VOCAB_FILE', tmp_path / 'vocab.json')
+    monkeypatch.setattr(data_manager, 'STAGED_BATCH_FILE', tmp_path / 'staged_batch.json')
+    monkeypatch.setattr(data_manager, 'CHAT_STATE_FILE', tmp_path / 'chat_state.json')
+    monkeypatch.setattr(data_manager, 'CHAT_STORAGE', 'jsonl')
+    monkeypatch.setattr(data_manager, 'CHAT_SESSIONS_DIR', tmp_path / 'sessions')
+    monkeypatch.setattr(data_manager, '_encoder', DummyEnc())
+    monkeypatch.setattr(tutor, 'PROVIDERS', dict.fromkeys(tutor.CALL_KINDS, 'fake'))
+    monkeypatch.setattr(tutor, '_providers', {})
+    # Any OpenAI call would fail: there is no key and no network.
+    monkeypatch.delenv('OPENAI_API_KEY', raising=False)
+    monkeypatch.setattr(tutor, '_client', None)
+    yield tutor.get_provider('batch')
+    data_manager.flush_vocab()
+    data_manager._vocab_stores.clear()
+
+
+def test_fake_provider_is_deterministic():
+    messages = [{'role': 'user', 'content': 'Generate 3 new German words.'}]
+    first, tokens = providers.FakeProvider().generate_json('fake', messages, {}, 'german_sentences')
+    second, _ = providers.FakeProvider().generate_json('fake', messages, {}, 'german_sentences')
+    assert first == second
+    assert len(first['german_sentences']) == 3
+    assert tokens == 60
+    other, _ = providers.FakeProvider().generate_json(
+        'fake', [{'role': 'user', 'content': 'Generate 3 other words.'}], {}, 'german_sentences')
+    assert other != first
+
+
+def test_unknown_provider():
+    with pytest.raises(ValueError):
+        providers.create_provider('nope')
+
+
+def test_tutor_runs_offline_on_fake_provider(fake_provider, monkeypatch):
+    monkeypatch.setattr(data_manager, 'days_since_last_batch', lambda: 3)
+    batch = tutor.generate_new_batch(5)
+    assert len(batch) == 5
+    assert all(entry['root'].startswith('Fakewort') for entry in batch)
+    assert fake_provider.calls >= 1
+
+    reply = tutor.chat_session_interact('s1', 'Hallo')
+    assert reply == 'Gut! Du hast gesagt: Hallo'
+    deltas = list(tutor.chat_session_stream('s1', 'Wie geht es?'))
+    assert ''.join(deltas) == 'Gut! Du hast gesagt: Wie geht es?'
+    assert [m['text'] for m in data_manager.load_session('s1')] == [
+        'Hallo', reply, 'Wie geht es?', ''.join(deltas)]
+    # The fake provider cannot chain, so no response id is kept.
+    assert data_manager.get_response_id('s1') is None
+
+
+def test_ollama_provider(monkeypatch):
+    ollama = pytest.importorskip('ollama')
+    requests = []
+
+    def message(content, done=True):
+        return SimpleNamespace(message=SimpleNamespace(content=content), done=done,
+                               prompt_eval_count=7, eval_count=3)
+
+    class FakeClient:
+        def __init__(self, host=None):
+            self.host = host
+
+        def chat(self, model, messages, format=None, stream=False):
+            requests.append({'model': model, 'format': format, 'stream': stream})
+            if stream:
+                return iter([message('Hal', done=False), message('lo')])
+            if format is not None:
+                return message(json.dumps({'german_sentences': []}))
+            return message('Hallo')
+
+    monkeypatch.setattr(ollama, 'Client', FakeClient)
+    provider = providers.create_provider('ollama')
+    schema = {'type': 'object'}
+    assert provider.generate_json('llama3.1', [], schema, 'german_sentences') == ({'german_sentences': []}, 3)
+    assert requests[-1]['format'] == schema
+    response = provider.respond('llama3.1', [{'role': 'user', 'content': 'Hi'}])
+    assert response.output_text == 'Hallo'
+    assert response.usage.output_tokens == 3
+    events = list(provider.respond('llama3.1', [], stream=True))
+    assert [e.delta for e in events if e.type == 'response.output_text.delta'] == ['Hal', 'lo']
+    assert events[-1].type == 'response.completed'
+    assert events[-1].response.output_text == 'Hallo'
@@ -0,0 +1,172 @@
+import sys
+import os
+import json
+from datetime import date, timedelta
+
+sys.path.insert(0, os.path.abspath(os.path.join(os.path.dirname(__file__), '..')))
+
+import pytest
+
+import data_manager
+import sqlite_backend
+
+
+@pytest.fixture
+def sqlite_db(tmp_path, monkeypatch):
+    db = tmp_path / 'tutor.db'
+    monkeypatch.setattr(data_manager, 'STORAGE_BACKEND', 'sqlite')
+    monkeypatch.setattr(data_manager, 'SQLITE_FILE', db)
+    monkeypatch.setattr(data_manager, 'count_tokens', lambda text: len(text))
+    return db
+
+
+def test_wal_mode(sqlite_db):
+    backend = data_manager.get_backend()
+    assert isinstance(backend, sqlite_backend.SqliteBackend)
+    assert backend.connect().execute('PRAGMA journal_mode').fetchone()[0] == 'wal'
+
+
+def test_vocab_roundtrip_and_store(sqlite_db):
+    assert data_manager.load_vocab() == []
+    assert data_manager.days_since_last_batch() == float('inf')
+    sample = [{'root': 'Haus', 'english': 'house', 'taught_on': '2023-01-01',
+               'batch_id': 1, 'examples': {}, 'last_reviewed': None, 'known': False}]
+    data_manager.save_vocab(sample)
+    assert data_manager.load_vocab() == sample
+    store = data_manager.vocab_store()
+    assert store.contains('HAUS') and not data_manager.is_new_word('haus')
+    added = store.add_many([{'root': 'haus'}, {'root': 'Baum', 'batch_id': 2, 'taught_on': date.today().isoformat()},
+                            {'root': 'baum'}])
+    assert [e['root'] for e in added] == ['Baum']
+    assert store.get('baum')['english'] is None
+    assert store.max_batch_id() == 2
+    assert store.recent_roots(5) == ['Baum', 'Haus']
+    assert data_manager.days_since_last_batch() == 0
+
+
+def test_due_queue_and_review(sqlite_db):
+    today = date.today()
+    data_manager.save_vocab([
+        {'root': 'Haus', 'taught_on': (today - timedelta(days=2)).isoformat()},
+        {'root': 'Baum', 'due': (today + timedelta(days=3)).isoformat()},
+        {'root': 'Brot'},
+    ])
+    assert data_manager.due_count() == 2
+    assert [e['root'] for e in data_manager.due_cards(10)] == ['Brot', 'Haus']
+    assert [e['root'] for e in data_manager.due_cards(1, offset=1)] == ['Haus']
+    data_manager.record_review('haus', 5, defer=True)
+    assert [e['root'] for e in data_manager.due_cards(10)] == ['Brot']
+    assert data_manager.vocab_store().get('Haus')['known'] is True
+    assert data_manager.flush_vocab() == 0
+    with pytest.raises(KeyError):
+        data_manager.record_review('Stuhl', 3)
+
+
+def test_sessions_append_trim_and_response_ids(sqlite_db):
+    assert data_manager.list_sessions() == []
+    assert data_manager.load_session('s1') == []
+    data_manager.append_message('s1', 'user', 'aaa', max_tokens=5)
+    data_manager.append_message('s2', 'user', 'x')
+    res = data_manager.append_message('s1', 'assistant', 'bbbb', max_tokens=5)
+    assert res == [{'role': 'assistant', 'text': 'bbbb', 'tokens': 4}]
+    assert data_manager.load_session('s1') == res
+    assert data_manager.list_sessions() == ['s1', 's2']
+    meta = data_manager.session_manifest()['s1']
+    assert (meta['messages'], meta['tokens']) == (1, 4)
+    assert meta['first_ts'] <= meta['last_ts']
+    assert data_manager.get_response_id('s1') is None
+    data_manager.set_response_id('s1', 'resp_1')
+    assert data_manager.get_response_id('s1') == 'resp_1'
+    data_manager.set_response_id('s1', None)
+    assert data_manager.get_response_id('s1') is None
+    data_manager.set_response_id('unknown', None)
+    assert data_manager.list_sessions() == ['s1', 's2']
+    assert data_manager.get_summary('s1') is None
+    data_manager.set_summary('s1', {'text': 'Greetings', 'covered': 2})
+    assert data_manager.get_summary('s1') == {'text': 'Greetings', 'covered': 2}
+
+
+def test_append_returns_history_without_rereading(sqlite_db, monkeypatch):
+    backend = data_manager.get_backend()
+    data_manager.append_message('s1', 'user', 'aaa', max_tokens=8)
+    reads = []
+    real_load = backend.load_session
+    monkeypatch.setattr(backend, 'load_session', lambda sid: reads.append(sid) or real_load(sid))
+    data_manager.append_message('s1', 'user', 'bbbb', max_tokens=8)
+    res = data_manager.append_message('s1', 'user', 'cc', max_tokens=8)
+    assert [m['text'] for m in res] == ['bbbb', 'cc'] and reads == []
+    # A write through another connection is noticed and re-read once.
+    other = sqlite_backend.SqliteBackend(data_manager.SQLITE_FILE)
+    other.append_message('s1', {'role': 'assistant', 'text': 'd', 'tokens': 1}, 8)
+    res = data_manager.append_message('s1', 'user', 'e', max_tokens=8)
+    assert [m['text'] for m in res] == ['bbbb', 'cc', 'd', 'e'] and reads == ['s1']
+    assert res == real_load('s1')
+    # Only the most recently appended sessions are kept.
+    monkeypatch.setattr(sqlite_backend, 'CACHED_SESSIONS', 2)
+    for sid in ('s2', 's3'):
+        data_manager.append_message(sid, 'user', 'x', max_tokens=8)
+    assert list(backend._sessions) == ['s2', 's3']
+
+
+def test_legacy_memory_table_is_migrated_and_dropped(tmp_path):
+    import sqlite3
+
+    path = tmp_path / 'old.db'
+    with sqlite3.connect(path) as conn:
+        conn.execute('CREATE TABLE memory (date TEXT PRIMARY KEY, data TEXT NOT NULL)')
+        conn.execute('INSERT INTO memory VALUES (?, ?)', ('2023-01-01', '{"level": "A1"}'))
+    backend = sqlite_backend.SqliteBackend(path)
+    assert backend.load_memory() == {'2023-01-01': {'level': 'A1'}}
+    tables = {r[0] for r in backend.connect().execute("SELECT name FROM sqlite_master WHERE type = 'table'")}
+    assert 'memory' not in tables
+    assert sqlite_backend.SqliteBackend(path).load_memory() == {'2023-01-01': {'level': 'A1'}}
+
+
+def test_memory(sqlite_db):
+    assert data_manager.load_memory() == {}
+    data_manager.append_memory('2023-01-02', {'level': 'A1'})
+    data_manager.append_memory('2023-01-01', {'level': 'A0'})
+    assert data_manager.load_memory() == {'2023-01-01': {'level': 'A0'}, '2023-01-02': {'level': 'A1'}}
+    data_manager.append_memory('2023-01-02', {'level': 'A2'})
+    assert [c['entry'] for c in data_manager.memory_checkpoints('2023-01-02')] == [{'level': 'A1'}, {'level': 'A2'}]
+    assert data_manager.latest_memory()['entry'] == {'level': 'A2'}
+    assert data_manager.load_memory()['2023-01-02'] == {'level': 'A2'}
+    data_manager.save_memory({'2024-01-01': {'notes': 'x'}})
+    assert data_manager.load_memory() == {'2024-01-01': {'notes': 'x'}}
+
+
+def test_migrate_from_json(tmp_path, monkeypatch):
+    monkeypatch.setattr(data_manager, 'count_tokens', lambda text: len(text))
+    vocab_file = tmp_path / 'vocab.json'
+    vocab_file.write_text(json.dumps([{'root': 'Haus', 'english': 'house'}]), encoding='utf-8')
+    mem_file = tmp_path / 'memory.json'
+    mem_file.write_text(json.dumps({'2023-01-01': {'level': 'A1'}}), encoding='utf-8')
+    chat_file = tmp_path / 'chat.json'
+    chat_file.write_text(json.dumps({'s1': [{'role': 'user', 'text': 'hi'}]}), encoding='utf-8')
+    state_file = tmp_path / 'state.json'
+    state_file.write_text(json.dumps({'s1': {'response_id': 'resp_9', 'summary': {'text': 'x'}}}), encoding='utf-8')
+    for name, path in [('VOCAB_FILE', vocab_file), ('MEMORY_FILE', mem_file),
+                       ('CHAT_SESSIONS_FILE', chat_file), ('CHAT_STATE_FILE', state_file),
+                       ('SQLITE_FILE', tmp_path / 'tutor.db')]:
+        monkeypatch.setattr(data_manager, name, path)
+    counts = sqlite_backend.migrate_from_json()
+    assert counts == {'vocab': 1, 'memory': 1, 'sessions': 1, 'messages': 1}
+    monkeypatch.setattr(data_manager, 'STORAGE_BACKEND', 'sqlite')
+    assert data_manager.vocab_store().contains('haus')
+    assert data_manager.load_memory() == {'2023-01-01': {'level': 'A1'}}
+    assert data_manager.load_session('s1') == [{'role': 'user', 'text': 'hi', 'tokens': 2}]
+    assert data_manager.get_response_id('s1') == 'resp_9'
+    assert data_manager.get_summary('s1') == {'text': 'x'}
+
+
+def test_adds_summary_column_to_old_databases(tmp_path):
+    import sqlite3
+
+    db = tmp_path / 'old.db'
+    with sqlite3.connect(db) as conn:
+        conn.execute('CREATE TABLE sessions (session_id TEXT PRIMARY KEY, tokens INTEGER NOT NULL DEFAULT 0, response_id TEXT)')
+        conn.execute("INSERT INTO sessions (session_id) VALUES ('s1')")
+    backend = sqlite_backend.SqliteBackend(db)
+    assert backend.get_summary('s1') is None
+    backend.set_summary('s1', {'text': 'x'})
+    assert backend.get_summary('s1') == {'text': 'x'}
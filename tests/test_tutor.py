@@ -5,8 +5,10 @@ import os
 sys.path.insert(0, os.path.abspath(os.path.join(os.path.dirname(__file__), '..')))
 
 import json
+import subprocess
 from datetime import date
 
+import openai
 import pytest
 
 import tutor
@@ -14,8 +16,72 @@ import data_manager
 
 
 class DummyResponse:
-    def __init__(self, output_text):
+    def __init__(self, output_text, id=None):
         self.output_text = output_text
+        self.id = id
+
+
+@pytest.fixture(autouse=True)
+def chat_state_file(tmp_path, monkeypatch):
+    monkeypatch.setattr(data_manager, 'CHAT_STATE_FILE', tmp_path / 'chat_state.json')
+
+
+@pytest.fixture(autouse=True)
+def staged_batch_file(tmp_path, monkeypatch):
+    monkeypatch.setattr(data_manager, 'STAGED_BATCH_FILE', tmp_path / 'staged_batch.json')
+
+
+@pytest.fixture(autouse=True)
+def fresh_quiz_index(monkeypatch):
+    # Tests swap load_vocab without writing, so the version would not change.
+    monkeypatch.setattr(tutor, '_quiz_index', None)
+
+
+@pytest.fixture(autouse=True)
+def fresh_client(monkeypatch):
+    # tutor.client is built lazily; give each test its own with a dummy key.
+    monkeypatch.setenv('OPENAI_API_KEY', 'test-key')
+    monkeypatch.setattr(tutor, '_client', None)
+
+
+def test_import_is_lazy():
+    code = (
+        "import sys, tutor, data_manager; "
+        "print(sorted({'openai', 'tiktoken'} & set(sys.modules)))"
+    )
+    env = {k: v for k, v in os.environ.items() if k != 'OPENAI_API_KEY'}
+    out = subprocess.run(
+        [sys.executable, '-c', code], cwd=os.path.dirname(os.path.dirname(os.path.abspath(__file__))),
+        env=env, capture_output=True, text=True, check=True,
+    ).stdout
+    assert out.strip() == '[]'
+
+
+def test_client_is_built_once():
+    assert tutor.client is tutor.get_client() is tutor.client
+    fake = object()
+    tutor.set_client(fake)
+    assert tutor.client is fake
+
+
+def test_hedging_times_only_uncached_requests(tmp_path, monkeypatch):
+    import llm_cache
+    import llm_client
+    from types import SimpleNamespace
+
+    monkeypatch.setattr(llm_cache, 'CACHE_DIR', tmp_path / 'cache')
+    monkeypatch.setattr(llm_cache, 'CACHE_MODE', 'on')
+    calls = []
+
+    def create(**kwargs):
+        calls.append(kwargs)
+        return SimpleNamespace(id='r', output_text='{}', usage=None)
+
+    tutor.set_client(SimpleNamespace(responses=SimpleNamespace(create=create)))
+    for _ in range(3):
+        tutor._create_response(hedge='hedge-cache-test', model='o4-mini', input='Hallo')
+    assert len(calls) == 1
+    assert len(llm_client.latency_window('hedge-cache-test')) == 1
 
 
 def test_prepare_quiz_empty_vocab(monkeypatch):
@@ -39,6 +105,47 @@ def test_prepare_quiz_basic(monkeypatch):
         assert all(isinstance(d, str) for d in q['distractors'])
 
 
+def test_prepare_quiz_distinct_glosses_and_weights(monkeypatch):
+    today = date.today().isoformat()
+    vocab = [
+        {'root': f'Wort{i}', 'english': ['house', 'home', 'tree', 'water'][i % 4],
+         'batch_id': i // 10, 'due': '2999-01-01' if i else today, 'known': bool(i), 'ease': 2.5}
+        for i in range(40)
+    ]
+    monkeypatch.setattr(data_manager, 'load_vocab', lambda: vocab)
+    quiz = tutor.prepare_quiz(40)
+    assert sorted(q['root'] for q in quiz) == sorted(e['root'] for e in vocab)
+    for q in quiz:
+        assert len(q['distractors']) == 3
+        assert len(set(q['distractors'])) == 3
+        assert q['expected_answer'] not in q['distractors']
+    # The only due, unknown word is drawn 4 / (4 + 39 * 0.25) of the time, not 1/40.
+    firsts = [tutor.prepare_quiz(1)[0]['root'] for _ in range(200)]
+    assert firsts.count('Wort0') > 30
+
+
+def test_quiz_index_rebuilt_after_writes(tmp_path, monkeypatch):
+    monkeypatch.setattr(data_manager, 'VOCAB_FILE', tmp_path / 'vocab.json')
+    data_manager.save_vocab([{'root': 'Haus', 'english': 'house'}, {'root': 'Baum', 'english': 'tree'}])
+    index = tutor.quiz_index()
+    assert tutor.quiz_index() is index
+    data_manager.save_vocab([{'root': 'Haus', 'english': 'house'}])
+    assert len(tutor.quiz_index()) == 1
+
+
+def test_hard_distractors_share_similarity_group():
+    import quiz_engine
+
+    vocab = [{'root': 'laufen', 'english': 'to run', 'batch_id': 1},
+             {'root': 'kaufen', 'english': 'to buy', 'batch_id': 2}]
+    vocab += [{'root': f'Ding{i}', 'english': f'thing {i}', 'batch_id': 3} for i in range(50)]
+    index = quiz_engine.QuizIndex(vocab)
+    for _ in range(5):
+        question = next(q for q in index.quiz(len(vocab), hard=1) if q['root'] == 'laufen')
+        assert question['distractors'][0] == 'to buy'
+        assert len(question['distractors']) == 3
+
+
 def test_write_memory(monkeypatch):
     calls = []
 
@@ -67,23 +174,18 @@ def test_generate_new_batch_not_due(monkeypatch):
     assert not called['api']
 
 
-def test_generate_new_batch_basic(monkeypatch):
+def test_generate_new_batch_basic(tmp_path, monkeypatch):
+    vocab_file = tmp_path / 'vocab.json'
+    monkeypatch.setattr(data_manager, 'VOCAB_FILE', vocab_file)
     monkeypatch.setattr(data_manager, 'days_since_last_batch', lambda: 3)
-    monkeypatch.setattr(data_manager, 'is_new_word', lambda root: True)
-    monkeypatch.setattr(data_manager, 'load_vocab', lambda: [])
-    saved = []
-
-    def fake_save(vocab_list):
-        saved.extend(vocab_list)
-
-    monkeypatch.setattr(data_manager, 'save_vocab', fake_save)
 
     items = [
         {
             'root': 'Haus',
             'english': 'house',
             'examples': {'past': 'Hatte ein Haus', 'present': 'Habe ein Haus', 'future': 'Werde ein Haus haben'}
-        }
+        },
+        {'root': 'haus', 'english': 'house', 'examples': {}},
     ]
     monkeypatch.setattr(
         tutor.client.responses,
@@ -100,32 +202,29 @@ def test_generate_new_batch_basic(monkeypatch):
     assert entry['taught_on'] == date.today().isoformat()
     assert entry['last_reviewed'] is None
     assert entry['known'] is False
+    saved = json.loads(vocab_file.read_text(encoding='utf-8'))
     assert saved == new
 
 
-def test_generate_new_batch_duplicate(monkeypatch):
+def test_generate_new_batch_duplicate(tmp_path, monkeypatch):
+    vocab_file = tmp_path / 'vocab.json'
+    existing = [{'root': 'Haus', 'english': 'house', 'taught_on': '2023-01-01', 'batch_id': 1,
+                 'examples': {}, 'last_reviewed': None, 'known': False}]
+    vocab_file.write_text(json.dumps(existing), encoding='utf-8')
+    monkeypatch.setattr(data_manager, 'VOCAB_FILE', vocab_file)
     monkeypatch.setattr(data_manager, 'days_since_last_batch', lambda: 3)
-    monkeypatch.setattr(data_manager, 'is_new_word', lambda root: False)
-    monkeypatch.setattr(data_manager, 'load_vocab', lambda: [])
-
-    called = {'saved': False}
-
-    def fake_save(_):
-        called['saved'] = True
-
-    monkeypatch.setattr(data_manager, 'save_vocab', fake_save)
     monkeypatch.setattr(
         tutor.client.responses,
         'create',
         lambda *args, **kwargs: DummyResponse(json.dumps({
             "german_sentences": [
-                {'root': 'Haus', 'english': 'house', 'examples': {}}
+                {'root': 'haus', 'english': 'house', 'examples': {}}
             ]
         }))
     )
     res = tutor.generate_new_batch(1)
     assert res == []
-    assert not called['saved']
+    assert json.loads(vocab_file.read_text(encoding='utf-8')) == existing
 
 
 def test_chat_session_interact(monkeypatch):
@@ -148,4 +247,357 @@ def test_chat_session_interact(monkeypatch):
     reply = tutor.chat_session_interact(session_id, 'Hi there')
     assert calls[0] == (session_id, 'user', 'Hi there')
     assert calls[1] == (session_id, 'assistant', '{"reply": "Hallo"}')
-    assert reply == '{"reply": "Hallo"}'
\ No newline at end of file
+    assert reply == '{"reply": "Hallo"}'
+
+class DummyEvent:
+    def __init__(self, type, delta=None, response=None):
+        self.type = type
+        self.delta = delta
+        self.response = response
+
+
+def test_chat_session_stream(monkeypatch):
+    monkeypatch.setattr(data_manager, 'load_session', lambda sid: [])
+    monkeypatch.setattr(data_manager, 'trim_messages', lambda msgs, max_tokens=600000: msgs)
+    calls = []
+    monkeypatch.setattr(data_manager, 'append_message', lambda session, role, text: calls.append((role, text)))
+    requests = []
+
+    def fake_create(**kwargs):
+        requests.append(kwargs)
+        return iter([
+            DummyEvent('response.created'),
+            DummyEvent('response.output_text.delta', 'Hal'),
+            DummyEvent('response.output_text.delta', 'lo'),
+            DummyEvent('response.completed', response=DummyResponse('Hallo', id='resp_1')),
+        ])
+
+    monkeypatch.setattr(tutor.client.responses, 'create', fake_create)
+    deltas = list(tutor.chat_session_stream('s1', 'Hi'))
+    assert deltas == ['Hal', 'lo']
+    assert requests[0]['stream'] is True
+    assert calls == [('user', 'Hi'), ('assistant', 'Hallo')]
+    assert data_manager.get_response_id('s1') == 'resp_1'
+
+
+def test_chat_session_stream_cancelled(monkeypatch):
+    monkeypatch.setattr(data_manager, 'load_session', lambda sid: [])
+    monkeypatch.setattr(data_manager, 'trim_messages', lambda msgs, max_tokens=600000: msgs)
+    calls = []
+    monkeypatch.setattr(data_manager, 'append_message', lambda session, role, text: calls.append((role, text)))
+    monkeypatch.setattr(
+        tutor.client.responses,
+        'create',
+        lambda **kwargs: iter([DummyEvent('response.output_text.delta', t) for t in ('Ha', 'll', 'o')])
+    )
+    stream = tutor.chat_session_stream('s1', 'Hi')
+    assert next(stream) == 'Ha'
+    stream.close()
+    assert calls == [('user', 'Hi'), ('assistant', 'Ha')]
+    assert data_manager.get_response_id('s1') is None
+
+
+def test_chat_session_interact_chains_responses(tmp_path, monkeypatch):
+    monkeypatch.setattr(data_manager, 'CHAT_STORAGE', 'jsonl')
+    monkeypatch.setattr(data_manager, 'CHAT_SESSIONS_DIR', tmp_path / 'sessions')
+    monkeypatch.setattr(data_manager, 'count_tokens', lambda text: len(text))
+    requests = []
+
+    def fake_create(**kwargs):
+        requests.append(kwargs)
+        return DummyResponse('Antwort %d' % len(requests), id='resp_%d' % len(requests))
+
+    monkeypatch.setattr(tutor.client.responses, 'create', fake_create)
+    tutor.chat_session_interact('s1', 'Erste Frage')
+    tutor.chat_session_interact('s1', 'Zweite Frage')
+    first, second = requests
+    # The first turn replays history; the user message is sent exactly once.
+    assert [m['role'] for m in first['input']] == ['system', 'user']
+    assert 'previous_response_id' not in first
+    assert second['previous_response_id'] == 'resp_1'
+    assert second['input'] == [{'role': 'user', 'content': 'Zweite Frage'}]
+    assert data_manager.get_response_id('s1') == 'resp_2'
+    assert [m['text'] for m in data_manager.load_session('s1')] == [
+        'Erste Frage', 'Antwort 1', 'Zweite Frage', 'Antwort 2']
+
+
+def test_chat_session_interact_replays_lost_chain(tmp_path, monkeypatch):
+    monkeypatch.setattr(data_manager, 'CHAT_STORAGE', 'jsonl')
+    monkeypatch.setattr(data_manager, 'CHAT_SESSIONS_DIR', tmp_path / 'sessions')
+    monkeypatch.setattr(data_manager, 'count_tokens', lambda text: len(text))
+    data_manager.append_message('s1', 'user', 'Alt')
+    data_manager.append_message('s1', 'assistant', 'Antwort')
+    data_manager.set_response_id('s1', 'resp_expired')
+
+    class Gone(openai.NotFoundError):
+        def __init__(self):
+            Exception.__init__(self, 'gone')
+
+    requests = []
+
+    def fake_create(**kwargs):
+        requests.append(kwargs)
+        if 'previous_response_id' in kwargs:
+            raise Gone()
+        return DummyResponse('Neu', id='resp_new')
+
+    monkeypatch.setattr(tutor.client.responses, 'create', fake_create)
+    assert tutor.chat_session_interact('s1', 'Frage') == 'Neu'
+    assert [m['content'] for m in requests[1]['input']] == [
+        tutor.CHAT_SYSTEM_PROMPT, 'Alt', 'Antwort', 'Frage']
+    assert data_manager.get_response_id('s1') == 'resp_new'
+
+
+def test_compaction_folds_old_turns_incrementally(tmp_path, monkeypatch):
+    monkeypatch.setattr(data_manager, 'CHAT_STORAGE', 'jsonl')
+    monkeypatch.setattr(data_manager, 'CHAT_SESSIONS_DIR', tmp_path / 'sessions')
+    monkeypatch.setattr(data_manager, 'count_tokens', lambda text: len(text))
+    monkeypatch.setattr(tutor, 'COMPACTION', True)
+    monkeypatch.setattr(tutor, 'COMPACT_BUDGET_TOKENS', 25)
+    monkeypatch.setattr(tutor, 'COMPACT_KEEP_TOKENS', 10)
+    summarized = []
+
+    def fake_summarize(previous, messages):
+        summarized.append((previous, [m['text'] for m in messages]))
+        return (previous or '') + '+' + ','.join(m['text'] for m in messages)
+
+    monkeypatch.setattr(tutor, '_summarize', fake_summarize)
+    requests = []
+
+    def fake_create(**kwargs):
+        requests.append(kwargs)
+        return DummyResponse('A%d' % len(requests), id='resp_%d' % len(requests))
+
+    monkeypatch.setattr(tutor.client.responses, 'create', fake_create)
+    for i in range(6):
+        tutor.chat_session_interact('s1', 'frage%d' % i)
+    # Each summarization saw only turns it had not folded before.
+    folded = [text for _, texts in summarized for text in texts]
+    assert len(folded) == len(set(folded))
+    assert all(prev == (summarized[i - 1][0] or '') + '+' + ','.join(summarized[i - 1][1])
+               for i, (prev, _) in enumerate(summarized) if i)
+    # The live context (everything after the summary) stays under budget
+    # and the full history is still stored.
+    turns_folded = len(summarized)
+    context = tutor._replay_context('s1')
+    previous, texts = summarized[-1]
+    summary = data_manager.get_summary('s1')
+    assert summary['text'] == (previous or '') + '+' + ','.join(texts)
+    assert context[1]['content'].endswith(summary['text'])
+    live = context[2:]
+    assert sum(len(m['content']) for m in live) <= tutor.COMPACT_BUDGET_TOKENS
+    assert len(data_manager.load_session('s1')) == 12
+    # A turn that folded history restarted the chain with the compact context.
+    restarted = [r for r in requests[1:] if 'previous_response_id' not in r]
+    assert turns_folded and len(restarted) == turns_folded
+    assert all(r['input'][1]['content'].startswith('Summary of the earlier conversation') for r in restarted)
+
+
+def test_summary_boundary_survives_trimming():
+    history = [{'role': 'user', 'text': t} for t in ('a', 'b', 'c', 'd')]
+    summary = {'covered': 2, 'through': tutor._message_key(history[1])}
+    assert tutor._summary_boundary(history, summary) == 2
+    # Two oldest messages were trimmed: the boundary is found again by key.
+    assert tutor._summary_boundary(history[1:], summary) == 1
+    assert tutor._summary_boundary(history[2:], summary) == 0
+    assert tutor._summary_boundary(history, None) == 0
+
+
+def _word_items(prefix, count):
+    return [{'root': f'{prefix}{i}', 'english': f'{prefix} {i}', 'examples': {}} for i in range(count)]
+
+
+def test_generate_new_batch_sharded(tmp_path, monkeypatch):
+    import re
+    import threading
+
+    monkeypatch.setattr(data_manager, 'VOCAB_FILE', tmp_path / 'vocab.json')
+    monkeypatch.setattr(data_manager, 'days_since_last_batch', lambda: 3)
+    lock = threading.Lock()
+    prompts = []
+
+    def fake_create(**kwargs):
+        prompt = kwargs['input'][-1]['content']
+        count = int(re.search(r'Generate (\d+)', prompt).group(1))
+        with lock:
+            prompts.append(prompt)
+            call = len(prompts)
+        # Every first-round shard repeats 'Haus' to exercise cross-shard dedupe.
+        items = _word_items(f'w{call}_', count)
+        if call <= 4:
+            items.insert(0, {'root': 'Haus', 'english': 'house', 'examples': {}})
+        return DummyResponse(json.dumps({'german_sentences': items[:count]}))
+
+    monkeypatch.setattr(tutor.client.responses, 'create', fake_create)
+    new = tutor.generate_new_batch(10, shards=4)
+    roots = [e['root'] for e in new]
+    assert len(roots) == 10 and len(set(roots)) == 10
+    assert roots.count('Haus') == 1
+    # 4 concurrent shard requests (3+3+2+2) plus one top-up round.
+    assert sorted(int(re.search(r'Generate (\d+)', p).group(1)) for p in prompts[:4]) == [2, 2, 3, 3]
+    assert len(prompts) > 4
+    hints = [p.split('related to ')[-1] for p in prompts[:4]]
+    assert len(set(hints)) == 4
+
+
+def test_generate_new_batch_tops_up_missing(tmp_path, monkeypatch):
+    vocab_file = tmp_path / 'vocab.json'
+    vocab_file.write_text(json.dumps([{'root': 'Haus'}, {'root': 'Baum'}]), encoding='utf-8')
+    monkeypatch.setattr(data_manager, 'VOCAB_FILE', vocab_file)
+    monkeypatch.setattr(data_manager, 'days_since_last_batch', lambda: 3)
+    responses = [
+        _word_items('x', 1) + [{'root': 'haus', 'english': 'house', 'examples': {}},
+                               {'root': 'Baum', 'english': 'tree', 'examples': {}}],
+        _word_items('y', 2),
+    ]
+    prompts = []
+
+    def fake_create(**kwargs):
+        prompts.append(kwargs['input'][-1]['content'])
+        return DummyResponse(json.dumps({'german_sentences': responses[len(prompts) - 1]}))
+
+    monkeypatch.setattr(tutor.client.responses, 'create', fake_create)
+    new = tutor.generate_new_batch(3)
+    assert [e['root'] for e in new] == ['x0', 'y0', 'y1']
+    assert prompts[1].startswith('Generate 2 ')
+
+
+class Usage:
+    def __init__(self, output_tokens):
+        self.output_tokens = output_tokens
+
+
+def test_generate_new_batch_excludes_known_and_reports_waste(tmp_path, monkeypatch):
+    vocab_file = tmp_path / 'vocab.json'
+    vocab_file.write_text(json.dumps([{'root': 'Haus'}, {'root': 'Baum'}]), encoding='utf-8')
+    monkeypatch.setattr(data_manager, 'VOCAB_FILE', vocab_file)
+    monkeypatch.setattr(data_manager, 'days_since_last_batch', lambda: 3)
+    responses = [
+        [{'root': 'Baum', 'english': 'tree', 'examples': {}}] + _word_items('x', 1),
+        _word_items('y', 1),
+    ]
+    prompts = []
+
+    def fake_create(**kwargs):
+        prompts.append(kwargs['input'][-1]['content'])
+        response = DummyResponse(json.dumps({'german_sentences': responses[len(prompts) - 1]}))
+        response.usage = Usage(100)
+        return response
+
+    monkeypatch.setattr(tutor.client.responses, 'create', fake_create)
+    new = tutor.generate_new_batch(2)
+    assert [e['root'] for e in new] == ['x0', 'y0']
+    assert 'do not use them: Baum, Haus.' in prompts[0]
+    # The follow-up asks for the missing word only and excludes this batch too.
+    assert prompts[1].startswith('Generate 1 ')
+    assert 'do not use them: x0, Baum, Haus.' in prompts[1]
+    stats = tutor.last_batch_stats
+    assert stats['requests'] == 2 and stats['candidates'] == 3
+    assert stats['duplicates'] == 1
+    assert stats['output_tokens'] == 200 and stats['wasted_tokens'] == 50
+
+
+def test_prefetched_batch_is_committed_without_api_calls(tmp_path, monkeypatch):
+    monkeypatch.setattr(data_manager, 'VOCAB_FILE', tmp_path / 'vocab.json')
+    calls = []
+
+    def fake_create(**kwargs):
+        calls.append(kwargs)
+        return DummyResponse(json.dumps({'german_sentences': _word_items('w', 3)}))
+
+    monkeypatch.setattr(tutor.client.responses, 'create', fake_create)
+    staged = tutor.prefetch_next_batch(3)
+    assert [w['root'] for w in staged['words']] == ['w0', 'w1', 'w2']
+    assert len(calls) == 1
+    # A prefetched root was learned in the meantime; only it is re-requested.
+    data_manager.vocab_store().add_many([{'root': 'W1', 'taught_on': '2020-01-01'}])
+    monkeypatch.setattr(data_manager, 'days_since_last_batch', lambda: 3)
+    calls.clear()
+    monkeypatch.setattr(
+        tutor.client.responses, 'create',
+        lambda **kwargs: calls.append(kwargs) or DummyResponse(json.dumps({'german_sentences': _word_items('x', 1)})),
+    )
+    new = tutor.generate_new_batch(3)
+    assert [e['root'] for e in new] == ['w0', 'w2', 'x0']
+    assert len(calls) == 1 and 'Generate 1 ' in calls[0]['input'][-1]['content']
+    assert tutor.last_batch_stats['prefetched'] == 2
+    assert data_manager.load_staged_batch() is None
+
+
+def test_staged_words_survive_failures_and_leftovers_stay_staged(tmp_path, monkeypatch):
+    monkeypatch.setattr(data_manager, 'VOCAB_FILE', tmp_path / 'vocab.json')
+    monkeypatch.setattr(data_manager, 'days_since_last_batch', lambda: 3)
+    data_manager.save_staged_batch({'words': _word_items('w', 2)})
+
+    def offline(**kwargs):
+        raise ConnectionError('offline')
+
+    monkeypatch.setattr(tutor.client.responses, 'create', offline)
+    # Topping up the partial batch fails: the staged words are kept.
+    with pytest.raises(ConnectionError):
+        tutor.generate_new_batch(3)
+    assert len(data_manager.load_staged_batch()['words']) == 2
+    data_manager.save_staged_batch({'words': _word_items('w', 5), 'stats': {'requests': 1}})
+    new = tutor.generate_new_batch(3)
+    assert [e['root'] for e in new] == ['w0', 'w1', 'w2']
+    left = data_manager.load_staged_batch()
+    assert [w['root'] for w in left['words']] == ['w3', 'w4'] and left['stats'] == {}
+
+
+def test_generate_new_batch_waits_for_running_prefetch(tmp_path, monkeypatch):
+    import threading
+
+    monkeypatch.setattr(data_manager, 'VOCAB_FILE', tmp_path / 'vocab.json')
+    monkeypatch.setattr(data_manager, 'days_since_last_batch', lambda: 3)
+    release = threading.Event()
+
+    def slow_prefetch():
+        release.wait()
+        data_manager.save_staged_batch({'words': _word_items('w', 2)})
+
+    thread = threading.Thread(target=slow_prefetch)
+    thread.start()
+    monkeypatch.setattr(tutor, '_prefetch_thread', thread)
+    threading.Timer(0.05, release.set).start()
+    assert [e['root'] for e in tutor.generate_new_batch(2)] == ['w0', 'w1']
+
+
+def test_start_prefetch_only_when_nearly_due(monkeypatch):
+    monkeypatch.setattr(tutor, '_prefetch_checked', None)
+    ran = []
+    monkeypatch.setattr(tutor, 'prefetch_next_batch', lambda n, shards=None: ran.append(n))
+    monkeypatch.setattr(data_manager, 'days_since_last_batch', lambda: 0)
+    assert tutor.start_prefetch(20) is None
+    monkeypatch.setattr(data_manager, 'days_since_last_batch', lambda: 2)
+    # Same vocabulary version and day: the due check is not repeated.
+    assert tutor.start_prefetch(20) is None
+    data_manager.bump_version('vocab')
+    thread = tutor.start_prefetch(20)
+    thread.join()
+    assert ran == [20]
+    data_manager.save_staged_batch({'words': _word_items('w', 20)})
+    data_manager.bump_version('vocab')
+    assert tutor.start_prefetch(20) is None
+
+
+def test_failed_prefetch_is_logged_and_retried(monkeypatch, caplog):
+    monkeypatch.setattr(tutor, '_prefetch_checked', None)
+    monkeypatch.setattr(data_manager, 'days_since_last_batch', lambda: 2)
+
+    def fail(n, shards=None):
+        raise RuntimeError('boom')
+
+    monkeypatch.setattr(tutor, 'prefetch_next_batch', fail)
+    tutor.start_prefetch(20).join()
+    assert 'boom' in caplog.text
+    assert tutor._prefetch_checked is None
+    ran = []
+    monkeypatch.setattr(tutor, 'prefetch_next_batch', lambda n, shards=None: ran.append(n))
+    tutor.start_prefetch(20).join()
+    assert ran == [20]
+
+
+def test_exclusion_list_respects_budget():
+    roots = ['Haus', 'Baum', 'Wasser', 'Schmetterling']
+    assert tutor._exclusion_list(roots, budget=4) == ['Haus', 'Baum']
+    assert tutor._exclusion_list(roots, budget=0) == []
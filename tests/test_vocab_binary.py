@@ -0,0 +1,125 @@
+import sys
+import os
+import gc
+import json
+from datetime import date, timedelta
+
+sys.path.insert(0, os.path.abspath(os.path.join(os.path.dirname(__file__), '..')))
+
+import pytest
+
+import data_manager
+import vocab_binary
+
+
+@pytest.fixture
+def binary_vocab(tmp_path, monkeypatch):
+    path = tmp_path / 'vocab.bin'
+    monkeypatch.setattr(data_manager, 'STORAGE_BACKEND', 'binary')
+    monkeypatch.setattr(data_manager, 'VOCAB_BINARY_FILE', path)
+    monkeypatch.setattr(data_manager, 'VOCAB_FILE', tmp_path / 'vocab.json')
+    return path
+
+
+def test_vocab_roundtrip_and_store(binary_vocab):
+    assert isinstance(data_manager.get_backend(), vocab_binary.BinaryBackend)
+    assert data_manager.load_vocab() == []
+    assert data_manager.days_since_last_batch() == float('inf')
+    sample = [{'root': 'Haus', 'english': 'house', 'taught_on': '2023-01-01',
+               'batch_id': 1, 'examples': {'present': ['Das Haus ist alt.']}, 'last_reviewed': None,
+               'known': False}]
+    data_manager.save_vocab(sample)
+    assert data_manager.load_vocab() == sample
+    store = data_manager.vocab_store()
+    assert store.contains('HAUS') and not data_manager.is_new_word('haus')
+    added = store.add_many([{'root': 'haus'}, {'root': 'Baum', 'batch_id': 2, 'taught_on': date.today().isoformat()},
+                            {'root': 'baum'}])
+    assert [e['root'] for e in added] == ['Baum']
+    assert store.get('baum')['english'] is None
+    assert store.get('haus')['examples'] == sample[0]['examples']
+    assert store.max_batch_id() == 2
+    assert store.recent_roots(5) == ['Baum', 'Haus']
+    assert data_manager.days_since_last_batch() == 0
+
+
+def test_odd_values_round_trip_exactly(tmp_path):
+    entries = [
+        {'root': 'Haus', 'english': 'house', 'taught_on': '2023-1-1', 'batch_id': 'x', 'examples': None,
+         'last_reviewed': None, 'known': None, 'ease': 3, 'note': {'tags': ['a']}},
+        {'root': None, 'english': 'ünïcödé', 'taught_on': None, 'batch_id': None, 'examples': {},
+         'last_reviewed': '2024-02-29', 'known': True, 'due': '2024-03-01', 'interval': 1, 'ease': 2.36, 'reps': 1},
+    ]
+    path = tmp_path / 'vocab.bin'
+    vocab_binary.write_vocab(path, entries)
+    assert vocab_binary.VocabFile(path).entries() == entries
+
+
+def test_scalar_queries_do_not_read_text(binary_vocab, monkeypatch):
+    today = date.today()
+    data_manager.save_vocab([
+        {'root': 'Haus', 'taught_on': (today - timedelta(days=2)).isoformat(), 'batch_id': 1},
+        {'root': 'Baum', 'taught_on': (today - timedelta(days=5)).isoformat(), 'batch_id': 3},
+    ])
+
+    def no_text(*args):
+        raise AssertionError('text was read')
+
+    monkeypatch.setattr(vocab_binary.VocabFile, '_texts', no_text)
+    assert data_manager.days_since_last_batch() == 2
+    assert data_manager.vocab_store().max_batch_id() == 3
+    assert data_manager.due_count() == 2
+
+
+def test_due_queue_and_review_in_place(binary_vocab):
+    today = date.today()
+    data_manager.save_vocab([
+        {'root': 'Haus', 'taught_on': (today - timedelta(days=2)).isoformat()},
+        {'root': 'Baum', 'due': (today + timedelta(days=3)).isoformat()},
+        {'root': 'Brot'},
+    ])
+    size = binary_vocab.stat().st_size
+    assert data_manager.due_count() == 2
+    assert [e['root'] for e in data_manager.due_cards(10)] == ['Brot', 'Haus']
+    assert [e['root'] for e in data_manager.due_cards(1, offset=1)] == ['Haus']
+    data_manager.record_review('haus', 5, defer=True)
+    assert [e['root'] for e in data_manager.due_cards(10)] == ['Brot']
+    assert binary_vocab.stat().st_size == size
+    reread = vocab_binary.VocabFile(binary_vocab).entry(0)
+    assert reread['known'] is True and reread['reps'] == 1
+    assert data_manager.flush_vocab() == 0
+    with pytest.raises(KeyError):
+        data_manager.record_review('Auto', 5)
+
+
+def test_other_store_sees_in_place_review_and_old_maps_close_when_unused(binary_vocab):
+    data_manager.save_vocab([{'root': 'Haus', 'examples': ['Das Haus.']}, {'root': 'Baum'}])
+    reader = vocab_binary.BinaryVocabStore(binary_vocab)
+    writer = vocab_binary.BinaryVocabStore(binary_vocab)
+    entry = reader.get('Haus')
+    old = reader._file
+    st = binary_vocab.stat()
+    writer.review('Haus', 5)
+    # Even if the mtime does not move, the header generation does.
+    os.utime(binary_vocab, ns=(st.st_atime_ns, st.st_mtime_ns))
+    assert reader.get('Haus')['reps'] == 1
+    # The replaced map stays open while an entry read from it is alive.
+    mm = old._mm
+    del old
+    gc.collect()
+    assert not mm.closed
+    assert entry['examples'] == ['Das Haus.']
+    del entry
+    gc.collect()
+    assert mm.closed
+
+
+def test_json_import_export(tmp_path, monkeypatch):
+    monkeypatch.setattr(data_manager, 'VOCAB_FILE', tmp_path / 'vocab.json')
+    monkeypatch.setattr(data_manager, 'VOCAB_BINARY_FILE', tmp_path / 'vocab.bin')
+    sample = [{'root': 'Haus', 'english': 'house', 'taught_on': '2023-01-01', 'batch_id': 1,
+               'examples': {'past': ['Das Haus war alt.']}, 'last_reviewed': None, 'known': False}]
+    (tmp_path / 'vocab.json').write_text(json.dumps(sample), encoding='utf-8')
+    assert vocab_binary.main(['import']) == 0
+    (tmp_path / 'vocab.json').unlink()
+    assert vocab_binary.export_json() == 1
+    assert json.loads((tmp_path / 'vocab.json').read_text(encoding='utf-8')) == sample
@@ -1,21 +1,186 @@
 """Core tutoring logic for German Tutor."""
-import json
-import random
+import functools
+import hashlib
+import logging
+import os
+import threading
+from concurrent.futures import ThreadPoolExecutor
 from datetime import date
 
-from openai import OpenAI
-
 import data_manager
+import llm_cache
+import llm_client
+import metrics
+import providers
 
-client = OpenAI()
+logger = logging.getLogger(__name__)
 
-def generate_new_batch(n_words):
-    """Generate and append a new batch of words if the interval has elapsed."""
-    if data_manager.days_since_last_batch() < 3:
-        return []
-    vocab = data_manager.load_vocab()
-    next_id = 1 + max((e.get("batch_id") or 0) for e in vocab) if vocab else 1
-    today = date.today().isoformat()
+# The openai package is imported and the client built on first use: importing
+# openai alone costs more than half a second, and OpenAI() needs an API key.
+_client = None
+
+def get_client():
+    """Return the shared client, building it on first use.
+
+    The client pools connections and retries within a deadline (llm_client).
+    """
+    global _client
+    if _client is None:
+        _client = llm_client.ResilientClient(llm_client.build_openai_client())
+    return _client
+
+def set_client(new_client):
+    """Use new_client (e.g. one cached by the UI) for all API calls."""
+    global _client
+    _client = new_client
+
+def __getattr__(name):
+    # Keeps the old module attribute tutor.client working.
+    if name == "client":
+        return get_client()
+    raise AttributeError(f"module {__name__!r} has no attribute {name!r}")
+
+# Hedge the idempotent word-batch requests (see llm_client.hedged). Off by
+# default: a hedge sends a second, equally billed request.
+HEDGE_BATCH_REQUESTS = False
+
+def _create_response(hedge=None, **kwargs):
+    """Call client.responses.create through the LLM response cache (traced).
+
+    hedge names the kind of call to hedge, for idempotent requests only;
+    only the network call below the cache is hedged, so cache hits never
+    enter its latency window.
+    """
+    create = get_client().responses.create
+    if hedge is not None and not kwargs.get("stream"):
+        network = create
+
+        def create(**request):
+            return llm_client.hedged(functools.partial(network, **request), hedge)
+
+    call = functools.partial(llm_cache.cached_create, create, **kwargs)
+    return metrics.trace_llm(call, stream=kwargs.get("stream", False), model=kwargs.get("model"))
+
+# Provider ("openai", "ollama" or "fake", see providers.py) per kind of call:
+# word batches, chat turns and chat summaries. GERMAN_TUTOR_PROVIDER sets all
+# of them, GERMAN_TUTOR_PROVIDER_<KIND> (e.g. _SUMMARY) a single one.
+CALL_KINDS = ("batch", "chat", "summary")
+PROVIDERS = {
+    kind: os.environ.get(
+        f"GERMAN_TUTOR_PROVIDER_{kind.upper()}", os.environ.get("GERMAN_TUTOR_PROVIDER", "openai")
+    )
+    for kind in CALL_KINDS
+}
+# Model each provider uses per kind of call.
+MODELS = {
+    "openai": {"batch": "o4-mini", "chat": "gpt-4.1", "summary": "gpt-4.1-nano"},
+    "ollama": {"batch": "llama3.1", "chat": "llama3.1", "summary": "llama3.2:1b"},
+    "fake": {"batch": "fake", "chat": "fake", "summary": "fake"},
+}
+_providers = {}
+
+def get_provider(kind):
+    """Return the provider configured for kind of call, building it once."""
+    name = PROVIDERS[kind]
+    provider = _providers.get(name)
+    if provider is None:
+        provider = _providers[name] = providers.create_provider(name, openai_create=_create_response)
+    return provider
+
+def get_model(kind):
+    """Return the model name for kind of call on its configured provider."""
+    return MODELS[PROVIDERS[kind]][kind]
+
+# Split a batch into this many concurrent requests (1 = a single request).
+BATCH_SHARDS = 1
+# Extra rounds asking only for the missing count when duplicates were dropped.
+MAX_TOP_UP_ROUNDS = 2
+# Most recent vocabulary roots considered for the prompt's exclusion list,
+# and the rough token budget that list may use.
+EXCLUSION_RECENT = 500
+EXCLUSION_TOKEN_BUDGET = 300
+# Counters from the last generate_new_batch call (duplicates, wasted tokens).
+last_batch_stats = {}
+# Disjoint topics handed to shards so concurrent requests don't collide.
+SHARD_TOPICS = [
+    "home and everyday routines",
+    "food, drink and shopping",
+    "travel and transport",
+    "work, school and study",
+    "health, the body and feelings",
+    "nature, weather and seasons",
+    "hobbies, sport and culture",
+    "family, friends and social life",
+]
+
+def _exclusion_list(roots, budget=None):
+    """Return as many of roots as fit the exclusion token budget.
+
+    Uses a ~4 characters per token estimate so building the prompt never
+    needs the tokenizer.
+    """
+    budget = EXCLUSION_TOKEN_BUDGET if budget is None else budget
+    chosen = []
+    used = 0
+    for root in roots:
+        cost = len(root) // 4 + 1
+        if used + cost > budget:
+            break
+        chosen.append(root)
+        used += cost
+    return chosen
+
+# JSON schema of a word batch (structured output).
+WORDS_SCHEMA = {
+    "type": "object",
+    "properties": {
+        "german_sentences": {
+            "type": "array",
+            "items": {
+                "type": "object",
+                "properties": {
+                    "root": {
+                        "type": "string",
+                        "description": "The root form of the term or verb in German."
+                    },
+                    "english": {
+                        "type": "string",
+                        "description": "The English translation of the root term."
+                    },
+                    "examples": {
+                        "type": "object",
+                        "properties": {
+                            "present": {
+                                "type": "array",
+                                "description": "List of German sentences in the present tense.",
+                                "items": {"type": "string"}
+                            },
+                            "past": {
+                                "type": "array",
+                                "description": "List of German sentences in the past tense.",
+                                "items": {"type": "string"}
+                            },
+                            "future": {
+                                "type": "array",
+                                "description": "List of German sentences in the future tense.",
+                                "items": {"type": "string"}
+                            }
+                        },
+                        "required": ["present", "past", "future"],
+                        "additionalProperties": False
+                    }
+                },
+                "required": ["root", "english", "examples"],
+                "additionalProperties": False
+            }
+        }
+    },
+    "required": ["german_sentences"],
+    "additionalProperties": False
+}
+
+def _request_words(n_words, hint=None, exclude=()):
+    """Ask the model for n_words candidates; return (items, output tokens)."""
     prompt = (
         f"Generate {n_words} German vocabulary words with their English meanings "
         "and examples in present, past, and future tense. Respond ONLY with valid JSON, "
@@ -23,6 +188,10 @@ def generate_new_batch(n_words):
         "where 'examples' is a dict with keys 'present', 'past', and 'future' mapping to lists of German sentences. "
         "Do not include any additional text or commentary outside the JSON array."
     )
+    if exclude:
+        prompt += " The student already knows these words, do not use them: " + ", ".join(exclude) + "."
+    if hint:
+        prompt += f" Choose words related to {hint}."
     example_json = (
         "{\n"
         "  \"german_sentences\": [\n"
@@ -47,152 +216,436 @@ def generate_new_batch(n_words):
         "  ]\n"
         "}"
     )
-    response = client.responses.create(
-        model="o4-mini",
-        input=[
-            {
-                "role": "system",
-                "content": (
-                    "You are a caring, patient, and professional German language tutor teaching an A2-level student. "
-                    "Tailor examples to the A2 level, and maintain a supportive and encouraging tone."
-                ),
-            },
-            {
-                "role": "system",
-                "content": "Here are two examples of valid output following the schema:\n" + example_json,
-            },
-            {"role": "system", "content": prompt},
-        ],
-        text={
-            "format": {
-                "type": "json_schema",
-                "name": "german_sentences",
-                "strict": True,
-                "schema": {
-                    "type": "object",
-                    "properties": {
-                        "german_sentences": {
-                            "type": "array",
-                            "items": {
-                                "type": "object",
-                                "properties": {
-                                    "root": {
-                                        "type": "string",
-                                        "description": "The root form of the term or verb in German."
-                                    },
-                                    "english": {
-                                        "type": "string",
-                                        "description": "The English translation of the root term."
-                                    },
-                                    "examples": {
-                                        "type": "object",
-                                        "properties": {
-                                            "present": {
-                                                "type": "array",
-                                                "description": "List of German sentences in the present tense.",
-                                                "items": {"type": "string"}
-                                            },
-                                            "past": {
-                                                "type": "array",
-                                                "description": "List of German sentences in the past tense.",
-                                                "items": {"type": "string"}
-                                            },
-                                            "future": {
-                                                "type": "array",
-                                                "description": "List of German sentences in the future tense.",
-                                                "items": {"type": "string"}
-                                            }
-                                        },
-                                        "required": ["present", "past", "future"],
-                                        "additionalProperties": False
-                                    }
-                                },
-                                "required": ["root", "english", "examples"],
-                                "additionalProperties": False
-                            }
-                        }
-                    },
-                    "required": ["german_sentences"],
-                    "additionalProperties": False
-                }
-            }
+    messages = [
+        {
+            "role": "system",
+            "content": (
+                "You are a caring, patient, and professional German language tutor teaching an A2-level student. "
+                "Tailor examples to the A2 level, and maintain a supportive and encouraging tone."
+            ),
         },
-        reasoning={"effort": "medium"},
-        tools=[],
-        store=True,
-    )
+        {
+            "role": "system",
+            "content": "Here are two examples of valid output following the schema:\n" + example_json,
+        },
+        {"role": "system", "content": prompt},
+    ]
     try:
-        raw = json.loads(response.output_text)
-        candidates = raw["german_sentences"]
-    except Exception as e:
+        raw, output_tokens = get_provider("batch").generate_json(
+            get_model("batch"),
+            messages,
+            WORDS_SCHEMA,
+            "german_sentences",
+            hedge="generate_new_batch" if HEDGE_BATCH_REQUESTS else None,
+            reasoning={"effort": "medium"},
+        )
+        return raw["german_sentences"], output_tokens
+    except (ValueError, KeyError, TypeError) as e:
         raise RuntimeError("Failed to parse model output for new batch") from e
 
-    new_entries = []
-    for item in candidates:
-        root = item.get("root")
-        if not root or not data_manager.is_new_word(root):
+def _request_shards(n_words, shards, offset=0, exclude=()):
+    """Request n_words candidates over concurrent shards; one result per request."""
+    shards = max(1, min(shards, n_words))
+    if shards == 1:
+        return [_request_words(n_words, exclude=exclude)]
+    sizes = [n_words // shards + (1 if i < n_words % shards else 0) for i in range(shards)]
+    hints = [SHARD_TOPICS[(offset + i) % len(SHARD_TOPICS)] for i in range(shards)]
+    with ThreadPoolExecutor(max_workers=shards) as pool:
+        futures = [
+            pool.submit(_request_words, size, hint, exclude)
+            for size, hint in zip(sizes, hints)
+        ]
+        return [future.result() for future in futures]
+
+def _new_stats(n_words):
+    return {
+        "requested": n_words,
+        "requests": 0,
+        "candidates": 0,
+        "duplicates": 0,
+        "output_tokens": 0,
+        "wasted_tokens": 0,
+    }
+
+def _collect_words(n_words, shards, store, words, stats):
+    """Request words until words holds n_words roots new to store.
+
+    words (a list of {"root", "english", "examples"} dicts, possibly
+    prefilled) is extended in place; stats counters are updated.
+    """
+    recent = store.recent_roots(EXCLUSION_RECENT)
+    seen = {data_manager.normalize_root(w["root"]) for w in words}
+    for round_no in range(1 + MAX_TOP_UP_ROUNDS):
+        missing = n_words - len(words)
+        if missing <= 0:
+            break
+        # Words accepted in earlier rounds come first: they are the likeliest repeats.
+        exclude = _exclusion_list([w["root"] for w in reversed(words)] + recent)
+        results = _request_shards(missing, shards, offset=round_no * shards, exclude=exclude)
+        for items, output_tokens in results:
+            stats["requests"] += 1
+            stats["candidates"] += len(items)
+            stats["output_tokens"] += output_tokens
+            discarded = 0
+            for item in items:
+                root = item.get("root")
+                key = data_manager.normalize_root(root)
+                if not key or key in seen or store.contains(root):
+                    stats["duplicates"] += 1
+                    discarded += 1
+                    continue
+                if len(words) >= n_words:
+                    discarded += 1
+                    continue
+                seen.add(key)
+                words.append({
+                    "root": root,
+                    "english": item.get("english"),
+                    "examples": item.get("examples", {}),
+                })
+            if items:
+                stats["wasted_tokens"] += output_tokens * discarded // len(items)
+    stats["duplicate_rate"] = stats["duplicates"] / stats["candidates"] if stats["candidates"] else 0.0
+    return words
+
+def _take_staged(n_words, store, stats):
+    """Return (up to n_words staged words still new to store, staged batch).
+
+    The staged batch is left in place; _restage drops the words used once
+    they are saved.
+    """
+    staged = data_manager.load_staged_batch()
+    if not staged:
+        return [], None
+    words = []
+    seen = set()
+    for word in staged.get("words", []):
+        key = data_manager.normalize_root(word.get("root"))
+        if not key or key in seen or store.contains(word["root"]):
+            # Learned (or staged twice) since the batch was prefetched.
+            stats["duplicates"] += 1
             continue
-        entry = {
-            "root": root,
-            "english": item.get("english"),
-            "examples": item.get("examples", {}),
-            "taught_on": today,
-            "batch_id": next_id,
-            "last_reviewed": None,
-            "known": False,
-        }
-        vocab.append(entry)
-        new_entries.append(entry)
-    if new_entries:
-        data_manager.save_vocab(vocab)
-    return new_entries
-
-def prepare_quiz(n_questions):
-    """Select entries and format quiz questions with distractors."""
-    vocab = data_manager.load_vocab()
-    if not vocab or n_questions <= 0:
+        seen.add(key)
+        words.append(word)
+        if len(words) >= n_words:
+            break
+    for key, value in staged.get("stats", {}).items():
+        if key in ("requests", "candidates", "duplicates", "output_tokens", "wasted_tokens"):
+            stats[key] += value
+    stats["prefetched"] = len(words)
+    return words, staged
+
+def _restage(staged, store):
+    """Keep the staged words still new to store (those beyond the batch), or clear."""
+    left = []
+    seen = set()
+    for word in staged.get("words", []):
+        key = data_manager.normalize_root(word.get("root"))
+        if key and key not in seen and not store.contains(word["root"]):
+            seen.add(key)
+            left.append(word)
+    if left:
+        # Their request stats were counted with the batch just saved.
+        data_manager.save_staged_batch(dict(staged, words=left, stats={}))
+    else:
+        data_manager.clear_staged_batch()
+
+def _wait_for_prefetch():
+    """Let a running prefetch finish, so its words are used rather than re-requested."""
+    with _prefetch_lock:
+        thread = _prefetch_thread
+    if thread is not None and thread is not threading.current_thread():
+        thread.join()
+
+def generate_new_batch(n_words, shards=None):
+    """Generate and append a new batch of words if the interval has elapsed.
+
+    Words staged by prefetch_next_batch are used first (re-checked against
+    the current vocabulary), so a prefetched batch costs one local write; a
+    prefetch still running is waited for. Staged words are only unstaged
+    once saved, and those beyond n_words stay staged for the next batch.
+    With shards > 1 the batch is requested as concurrent smaller requests.
+    The prompt lists the most recently learned roots (within
+    EXCLUSION_TOKEN_BUDGET) so the model avoids them; remaining duplicates
+    are dropped and topped up with follow-up requests for the missing count.
+    Duplicate and wasted-token counts are left in last_batch_stats.
+    """
+    if data_manager.days_since_last_batch() < 3:
+        return []
+    shards = BATCH_SHARDS if shards is None else shards
+    store = data_manager.vocab_store()
+    stats = _new_stats(n_words)
+    _wait_for_prefetch()
+    words, staged = _take_staged(n_words, store, stats)
+    _collect_words(n_words, shards, store, words, stats)
+    next_id = store.max_batch_id() + 1
+    today = date.today().isoformat()
+    entries = [
+        data_manager.VocabEntry(word, taught_on=today, batch_id=next_id, last_reviewed=None, known=False)
+        for word in words
+    ]
+    last_batch_stats.clear()
+    last_batch_stats.update(stats)
+    added = store.add_many(entries)
+    if staged is not None:
+        _restage(staged, store)
+    return added
+
+# Start prefetching the next batch this many days before it is due.
+PREFETCH_LEAD_DAYS = 1
+_prefetch_lock = threading.Lock()
+_prefetch_thread = None
+# (vocab data_version, date) of the last due check, so reruns stay cheap.
+_prefetch_checked = None
+
+def prefetch_next_batch(n_words, shards=None):
+    """Generate the next batch now and stage it for generate_new_batch.
+
+    Does nothing (returning the staged batch) if enough words are staged.
+    """
+    staged = data_manager.load_staged_batch()
+    if staged and len(staged.get("words", [])) >= n_words:
+        return staged
+    shards = BATCH_SHARDS if shards is None else shards
+    store = data_manager.vocab_store()
+    stats = _new_stats(n_words)
+    words = _collect_words(n_words, shards, store, [], stats)
+    staged = {"created": date.today().isoformat(), "words": words, "stats": stats}
+    data_manager.save_staged_batch(staged)
+    return staged
+
+def start_prefetch(n_words, shards=None):
+    """Prefetch the next batch on a background thread when it is nearly due.
+
+    Returns the started thread, or None if nothing needs prefetching or a
+    prefetch is already running. A failed prefetch is logged and the next
+    call checks again; the button still generates the batch itself.
+    """
+    global _prefetch_thread, _prefetch_checked
+    with _prefetch_lock:
+        if _prefetch_thread is not None and _prefetch_thread.is_alive():
+            return None
+        check = (data_manager.data_version("vocab"), date.today())
+        if check == _prefetch_checked:
+            return None
+        _prefetch_checked = check
+        staged = data_manager.load_staged_batch()
+        if staged and len(staged.get("words", [])) >= n_words:
+            return None
+        if data_manager.days_since_last_batch() < 3 - PREFETCH_LEAD_DAYS:
+            return None
+
+        def run():
+            global _prefetch_checked
+            try:
+                with metrics.span("tutor.prefetch"):
+                    prefetch_next_batch(n_words, shards)
+            except Exception:
+                logger.exception("Prefetching the next word batch failed")
+                with _prefetch_lock:
+                    _prefetch_checked = None
+
+        _prefetch_thread = threading.Thread(target=run, name="batch-prefetch", daemon=True)
+        _prefetch_thread.start()
+        return _prefetch_thread
+
+# (vocabulary version, quiz_engine.QuizIndex) of the last quiz.
+_quiz_index = None
+
+def quiz_index():
+    """Return the QuizIndex of the current vocabulary, rebuilt after writes."""
+    global _quiz_index
+    import quiz_engine
+
+    version = data_manager.data_version("vocab")
+    cached = _quiz_index
+    if cached is None or cached[0] != version:
+        cached = _quiz_index = (version, quiz_engine.QuizIndex(data_manager.load_vocab()))
+    return cached[1]
+
+def prepare_quiz(n_questions, hard=None):
+    """Select entries and format quiz questions with distractors.
+
+    Questions favour due and difficult words; distractors are distinct
+    glosses, hard of them (default quiz_engine.HARD_DISTRACTORS) similar
+    to the answer.
+    """
+    if n_questions <= 0:
         return []
-    selection = random.sample(vocab, min(n_questions, len(vocab)))
-    quiz = []
-    for item in selection:
-        root = item.get("root")
-        answer = item.get("english")
-        others = [e.get("english") for e in vocab if e.get("root") != root]
-        count = min(3, len(others))
-        distractors = random.sample(others, count) if count > 0 else []
-        quiz.append({
-            "root": root,
-            "expected_answer": answer,
-            "distractors": distractors,
-        })
-    return quiz
+    return quiz_index().quiz(n_questions, hard=hard)
 
 def write_memory(entry_dict):
     """Delegate memory checkpoint entries to the data manager."""
     key = date.today().isoformat()
     data_manager.append_memory(key, entry_dict)
 
-def chat_session_interact(session_id, user_message):
-    """Manage a multi-turn chat session using GPT-4.1, persisting history."""
-    history = data_manager.load_session(session_id)
-    trimmed = data_manager.trim_messages(history)
-    data_manager.append_message(session_id, "user", user_message)
-    system_message = {
-        "role": "system",
-        "content": (
-            "You are a caring, patient, and professional German language tutor teaching an A2-level student. "
-            "Tailor your responses and examples to the A2 level. "
-            "Always write the main sentences and vocabulary in German, but provide explanations of grammar, vocabulary, and concepts in English, "
-            "unless the student explicitly requests explanations in German. "
-            "Maintain a supportive and encouraging tone."
-        ),
-    }
-    chat_history = [{"role": msg["role"], "content": msg["text"]} for msg in trimmed]
-    context = [system_message] + chat_history + [{"role": "user", "content": user_message}]
-    response = client.responses.create(
-        model="gpt-4.1",
-        input=context,
+CHAT_SYSTEM_PROMPT = (
+    "You are a caring, patient, and professional German language tutor teaching an A2-level student. "
+    "Tailor your responses and examples to the A2 level. "
+    "Always write the main sentences and vocabulary in German, but provide explanations of grammar, vocabulary, and concepts in English, "
+    "unless the student explicitly requests explanations in German. "
+    "Maintain a supportive and encouraging tone."
+)
+
+# Chain chat turns through the Responses API's stored responses so each
+# request carries only the new message instead of the whole history.
+CHAIN_RESPONSES = True
+
+# With COMPACTION on, once the turns not yet summarized exceed
+# COMPACT_BUDGET_TOKENS the older ones are folded into the session's stored
+# summary (by the "summary" model), keeping about COMPACT_KEEP_TOKENS verbatim.
+COMPACTION = False
+COMPACT_BUDGET_TOKENS = 8000
+COMPACT_KEEP_TOKENS = 2000
+SUMMARY_PROMPT = (
+    "You maintain a running summary of a German tutoring chat. Update the summary "
+    "with the new turns below. Keep what the student practised, their recurring "
+    "mistakes, vocabulary introduced, preferences and any open questions. "
+    "Reply with the updated summary only, in English, at most 300 words."
+)
+
+def _message_key(message):
+    text = f"{message.get('role')}\0{message.get('text', '')}"
+    return hashlib.sha1(text.encode("utf-8")).hexdigest()
+
+def _summary_boundary(history, summary):
+    """Index of the first message in history not covered by summary."""
+    if not summary:
+        return 0
+    covered, through = summary.get("covered", 0), summary.get("through")
+    if 0 < covered <= len(history) and _message_key(history[covered - 1]) == through:
+        return covered
+    # Older messages were trimmed since; the earliest match errs towards
+    # repeating a summarized turn rather than losing an unsummarized one.
+    for index, message in enumerate(history):
+        if _message_key(message) == through:
+            return index + 1
+    return 0
+
+def _summarize(previous, messages):
+    """Return previous (summary text or None) updated with messages."""
+    transcript = "\n".join(f"{m['role']}: {m.get('text', '')}" for m in messages)
+    content = f"Current summary:\n{previous or '(none yet)'}\n\nNew turns:\n{transcript}"
+    response = get_provider("summary").respond(
+        get_model("summary"),
+        [
+            {"role": "system", "content": SUMMARY_PROMPT},
+            {"role": "user", "content": content},
+        ],
+        store=False,
     )
+    return response.output_text.strip()
+
+def _compact(session_id, history=None):
+    """Fold old turns into the session summary when over budget.
+
+    Returns (summary text or None, unsummarized messages, whether it folded).
+    Only turns after the stored summary are sent to the summarizer.
+    """
+    if history is None:
+        history = data_manager.trim_messages(data_manager.load_session(session_id))
+    summary = data_manager.get_summary(session_id)
+    start = _summary_boundary(history, summary)
+    text = summary.get("text") if summary else None
+    live = history[start:]
+    if sum(data_manager.message_tokens(m) for m in live) <= COMPACT_BUDGET_TOKENS:
+        return text, live, False
+    keep = 0
+    kept_tokens = 0
+    for message in reversed(live):
+        kept_tokens += data_manager.message_tokens(message)
+        if keep and kept_tokens > COMPACT_KEEP_TOKENS:
+            break
+        keep += 1
+    folded = live[:len(live) - keep]
+    if not folded:
+        return text, live, False
+    text = _summarize(text, folded)
+    data_manager.set_summary(session_id, {
+        "text": text,
+        "covered": start + len(folded),
+        "through": _message_key(folded[-1]),
+        "messages": (summary.get("messages", 0) if summary else 0) + len(folded),
+    })
+    return text, live[len(folded):], True
+
+def _replay_context(session_id):
+    """Return the model input: system prompt, summary (if any) and history."""
+    history = data_manager.trim_messages(data_manager.load_session(session_id))
+    summary = None
+    if COMPACTION:
+        summary, history, _ = _compact(session_id, history)
+    context = [{"role": "system", "content": CHAT_SYSTEM_PROMPT}]
+    if summary:
+        context.append({"role": "system", "content": "Summary of the earlier conversation:\n" + summary})
+    context.extend({"role": msg["role"], "content": msg["text"]} for msg in history)
+    return context
+
+def _chaining():
+    """Whether chat turns chain on the provider's stored responses."""
+    return CHAIN_RESPONSES and get_provider("chat").supports_chaining
+
+def _create_chat_response(session_id, user_message, **kwargs):
+    """Persist the user's message and send the turn to the model.
+
+    Chains on the session's last stored response when possible and replays
+    the stored history when there is no chain or the server lost it (or,
+    with COMPACTION, when old turns were just folded into the summary).
+    """
+    provider = get_provider("chat")
+    previous_id = data_manager.get_response_id(session_id) if _chaining() else None
+    data_manager.append_message(session_id, "user", user_message)
+    if previous_id and COMPACTION and _compact(session_id)[2]:
+        # The server-side chain still holds the turns just folded away.
+        data_manager.set_response_id(session_id, None)
+        previous_id = None
+    if previous_id:
+        import openai
+
+        try:
+            return provider.respond(
+                get_model("chat"),
+                [{"role": "user", "content": user_message}],
+                previous_response_id=previous_id,
+                **kwargs,
+            )
+        except (openai.NotFoundError, openai.BadRequestError):
+            # The stored response expired or was deleted.
+            data_manager.set_response_id(session_id, None)
+    return provider.respond(get_model("chat"), _replay_context(session_id), **kwargs)
+
+def chat_session_interact(session_id, user_message):
+    """Manage a multi-turn chat session with the chat model, persisting history."""
+    response = _create_chat_response(session_id, user_message)
     reply = response.output_text
     data_manager.append_message(session_id, "assistant", reply)
-    return reply
\ No newline at end of file
+    if _chaining():
+        data_manager.set_response_id(session_id, getattr(response, "id", None))
+    return reply
+
+def chat_session_stream(session_id, user_message):
+    """Like chat_session_interact, but yield the reply as text deltas.
+
+    The reply received so far is persisted once the stream finishes, fails,
+    or the consumer closes the generator early.
+    """
+    stream = _create_chat_response(session_id, user_message, stream=True)
+    parts = []
+    response_id = None
+    try:
+        for event in stream:
+            if event.type == "response.output_text.delta":
+                parts.append(event.delta)
+                yield event.delta
+            elif event.type == "response.completed":
+                response_id = event.response.id
+    finally:
+        close = getattr(stream, "close", None)
+        if close is not None:
+            close()
+        reply = "".join(parts)
+        if reply:
+            data_manager.append_message(session_id, "assistant", reply)
+        if _chaining():
+            # An unfinished reply breaks the chain; the next turn replays.
+            data_manager.set_response_id(session_id, response_id)
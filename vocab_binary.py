@@ -0,0 +1,632 @@
+"""Binary vocabulary format: fixed-width scalar columns plus a text blob.
+
+After a 24-byte header, vocab.bin holds one fixed-width column per scalar
+field (dates as day ordinals, batch_id, the SM-2 schedule, known), a u64
+offset per entry into the blob, and the blob itself: per entry four
+length-prefixed UTF-8 fields (root, english, extra JSON, examples JSON).
+The file is read through mmap, so
+
+* scalar-only queries (latest taught_on, due counts, max batch_id) read
+  their columns and never touch the text;
+* entry i is read in O(1) via offsets[i], and its examples are only
+  decoded when accessed (VocabEntry's lazy loader);
+* a review overwrites the entry's scalar columns in place, on the
+  group-commit writer, and bumps the header's generation counter so other
+  processes mapping the file notice the change even if its mtime does not.
+
+Columns and blob are sections of one file so a save stays a single atomic
+rename; appending copies the existing sections instead of re-encoding
+them. Values a column cannot represent (a malformed date, say) are kept
+verbatim in the entry's extra JSON, so the round trip through JSON is
+exact. The file is written in native byte order.
+
+Selected with data_manager.STORAGE_BACKEND = "binary" (vocabulary only;
+chats and memory stay in the JSON files). ``python vocab_binary.py import``
+converts vocab.json, ``python vocab_binary.py export`` writes it back.
+"""
+
+import argparse
+import functools
+import json
+import math
+import mmap
+import os
+import struct
+import sys
+import threading
+import time
+import weakref
+from array import array
+from bisect import bisect_left, bisect_right, insort
+from datetime import date
+from pathlib import Path
+
+import data_manager
+
+MAGIC = b"GTVB"
+VERSION = 2
+# magic, version, byte order (0 little, 1 big), entry count, generation
+HEADER = struct.Struct("=4sHBxQQ")
+# Version 1 files lack the generation; they are read as is and rewritten
+# in the current version on their first review.
+HEADER_V1 = struct.Struct("=4sHBxQ")
+GENERATION = struct.Struct("=Q")
+COLUMNS = (
+    ("taught_on", "i"),
+    ("due", "i"),
+    ("last_reviewed", "i"),
+    ("batch_id", "i"),
+    ("interval", "i"),
+    ("reps", "i"),
+    ("ease", "d"),
+    ("known", "B"),
+    ("flags", "B"),
+)
+# Column sentinels: NULL is a stored None, ABSENT a field the entry lacks.
+DATE_NULL, DATE_ABSENT = 0, -1
+INT_NULL, INT_ABSENT = -2**31, -2**31 + 1
+KNOWN_NULL, KNOWN_ABSENT = 2, 3
+# flags bit: the entry has extra JSON (unknown keys or values no column holds).
+HAS_EXTRA = 1
+LENGTH = struct.Struct("=I")
+NULL_LENGTH = 0xFFFFFFFF
+
+_ABSENT = object()
+_BYTEORDER = 0 if sys.byteorder == "little" else 1
+# ISO date string <-> day ordinal, shared by every file.
+_ordinals = {}
+_isodates = {}
+
+
+def _layout(count, header_size=HEADER.size):
+    """Return ({section: (start, size)}, blob start) for count entries."""
+    sections = {}
+    pos = header_size
+    for name, code in COLUMNS + (("offsets", "Q"),):
+        size = (count + (name == "offsets")) * array(code).itemsize
+        sections[name] = (pos, size)
+        pos += size + (-size % 8)
+    return sections, pos
+
+
+def _encode_date(value):
+    if value is _ABSENT:
+        return DATE_ABSENT
+    if value is None:
+        return DATE_NULL
+    ordinal = _ordinals.get(value) if type(value) is str else None
+    if ordinal is None and type(value) is str:
+        try:
+            day = date.fromisoformat(value)
+        except ValueError:
+            return None
+        if day.isoformat() != value:
+            return None
+        ordinal = _ordinals[value] = day.toordinal()
+    return ordinal
+
+
+def _decode_date(ordinal):
+    if ordinal == DATE_ABSENT:
+        return _ABSENT
+    if ordinal == DATE_NULL:
+        return None
+    value = _isodates.get(ordinal)
+    if value is None:
+        value = _isodates[ordinal] = sys.intern(date.fromordinal(ordinal).isoformat())
+    return value
+
+
+def _encode_int(value):
+    if value is _ABSENT:
+        return INT_ABSENT
+    if value is None:
+        return INT_NULL
+    if type(value) is int and INT_ABSENT < value < 2**31:
+        return value
+    return None
+
+
+def _decode_int(value):
+    if value == INT_ABSENT:
+        return _ABSENT
+    return None if value == INT_NULL else value
+
+
+def _encode_ease(value):
+    if value is _ABSENT:
+        return math.nan
+    if type(value) is float and not math.isnan(value):
+        return value
+    return None
+
+
+def _decode_ease(value):
+    return _ABSENT if math.isnan(value) else value
+
+
+def _encode_known(value):
+    if value is _ABSENT:
+        return KNOWN_ABSENT
+    if value is None:
+        return KNOWN_NULL
+    if type(value) is bool:
+        return int(value)
+    return None
+
+
+def _decode_known(value):
+    if value == KNOWN_ABSENT:
+        return _ABSENT
+    return None if value == KNOWN_NULL else bool(value)
+
+
+# field -> (encoder, decoder, value stored when the field lives in extra)
+_CODECS = {
+    "taught_on": (_encode_date, _decode_date, DATE_ABSENT),
+    "due": (_encode_date, _decode_date, DATE_ABSENT),
+    "last_reviewed": (_encode_date, _decode_date, DATE_ABSENT),
+    "batch_id": (_encode_int, _decode_int, INT_ABSENT),
+    "interval": (_encode_int, _decode_int, INT_ABSENT),
+    "reps": (_encode_int, _decode_int, INT_ABSENT),
+    "ease": (_encode_ease, _decode_ease, math.nan),
+    "known": (_encode_known, _decode_known, KNOWN_ABSENT),
+}
+_SCALARS = tuple(_CODECS)
+_COLUMN_FIELDS = frozenset(_SCALARS) | {"root", "english", "examples"}
+
+
+def _encode_scalars(entry):
+    """Return (column values without flags, {field: value} no column can hold)."""
+    values = []
+    overrides = {}
+    for field in _SCALARS:
+        encode, _, fallback = _CODECS[field]
+        value = entry.get(field, _ABSENT)
+        encoded = encode(value)
+        if encoded is None:
+            overrides[field] = value
+            encoded = fallback
+        values.append(encoded)
+    return values, overrides
+
+
+def _text(value):
+    if value is None:
+        return LENGTH.pack(NULL_LENGTH)
+    raw = value.encode("utf-8")
+    return LENGTH.pack(len(raw)) + raw
+
+
+def _encode_entry(entry):
+    """Return (column values including flags, blob record) for entry."""
+    values, extra = _encode_scalars(entry)
+    texts = []
+    for field in ("root", "english"):
+        value = entry.get(field)
+        if value is not None and type(value) is not str:
+            extra[field] = value
+            value = None
+        texts.append(value)
+    examples = entry.get("examples", _ABSENT)
+    for key in entry:
+        if key not in _COLUMN_FIELDS:
+            extra[key] = entry[key]
+    texts.append(json.dumps(extra, ensure_ascii=False) if extra else None)
+    texts.append(None if examples is _ABSENT else json.dumps(examples, ensure_ascii=False))
+    values.append(HAS_EXTRA if extra else 0)
+    return values, b"".join(_text(t) for t in texts)
+
+
+def _encode(entries, blob_base=0):
+    """Encode entries into ({column: array}, offsets array, blob bytes)."""
+    columns = {name: array(code) for name, code in COLUMNS}
+    appenders = [columns[name].append for name, _ in COLUMNS]
+    offsets = array("Q")
+    records = []
+    end = blob_base
+    for entry in entries:
+        values, record = _encode_entry(entry)
+        for append, value in zip(appenders, values):
+            append(value)
+        offsets.append(end)
+        records.append(record)
+        end += len(record)
+    offsets.append(end)
+    return columns, offsets, b"".join(records)
+
+
+def _pack(count, columns, offsets, blob, generation=0):
+    """Assemble the file from per-column bytes, offsets bytes and the blob."""
+    parts = [HEADER.pack(MAGIC, VERSION, _BYTEORDER, count, generation)]
+    for name, _ in COLUMNS + (("offsets", "Q"),):
+        data = offsets if name == "offsets" else columns[name]
+        parts.append(data)
+        parts.append(b"\0" * (-len(data) % 8))
+    parts.append(blob)
+    return b"".join(parts)
+
+
+def _write(path, payload):
+    data_manager._writer.call(path, lambda: data_manager._atomic_write(path, payload)).result()
+    data_manager.bump_version("vocab")
+
+
+def _touch(path):
+    """Advance path's mtime past its current value (mmap writes may not)."""
+    st = path.stat()
+    mtime = max(time.time_ns(), st.st_mtime_ns + 1)
+    os.utime(path, ns=(st.st_atime_ns, mtime))
+
+
+def write_vocab(path, entries, generation=0):
+    """Replace the vocab file at path with entries."""
+    entries = list(entries)
+    columns, offsets, blob = _encode(entries)
+    payload = _pack(len(entries), {k: v.tobytes() for k, v in columns.items()}, offsets.tobytes(), blob, generation)
+    _write(path, payload)
+
+
+def _signature(path):
+    """(inode, mtime_ns, size) of path, or None; the inode catches a replaced file."""
+    try:
+        st = path.stat()
+    except FileNotFoundError:
+        return None
+    return st.st_ino, st.st_mtime_ns, st.st_size
+
+
+def _unmap(mm, view, columns):
+    for column in columns:
+        column.release()
+    view.release()
+    mm.close()
+
+
+class VocabFile:
+    """A vocab file mapped into memory: column views and O(1) entry reads."""
+
+    def __init__(self, path):
+        self.path = Path(path)
+        with open(self.path, "r+b") as fh:
+            self._mm = mmap.mmap(fh.fileno(), 0)
+        magic, version, byteorder, count = HEADER_V1.unpack_from(self._mm)
+        if magic != MAGIC or version not in (1, VERSION):
+            self._mm.close()
+            raise ValueError(f"{self.path} is not a version {VERSION} vocab file")
+        if byteorder != _BYTEORDER:
+            self._mm.close()
+            raise ValueError(f"{self.path} was written with the other byte order; re-import it from JSON")
+        self.count = count
+        self.version = version
+        self._sections, self._blob = _layout(count, HEADER.size if version == VERSION else HEADER_V1.size)
+        view = memoryview(self._mm)
+        self.columns = {}
+        for name, code in COLUMNS + (("offsets", "Q"),):
+            start, size = self._sections[name]
+            self.columns[name] = view[start:start + size].cast(code)
+        # Unmap once nothing refers to this file any more: entries handed out
+        # keep it alive through their lazy example loaders.
+        weakref.finalize(self, _unmap, self._mm, view, list(self.columns.values()))
+        self._offsets = self.columns.pop("offsets")
+
+    def generation(self):
+        """Counter bumped by every in-place update (0 for version 1 files)."""
+        if self.version != VERSION:
+            return 0
+        return GENERATION.unpack_from(self._mm, HEADER_V1.size)[0]
+
+    def __len__(self):
+        return self.count
+
+    def _texts(self, at, n):
+        """Read n length-prefixed fields from blob position at; return (texts, next position)."""
+        texts = []
+        for _ in range(n):
+            (length,) = LENGTH.unpack_from(self._mm, at)
+            at += LENGTH.size
+            if length == NULL_LENGTH:
+                texts.append(None)
+            else:
+                texts.append(self._mm[at:at + length].decode("utf-8"))
+                at += length
+        return texts, at
+
+    def root(self, pos):
+        """Root of entry pos (reads only that field of the blob)."""
+        return self._texts(self._blob + self._offsets[pos], 1)[0][0]
+
+    def _json_at(self, at):
+        return json.loads(self._texts(at, 1)[0][0])
+
+    def entry(self, pos):
+        """Entry pos as a VocabEntry whose examples load on first access."""
+        return self._entry(pos, [_CODECS[f][1](self.columns[f][pos]) for f in _SCALARS])
+
+    def entries(self):
+        """All entries, decoding each scalar column in one pass."""
+        columns = [list(map(_CODECS[f][1], self.columns[f])) for f in _SCALARS]
+        return [self._entry(pos, row) for pos, row in enumerate(zip(*columns))]
+
+    def _entry(self, pos, scalars):
+        data = {f: v for f, v in zip(_SCALARS, scalars) if v is not _ABSENT}
+        (root, english, extra), at = self._texts(self._blob + self._offsets[pos], 3)
+        data["root"] = root
+        data["english"] = english
+        if LENGTH.unpack_from(self._mm, at)[0] != NULL_LENGTH:
+            data["examples"] = functools.partial(self._json_at, at)
+        if extra is not None:
+            data.update(json.loads(extra))
+        return data_manager.VocabEntry.from_dict(data)
+
+    def due_ordinal(self, pos):
+        """Day ordinal entry pos is next due (0: due now), as _due_key orders it."""
+        if self.columns["flags"][pos] & HAS_EXTRA:
+            key = data_manager._due_key(self.entry(pos))
+            return (_encode_date(key) or 0) if key else 0
+        for field in ("due", "taught_on"):
+            ordinal = self.columns[field][pos]
+            if ordinal > 0:
+                return ordinal
+        return 0
+
+    def update(self, pos, entry):
+        """Overwrite entry pos's scalar columns in place; False if it needs a rewrite.
+
+        Runs on the group-commit writer, so it cannot interleave with a
+        rewrite of the same file, and bumps the generation and the mtime.
+        """
+        if self.version != VERSION or self.columns["flags"][pos] & HAS_EXTRA:
+            return False
+        values, overrides = _encode_scalars(entry)
+        if overrides:
+            return False
+
+        def write():
+            for field, value in zip(_SCALARS, values):
+                self.columns[field][pos] = value
+            GENERATION.pack_into(self._mm, HEADER_V1.size, self.generation() + 1)
+            if data_manager.WRITE_FSYNC == "always":
+                self._mm.flush()
+            _touch(self.path)
+
+        data_manager._writer.call(self.path, write).result()
+        return True
+
+    def append(self, entries):
+        """Return the bytes of this file with entries appended."""
+        columns, offsets, blob = _encode(entries, blob_base=self._offsets[self.count])
+        count = self.count + len(entries)
+        merged = {}
+        for name, _ in COLUMNS:
+            start, size = self._sections[name]
+            merged[name] = self._mm[start:start + size] + columns[name].tobytes()
+        start, size = self._sections["offsets"]
+        old_offsets = self._mm[start:start + size - offsets.itemsize]
+        return _pack(count, merged, old_offsets + offsets.tobytes(), self._mm[self._blob:] + blob,
+                     self.generation() + 1)
+
+
+class BinaryVocabStore:
+    """VocabStore counterpart over a vocab.bin file.
+
+    Only the roots are read to build the lookup index and only the due
+    and taught_on columns for the review queue; entries are materialized
+    on demand. Reviews are written in place immediately, so pending() is
+    always 0 and flush() is a no-op.
+    """
+
+    def __init__(self, path):
+        self.path = Path(path)
+        self._lock = threading.RLock()
+        self.invalidate()
+
+    def invalidate(self):
+        """Force the next access to re-open the file.
+
+        The current map is dropped, not closed: entries handed out may still
+        load examples from it, and it is unmapped once they are gone.
+        """
+        self._loaded = False
+        self._file = None
+        self._signature = None
+        self._generation = None
+        self._entries = None
+        self._index = None
+        self._due = None
+
+    def _refresh(self):
+        sig = _signature(self.path)
+        if self._loaded and sig == self._signature and (
+            self._file is None or self._file.generation() == self._generation
+        ):
+            return
+        self.invalidate()
+        self._file = VocabFile(self.path) if sig is not None else None
+        self._signature = sig
+        self._generation = self._file.generation() if self._file is not None else None
+        self._loaded = True
+
+    def _count(self):
+        return 0 if self._file is None else self._file.count
+
+    def _entry(self, pos):
+        if self._entries is not None:
+            return self._entries[pos]
+        return self._file.entry(pos)
+
+    def _positions(self):
+        if self._index is None:
+            self._index = {}
+            for pos in range(self._count()):
+                self._index.setdefault(data_manager.normalize_root(self._file.root(pos)), pos)
+        return self._index
+
+    def _due_queue(self):
+        if self._due is None:
+            self._due = sorted((self._file.due_ordinal(pos), pos) for pos in range(self._count()))
+        return self._due
+
+    @data_manager._locked
+    def load(self):
+        """Return a fresh list of all entries (examples are loaded lazily)."""
+        self._refresh()
+        return [] if self._file is None else self._file.entries()
+
+    @data_manager._locked
+    def save(self, entries):
+        write_vocab(self.path, entries, self._generation + 1 if self._generation is not None else 0)
+        self.invalidate()
+
+    @data_manager._locked
+    def entries(self):
+        """Return the cached entry list (do not mutate without saving)."""
+        self._refresh()
+        if self._entries is None:
+            self._entries = self._file.entries() if self._file is not None else []
+        return self._entries
+
+    @data_manager._locked
+    def contains(self, root):
+        self._refresh()
+        return data_manager.normalize_root(root) in self._positions()
+
+    @data_manager._locked
+    def get(self, root):
+        self._refresh()
+        pos = self._positions().get(data_manager.normalize_root(root))
+        return None if pos is None else self._entry(pos)
+
+    @data_manager._locked
+    def add_many(self, entries):
+        """Append entries whose roots are new in one write; return them."""
+        self._refresh()
+        index = self._positions()
+        added = []
+        seen = set()
+        for entry in entries:
+            key = data_manager.normalize_root(entry.get("root"))
+            if not key or key in index or key in seen:
+                continue
+            seen.add(key)
+            if not isinstance(entry, data_manager.VocabEntry):
+                entry = data_manager.VocabEntry(entry)
+            added.append(entry)
+        if added:
+            if self._file is None:
+                write_vocab(self.path, added)
+            else:
+                _write(self.path, self._file.append(added))
+            self.invalidate()
+        return added
+
+    @data_manager._locked
+    def due_count(self, today=None):
+        self._refresh()
+        today = (today or date.today()).toordinal()
+        return bisect_right(self._due_queue(), (today, math.inf))
+
+    @data_manager._locked
+    def due_cards(self, n, today=None, offset=0):
+        end = min(offset + n, self.due_count(today))
+        return [self._entry(pos) for _, pos in self._due[offset:end]]
+
+    @data_manager._locked
+    def review(self, root, quality, today=None, defer=False):
+        """Apply an SM-2 review to root, writing its columns in place; return the entry."""
+        self._refresh()
+        pos = self._positions().get(data_manager.normalize_root(root))
+        if pos is None:
+            raise KeyError(root)
+        entry = self._entry(pos)
+        old_key = (self._file.due_ordinal(pos), pos)
+        data_manager.review_entry(entry, quality, today)
+        if not self._file.update(pos, entry):
+            entries = list(self.entries())
+            entries[pos] = entry
+            self.save(entries)
+            return entry
+        self._signature = _signature(self.path)
+        self._generation = self._file.generation()
+        if self._due is not None:
+            del self._due[bisect_left(self._due, old_key)]
+            insort(self._due, (self._file.due_ordinal(pos), pos))
+        data_manager.bump_version("vocab")
+        return entry
+
+    def pending(self):
+        return 0
+
+    def flush(self):
+        return 0
+
+    @data_manager._locked
+    def max_batch_id(self):
+        self._refresh()
+        return max(0, max(self._file.columns["batch_id"], default=0)) if self._file else 0
+
+    @data_manager._locked
+    def recent_roots(self, n):
+        self._refresh()
+        count = self._count()
+        roots = (self._file.root(pos) for pos in range(count - 1, max(count - n, 0) - 1, -1))
+        return [root for root in roots if root]
+
+    @data_manager._locked
+    def latest_taught_on(self):
+        """Most recent taught_on date, from the taught_on column alone."""
+        self._refresh()
+        latest = max(self._file.columns["taught_on"], default=0) if self._file else 0
+        return date.fromordinal(latest) if latest > 0 else None
+
+
+class BinaryBackend(data_manager.JsonBackend):
+    """JSON backend whose vocabulary lives in a binary vocab file."""
+
+    def __init__(self, path):
+        self.path = Path(path)
+        self._store = BinaryVocabStore(self.path)
+
+    def load_vocab(self):
+        return self._store.load()
+
+    def save_vocab(self, vocab_list):
+        self._store.save(vocab_list)
+
+    def vocab_store(self):
+        return self._store
+
+    def latest_taught_on(self):
+        return self._store.latest_taught_on()
+
+
+def import_json(json_path=None, path=None):
+    """Convert a vocab.json file into the binary format; return the entry count."""
+    entries = data_manager._read_vocab_file(Path(json_path or data_manager.VOCAB_FILE))
+    target = Path(path or data_manager.VOCAB_BINARY_FILE)
+    write_vocab(target, entries)
+    return len(entries)
+
+
+def export_json(json_path=None, path=None):
+    """Write a binary vocab file back out as vocab.json; return the entry count."""
+    source = Path(path or data_manager.VOCAB_BINARY_FILE)
+    entries = VocabFile(source).entries() if source.exists() else []
+    data_manager._replace_json(Path(json_path or data_manager.VOCAB_FILE), entries)
+    data_manager.bump_version("vocab")
+    return len(entries)
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("command", choices=["import", "export"])
+    parser.add_argument("--json", help="JSON file (default: data_manager.VOCAB_FILE)")
+    parser.add_argument("--bin", help="binary file (default: data_manager.VOCAB_BINARY_FILE)")
+    args = parser.parse_args(argv)
+    convert = import_json if args.command == "import" else export_json
+    print(json.dumps({"vocab": convert(args.json, args.bin)}))
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())